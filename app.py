@@ -2,12 +2,126 @@
 Backend
 """
 
-from flask import Flask, render_template, send_from_directory, request
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
 
-app = Flask(__name__)
+import matplotlib
+import matplotlib.pyplot as plt
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    send_from_directory,
+    stream_with_context,
+)
+from markupsafe import escape
 
+from utils.config import find_client, load_clients
+from utils.utils_anomaly import AnomalyDetector
+from utils.utils_api import metric_response, panel_response
+from utils.utils_artifacts import ArtifactStore
+from utils.utils_cloudflare import get_session
+from utils.utils_compare import compare_response
+from utils.utils_credentials import get_credentials
+from utils.utils_export import EXPORT_FORMATS, export_rows, export_zones, stream_export
+from utils.utils_fetcher import get_fetch_scheduler
+from utils.utils_image import format_stat, load_world
+from utils.utils_jobs import JobQueue, QueueFull
+from utils.utils_pdf import BASE_FOLDER, PARENT_LOGO, get_layout, load_image
+from utils.utils_prefetch import Prefetcher
+from utils.utils_report import report_artifact
+from utils.utils_scheduler import Scheduler
+from utils.utils_store import MetricStore
 
-@app.route("/")
+MAX_PERIODS = 366  # days a request can span
+MAX_LIMIT = 1000  # points or categories of an API payload
+
+# Routes, registered on the app built by create_app
+bp = Blueprint("report", __name__)
+
+
+def _resource(name: str):
+    """
+    Shared resource of the current app built by create_app: "artifacts",
+    "metric_store", "detector", "jobs", "prefetcher" or "scheduler".
+    """
+    return current_app.extensions["cloudflare_report"][name]
+
+
+def preload() -> None:
+    """
+    Loads the heavy shared resources once: the Agg backend and its fonts, the
+    world geometry, the logos and the Cloudflare HTTP session. Called before
+    the WSGI server forks, the workers share them copy-on-write.
+    """
+    matplotlib.use("Agg")
+    fig = plt.figure()
+    fig.text(0.1, 0.5, "Requests 0123456789", fontweight="bold")
+    fig.text(0.1, 0.2, "Requests 0123456789")
+    fig.canvas.draw()
+    plt.close(fig)
+    load_world()
+    for client in load_clients():
+        logos = get_layout(client["name"]).get("logos", {})
+        if "parent" in logos:
+            load_image(PARENT_LOGO, logos["parent"]["w"])
+        if "client" in logos:
+            path = os.path.join(BASE_FOLDER, f"logo_{client['name']}.png")
+            load_image(path, logos["client"]["w"])
+    get_session()
+
+
+def create_app(start_scheduler: Optional[bool] = None, preload_resources: bool = True) -> Flask:
+    """
+    Application factory for WSGI servers, e.g. gunicorn "app:create_app()".
+    The stores, job queue, prefetcher and scheduler are built here, so
+    importing the module opens no database and starts no thread.
+    Args:
+        start_scheduler (bool): Start the scheduler thread in this process,
+            defaults to SCHEDULER_ENABLED. Pass False when a master process
+            preloads the app and forks (see gunicorn.conf.py).
+        preload_resources (bool): Load the shared resources now (see preload).
+    Returns:
+        Flask: The app with its resources loaded.
+    """
+    app = Flask(__name__)
+    app.jinja_env.filters["stat"] = format_stat
+
+    # Generated reports are kept on disk unless REPORT_WRITE_THROUGH=0
+    artifacts = ArtifactStore() if os.getenv("REPORT_WRITE_THROUGH", "1") == "1" else None
+    metric_store = MetricStore()
+    detector = AnomalyDetector(metric_store.db_path)
+
+    def log_report(client: dict, leq_date: str, periods: int) -> None:
+        metric_store.record_report(client["name"], leq_date, periods, mode="manual")
+
+    app.extensions["cloudflare_report"] = {
+        "artifacts": artifacts,
+        "metric_store": metric_store,
+        "detector": detector,
+        "jobs": JobQueue(artifacts, on_done=log_report),
+        # Caches of the report selected in reporte.html, warmed before it is requested
+        "prefetcher": Prefetcher(artifacts=artifacts),
+        # Daily snapshots and automatic reports, every app process can run it safely
+        "scheduler": Scheduler(metric_store, artifacts, detector),
+    }
+    app.register_blueprint(bp)
+
+    if preload_resources:
+        preload()
+    if start_scheduler is None:
+        start_scheduler = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+    if start_scheduler:
+        app.extensions["cloudflare_report"]["scheduler"].start()
+    return app
+
+
+@bp.route("/")
 def homeTEST():
     """
     Home route
@@ -15,48 +129,311 @@ def homeTEST():
     return render_template("base.html")
 
 
-@app.route("/admin")
+@bp.route("/admin")
 def admin():
     """
     Admin route
+    Totals come precomputed from the metric store, ?client=<name> filters them.
     """
-    return render_template("admin.html")
+    client = request.args.get("client") or None
+    return render_template(
+        "admin.html",
+        clients=load_clients(),
+        client=client,
+        totals=_resource("metric_store").totals(client),
+        reports=_resource("metric_store").recent_reports(client),
+        alerts=_resource("detector").recent(client),
+    )
 
 
-@app.route("/reporte")
+@bp.route("/reporte")
 def reporte():
     """
     Reporte route
     """
     return render_template("reporte.html")
 
-@app.route("/get_report")
+@bp.route("/get_report")
 def get_reporte():
     """
     Crear un reporte
+    Queues the report job and answers with a fragment that polls its status.
+    Query args: client (name or zone tag), period (days), date (YYYY-MM-DD).
     """
     client = request.args.get("client")
-    period = request.args.get("period")
-    
-    if not client or not period:
+    if not client or not request.args.get("period"):
         return "<p style='color: red;'>Error: Cliente y período requeridos</p>", 400
-    return "<p style='color: green;'>Reporte generado.</p>", 200
+    try:
+        period = _int_arg("period", None, MAX_PERIODS)
+        leq_date = _report_date()
+    except ValueError as e:
+        return f"<p style='color: red;'>Error: {escape(str(e))}</p>", 400
+    client = find_client(client)
+    if client is None:
+        return "<p style='color: red;'>Error: Cliente no encontrado</p>", 404
+    try:
+        job_id = _resource("jobs").submit(client, leq_date, period)
+    except QueueFull:
+        return "<p style='color: red;'>Error: Demasiados reportes en proceso, intenta más tarde</p>", 503
+    return render_template("job_status.html", job=_resource("jobs").get(job_id)), 202
+
+
+@bp.route("/prefetch", methods=["POST"])
+def prefetch():
+    """
+    Starts fetching the data and rendering the charts of the report selected
+    in reporte.html, so "Generar Reporte" finds them cached. A new selection
+    from the same page cancels the previous one.
+    Query args: slot (page id), client (name or zone tag), period (days,
+    defaults to the client plan) and date (YYYY-MM-DD).
+    """
+    slot = request.args.get("slot")
+    client = request.args.get("client")
+    if not slot or not client:
+        return jsonify(error="slot and client required"), 400
+    client = find_client(client)
+    if client is None:
+        return jsonify(error="Unknown client"), 404
+    try:
+        leq_date = _report_date()
+        period = _int_arg("period", client.get("plan", 7), MAX_PERIODS)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(status=_resource("prefetcher").start(slot, client, leq_date, period)), 202
+
+
+@bp.route("/jobs/<job_id>")
+def job_status(job_id: str):
+    """
+    Status fragment of a report job, polled by htmx until it finishes.
+    """
+    job = _resource("jobs").get(job_id)
+    if job is None:
+        return "<p style='color: red;'>Error: Reporte no encontrado</p>", 404
+    return render_template("job_status.html", job=job)
 
 
-@app.route("/user")
+@bp.route("/user")
 def user():
     """
     User route
     """
-    return render_template("user.html")
+    zone_tag = request.args.get("zone")
+    return render_template("user.html", zone_tag=zone_tag)
 
 
-@app.route("/download/report")
+@bp.route("/download/report")
 def download_report():
-    return send_from_directory(
-        directory="assets", path="report.pdf", as_attachment=True
+    """
+    Downloads a report.
+    Query args: client (name or zone tag in clients.json), period (days, defaults to the
+    client plan) and date (YYYY-MM-DD, defaults to yesterday UTC). The PDF is
+    generated on demand and sent from memory, supporting ETag/Last-Modified
+    and Range requests. With refresh=1 a stored report is regenerated, only
+    the sections whose data changed are rendered again. Without client the
+    sample report is served. Invalid args answer 400, failed fetches 502.
+    """
+    client_name = request.args.get("client")
+    if not client_name:
+        return send_from_directory(
+            directory="assets", path="report.pdf", as_attachment=True
+        )
+    client = find_client(client_name)
+    if client is None:
+        return "<p style='color: red;'>Error: Cliente no encontrado</p>", 404
+    refresh = request.args.get("refresh") == "1"
+    try:
+        leq_date = _report_date()
+        periods = _int_arg("period", client.get("plan", 7), MAX_PERIODS)
+        artifact = report_artifact(client, leq_date, periods, _resource("artifacts"), refresh=refresh)
+    except ValueError as e:
+        return f"<p style='color: red;'>Error: {escape(str(e))}</p>", 400
+    except Exception:
+        current_app.logger.exception("Report of %s failed", client["name"])
+        return "<p style='color: red;'>Error: No se pudo generar el reporte, intenta más tarde</p>", 502
+
+    response = Response(artifact["data"], mimetype="application/pdf")
+    response.headers.set(
+        "Content-Disposition", "attachment", filename=f"{client['name']}_{leq_date}.pdf"
+    )
+    response.set_etag(artifact["etag"])
+    response.last_modified = datetime.fromtimestamp(artifact["created"], timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(
+        request, accept_ranges=True, complete_length=len(artifact["data"])
+    )
+
+
+def _int_arg(name: str, default: int, maximum: int) -> int:
+    """
+    Reads an integer query arg between 1 and maximum.
+    Raises:
+        ValueError: Not an integer or out of range.
+    """
+    raw = request.args.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: '{raw}'.") from None
+    if not 1 <= value <= maximum:
+        raise ValueError(f"{name} must be between 1 and {maximum}.")
+    return value
+
+
+def _report_date() -> str:
+    """
+    Reads the date query arg, defaults to yesterday UTC.
+    Raises:
+        ValueError: Not a YYYY-MM-DD date.
+    """
+    yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+    raw = request.args.get("date", yesterday.isoformat())
+    try:
+        return date.fromisoformat(raw).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date: '{raw}', use YYYY-MM-DD.") from None
+
+
+def _report_window() -> tuple:
+    """
+    Reads the date (defaults to yesterday UTC) and periods query args.
+    Raises:
+        ValueError: Invalid date or periods.
+    """
+    return _report_date(), _int_arg("periods", 7, MAX_PERIODS)
+
+
+def _upstream_error(e: Exception) -> tuple:
+    """
+    Logs a failed fetch and answers 502 without its details.
+    """
+    current_app.logger.exception("Request to %s failed", request.path, exc_info=e)
+    return jsonify(error="Upstream error, try again later"), 502
+
+
+def _cached_response(entry: dict, mimetype: str) -> Response:
+    """
+    Serves an encoded entry (body, gzip, etag) honouring If-None-Match and
+    Accept-Encoding.
+    """
+    if request.if_none_match.contains(entry["etag"]):
+        response = Response(status=304)
+    elif "gzip" in request.accept_encodings:
+        response = Response(entry["gzip"], mimetype=mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(entry["body"], mimetype=mimetype)
+    response.set_etag(entry["etag"])
+    response.headers["Cache-Control"] = "private, max-age=300"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@bp.route("/api/<zone_tag>/<kind>/<metric>")
+def api_metric(zone_tag: str, kind: str, metric: str):
+    """
+    Pre-aggregated metric as JSON for the browser charts.
+    Query args: date (YYYY-MM-DD, defaults to yesterday UTC), periods (days), limit.
+    """
+    try:
+        leq_date, periods = _report_window()
+        limit = _int_arg("limit", None, MAX_LIMIT)
+        entry = metric_response(kind, metric, zone_tag, leq_date, periods, limit)
+    except KeyError:
+        return jsonify(error=f"Unknown metric: {kind}/{metric}"), 404
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return _upstream_error(e)
+    return _cached_response(entry, "application/json")
+
+
+@bp.route("/api/<zone_tag>/compare")
+def api_compare(zone_tag: str):
+    """
+    Window against the previous one of the same length as JSON.
+    Query args: date, periods and metrics (comma separated, defaults to the
+    dashboard ones).
+    """
+    metrics = [metric for metric in request.args.get("metrics", "").split(",") if metric]
+    try:
+        leq_date, periods = _report_window()
+        entry = compare_response(zone_tag, leq_date, periods, metrics, _resource("metric_store"))
+    except KeyError as e:
+        return jsonify(error=f"Unknown metric: {e.args[0]}"), 404
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return _upstream_error(e)
+    return _cached_response(entry, "application/json")
+
+
+@bp.route("/metrics/fetch")
+def fetch_metrics_status():
+    """
+    Queue depth and wait times of the fetch scheduler, the rate budget use
+    of every API token and the prefetches of this process.
+    """
+    return jsonify(
+        scheduler=get_fetch_scheduler().stats(),
+        tokens=get_credentials().stats(),
+        prefetch=_resource("prefetcher").stats(),
+    )
+
+
+@bp.route("/panel/<zone_tag>/<panel>.svg")
+def svg_panel(zone_tag: str, panel: str):
+    """
+    Dashboard panel drawn as SVG (requests, bandwidth, protocols).
+    Query args: date (YYYY-MM-DD, defaults to yesterday UTC), periods (days).
+    """
+    try:
+        leq_date, periods = _report_window()
+        entry = panel_response(panel, zone_tag, leq_date, periods)
+    except KeyError:
+        return jsonify(error=f"Unknown panel: {panel}"), 404
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return _upstream_error(e)
+    return _cached_response(entry, "image/svg+xml")
+
+
+@bp.route("/export.<fmt>")
+def export(fmt: str):
+    """
+    Streams the daily metrics of some zones as CSV, NDJSON or Parquet with
+    chunked transfer encoding, in constant memory whatever the window.
+    Query args: zones (comma separated zone tags) or client (all its zones),
+    metrics (comma separated, defaults to the time series), source (api or
+    store, the stored history), date and periods. A failed first query
+    answers 502, a later one ends the file with an error marker (see
+    utils_export.stream_export).
+    """
+    metrics = [metric for metric in request.args.get("metrics", "").split(",") if metric]
+    source = request.args.get("source", "api")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify(error=f"Unknown format: {fmt}"), 404
+    try:
+        leq_date, periods = _report_window()
+        zone_tags = export_zones(request.args.get("zones"), request.args.get("client"))
+        rows = export_rows(zone_tags, leq_date, periods, metrics, source, _resource("metric_store"))
+        chunks = stream_export(rows, fmt)
+    except KeyError as e:
+        return jsonify(error=f"Unknown metric: {e.args[0]}"), 404
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return _upstream_error(e)
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers.set(
+        "Content-Disposition", "attachment", filename=f"export_{leq_date}_{periods}d.{fmt}"
     )
+    return response
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5002)
+    create_app().run(debug=True, port=5002)
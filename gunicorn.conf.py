@@ -0,0 +1,30 @@
+"""
+Gunicorn settings, run with: gunicorn -c gunicorn.conf.py
+
+The app is created once in the master (preload_app) and the workers are
+forked from it, sharing the preloaded resources (see app.preload).
+"""
+
+import gc
+import os
+
+wsgi_app = "app:create_app(start_scheduler=False)"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = 120
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Keep the GC from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork, every worker starts its own scheduler
+    # (the leases keep them from running the same job twice)
+    if os.getenv("SCHEDULER_ENABLED", "1") == "1":
+        # The Flask app created by create_app in the master
+        flask_app = server.app.wsgi()
+        flask_app.extensions["cloudflare_report"]["scheduler"].start()
@@ -0,0 +1,42 @@
+// 🔹 Draws every <canvas data-chart="..." data-src="..."> from the JSON metric API
+const CHART_COLORS = ["#3CB5AE", "#A8DADC", "#5271FF", "#D9D9D9"]
+
+function formatValue(value, type) {
+    if (type === "byte") {
+        return `${(value / 1048576).toFixed(1)} MB`
+    }
+    return value.toLocaleString()
+}
+
+async function drawChart(canvas) {
+    const response = await fetch(canvas.dataset.src)
+    if (!response.ok) {
+        canvas.insertAdjacentHTML("afterend", `<p class="text-muted">Sin datos</p>`)
+        return
+    }
+    const data = await response.json()
+    const kind = canvas.dataset.chart
+    new Chart(canvas, {
+        type: kind,
+        data: {
+            labels: data.labels,
+            datasets: [{
+                label: data.title,
+                data: data.values,
+                borderColor: CHART_COLORS[0],
+                backgroundColor: kind === "line" ? CHART_COLORS[1] : CHART_COLORS,
+                fill: kind === "line",
+                pointRadius: 0,
+            }],
+        },
+        options: {
+            indexAxis: kind === "bar" ? "y" : "x",
+            plugins: {
+                title: { display: true, text: `${data.title}: ${formatValue(data.total, data.type)}` },
+                legend: { display: kind === "doughnut" },
+            },
+        },
+    })
+}
+
+document.querySelectorAll("canvas[data-src]").forEach(drawChart)
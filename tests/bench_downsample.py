@@ -0,0 +1,71 @@
+"""
+Benchmark of the timeseries downsampling used by dashboard_stat_graph.
+
+Run from the project root:
+    python tests/bench_downsample.py
+"""
+
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.utils_downsample import downsample_indices, pixel_budget  # noqa: E402
+from utils.utils_image import dashboard_stat_graph  # noqa: E402
+
+SIZES = [10_000, 100_000, 1_000_000]
+DPI = 100
+
+
+def timed(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic_stat(title: str, n: int, scale: float) -> dict:
+    rng = np.random.default_rng(7)
+    hours = np.arange(np.datetime64("2020-01-01T00"), np.datetime64("2020-01-01T00") + n)
+    values = scale * (1.5 + np.sin(np.arange(n) / 24)) + rng.normal(0, scale / 10, n)
+    return {
+        "title": title,
+        "content": dict(zip(np.datetime_as_string(hours, unit="h"), values.tolist())),
+        "type": "numeric",
+    }
+
+
+def main() -> None:
+    budget = pixel_budget(10, DPI)
+    print(f"Pixel budget: {budget} px")
+    print(f"{'points':>10} {'minmax (ms)':>12} {'lttb (ms)':>10} {'kept':>6}")
+    for n in SIZES:
+        rng = np.random.default_rng(n)
+        series = [rng.normal(size=n).cumsum(), rng.normal(size=n).cumsum()]
+        minmax = timed(downsample_indices, series, budget, "minmax")
+        lttb = timed(downsample_indices, series, budget, "lttb")
+        kept = downsample_indices(series, budget).size
+        print(f"{n:>10} {minmax * 1000:>12.1f} {lttb * 1000:>10.1f} {kept:>6}")
+
+    print()
+    print(f"{'points':>10} {'render (s)':>11}")
+    for n in SIZES:
+        first = synthetic_stat("Requests", n, 1000)
+        second = synthetic_stat("Cached Requests", n, 100)
+        render = timed(
+            lambda: dashboard_stat_graph(
+                first, second, "Uncached", "Requests", io.BytesIO(), DPI
+            ),
+            repeat=1,
+        )
+        print(f"{n:>10} {render:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark of the bytes per report with and without the image optimisation.
+
+Run from the project root:
+    python tests/bench_pdf_size.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpdf.fpdf import FPDF  # noqa: E402
+
+from utils.utils_pdf import (  # noqa: E402
+    BASE_FOLDER,
+    CHART_FILES,
+    PARENT_LOGO,
+    REPORT_LAYOUT,
+    build_pdf_report,
+    image_info,
+)
+
+CLIENT = "acme"
+
+
+def legacy_report() -> bytes:
+    """
+    Report built like the V4 create_pdf_report: PNG files embedded as is.
+    Slow, FPDF splits the alpha channel of RGBA PNGs row by row.
+    """
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=16, style="B")
+    pdf.cell(0, 10, txt=f"Reporte de red: {CLIENT}", ln=True, align="C")
+    pdf.image(PARENT_LOGO, x=10, y=10, w=50)
+    pdf.image(os.path.join(BASE_FOLDER, f"logo_{CLIENT}.png"), x=160, y=10, w=30)
+    for section in REPORT_LAYOUT["sections"]:
+        if section.get("new_page"):
+            pdf.add_page()
+        pdf.set_font("Arial", size=12, style="B")
+        pdf.cell(0, 10, txt=section["title"], ln=True, align="l")
+        for slot in section["slots"]:
+            path = os.path.join(BASE_FOLDER, CHART_FILES[slot["chart"]])
+            pdf.image(path, x=slot["x"], y=slot["y"], w=slot["w"])
+    return pdf.output(dest="S").encode("latin1")
+
+
+def timed(func) -> tuple:
+    start = time.perf_counter()
+    document = func()
+    return len(document), time.perf_counter() - start
+
+
+def main() -> None:
+    charts = {}
+    for chart, file_name in CHART_FILES.items():
+        with open(os.path.join(BASE_FOLDER, file_name), "rb") as f:
+            charts[chart] = f.read()
+
+    print("Sample reports in the repo")
+    for path in ("assets/reports/acme_03-03-25.pdf", "assets/reports/report.pdf"):
+        print(f"  {path:<40} {os.path.getsize(path):>10,} bytes")
+
+    print()
+    print(f"{'build':<32} {'bytes':>10} {'seconds':>8}")
+    cases = [
+        ("legacy (files embedded as is)", legacy_report),
+        ("optimised, full resolution", lambda: build_pdf_report(CLIENT, charts, image_dpi=None)),
+        ("optimised, 200 dpi", lambda: build_pdf_report(CLIENT, charts)),
+        ("optimised, 150 dpi", lambda: build_pdf_report(CLIENT, charts, image_dpi=150)),
+    ]
+    for name, func in cases:
+        size, elapsed = timed(func)
+        print(f"{name:<32} {size:>10,} {elapsed:>8.2f}")
+
+    print()
+    print(f"{'chart':<10} {'source':>10} {'embedded':>10} {'encoding':>18}")
+    for section in REPORT_LAYOUT["sections"]:
+        for slot in section["slots"]:
+            data = charts[slot["chart"]]
+            info = image_info(data, slot["w"])
+            encoding = f"{info['cs']}/{info['f']}"
+            print(f"{slot['chart']:<10} {len(data):>10,} {len(info['data']):>10,} {encoding:>18}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark of the per worker memory and time to first request of forked
+workers, with and without app.preload in the master.
+
+Run from the project root (Linux, reads /proc):
+    python tests/bench_startup.py
+"""
+
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+WORKERS = 3
+
+
+def memory() -> dict:
+    """
+    Rss, Pss and private (USS) memory of the process in MB.
+    """
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def first_request(flask_app) -> float:
+    """
+    What a worker serves first: a page and a report with the map and logos.
+    """
+    from test import TEST_REQUESTS_PER_COUNTRY
+
+    from utils.utils_image import dashboard_table_map
+    from utils.utils_pdf import build_pdf_report
+
+    start = time.perf_counter()
+    flask_app.test_client().get("/")
+    buffer = io.BytesIO()
+    dashboard_table_map(TEST_REQUESTS_PER_COUNTRY, output=buffer, dpi=100)
+    build_pdf_report("acme", {"map": buffer.getvalue()})
+    return time.perf_counter() - start
+
+
+def run_mode(preload: bool) -> dict:
+    """
+    Creates the app like the master, optionally preloading it, forks WORKERS
+    workers and collects what each one measures after its first request.
+    """
+    start = time.perf_counter()
+    from app import create_app
+
+    flask_app = create_app(start_scheduler=False, preload_resources=preload)
+    if preload:
+        gc.freeze()
+    master_s = time.perf_counter() - start
+    workers = []
+    for _ in range(WORKERS):
+        read_fd, write_fd = os.pipe()
+        if os.fork() == 0:
+            os.close(read_fd)
+            elapsed = first_request(flask_app)
+            with os.fdopen(write_fd, "w") as f:
+                json.dump(dict(memory(), first_request_s=elapsed), f)
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            workers.append(json.load(f))
+        os.wait()
+    return {"master_s": master_s, "workers": workers}
+
+
+def main() -> None:
+    if len(sys.argv) == 3 and sys.argv[1] == "--mode":
+        print(json.dumps(run_mode(sys.argv[2] == "preload")))
+        return
+    env = dict(os.environ, SCHEDULER_ENABLED="0", MPLBACKEND="Agg")
+    print(f"{'mode':<9} {'master s':>8} {'first req s':>11} {'rss MB':>7} {'pss MB':>7} {'uss MB':>7}")
+    for mode in ("lazy", "preload"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode],
+            env=env,
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        workers = result["workers"]
+
+        def mean(key: str) -> float:
+            return sum(worker[key] for worker in workers) / len(workers)
+
+        print(
+            f"{mode:<9} {result['master_s']:>8.2f} {mean('first_request_s'):>11.3f} "
+            f"{mean('rss'):>7.1f} {mean('pss'):>7.1f} {mean('uss'):>7.1f}"
+        )
+    print(f"Means over {WORKERS} forked workers, pss/uss count the pages shared with the master once.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of the SVG panels against the matplotlib ones.
+
+Run from the project root:
+    python tests/bench_svg.py
+"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test import (  # noqa: E402
+    TEST_CACHED_REQ,
+    TEST_CONTENT_TYPE,
+    TEST_HTTP_VERSIONS,
+    TEST_REQ,
+    TEST_SSL_VERSIONS,
+)
+from utils.utils_image import dashboard_pie_bar, dashboard_stat_graph  # noqa: E402
+from utils.utils_svg import svg_pie_bar, svg_stat_graph  # noqa: E402
+
+REPEAT = 10
+
+
+def timed(func) -> tuple:
+    """
+    Best time in ms over REPEAT runs and size of the output in bytes.
+    """
+    best, size = float("inf"), 0
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        size = len(func())
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, size
+
+
+def matplotlib_png(func, *args, dpi: int = 100) -> bytes:
+    buffer = io.BytesIO()
+    func(*args, output=buffer, dpi=dpi)
+    return buffer.getvalue()
+
+
+def matplotlib_svg(func, *args) -> bytes:
+    buffer = io.BytesIO()
+    func(*args, output=buffer, fmt="svg")
+    return buffer.getvalue()
+
+
+def main() -> None:
+    stat_args = (TEST_REQ, TEST_CACHED_REQ, "Uncached requests", "Requests")
+    pie_args = (TEST_HTTP_VERSIONS, TEST_SSL_VERSIONS, TEST_CONTENT_TYPE)
+    cases = [
+        ("stat_graph", "matplotlib png", lambda: matplotlib_png(dashboard_stat_graph, *stat_args)),
+        ("stat_graph", "matplotlib svg", lambda: matplotlib_svg(dashboard_stat_graph, *stat_args)),
+        ("stat_graph", "svg renderer", lambda: svg_stat_graph(*stat_args)),
+        ("pie_bar", "matplotlib png", lambda: matplotlib_png(dashboard_pie_bar, *pie_args)),
+        ("pie_bar", "matplotlib svg", lambda: matplotlib_svg(dashboard_pie_bar, *pie_args)),
+        ("pie_bar", "svg renderer", lambda: svg_pie_bar(*pie_args)),
+    ]
+    print(f"{'panel':<12} {'path':<16} {'ms':>8} {'bytes':>8}")
+    for panel, path, func in cases:
+        elapsed, size = timed(func)
+        print(f"{panel:<12} {path:<16} {elapsed:>8.2f} {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,31 @@
-from .config import CF_API_TOKEN
-from .utils_cloudflare import get_accounts, get_zones, get_requests, get_requests_per_location, get_bandwidth, get_bandwidth_per_location, get_visits, get_views, get_http_versions, get_ssl_traffic, get_content_type, get_cached_requests, get_cached_bandwidth, get_encrypted_bandwidth, get_encrypted_requests, get_fourxx_errors, get_fivexx_errors
-from .utils_image import dashboard_stat_graph, dashboard_pie_bar, dashboard_table_map, dashboard_stat_test
-from .utils_pdf import create_pdf_report
+from .config import CF_API_TOKEN, load_clients, find_client
+from .utils_credentials import CredentialPool, get_credentials, load_credentials
+from .utils_fetcher import FairFetchScheduler, get_fetch_scheduler
+from .utils_cloudflare import get_accounts, get_zones, get_requests, get_requests_per_location, get_bandwidth, get_bandwidth_per_location, get_visits, get_views, get_http_versions, get_ssl_traffic, get_content_type, get_cached_requests, get_cached_bandwidth, get_encrypted_bandwidth, get_encrypted_requests, get_fourxx_errors, get_fivexx_errors, get_security_events, get_dns_analytics
+from .utils_image import dashboard_stat_graph, dashboard_pie_bar, dashboard_table_map, dashboard_stat_test, dashboard_security, dashboard_dns, dashboard_zone_table
+from .utils_pdf import create_pdf_report, build_pdf_report
+from .utils_cache import ChartCache, get_chart_cache, render_chart
+from .utils_artifacts import ArtifactStore
+from .utils_report import generate_report, report_artifact
+from .utils_jobs import JobQueue
+from .utils_prefetch import Prefetcher
+from .utils_store import MetricStore, ingest_daily
+from .utils_compare import compare_windows, fetch_comparison
+from .utils_anomaly import AnomalyDetector
+from .utils_derived import derive_metrics, derive_rows
+from .utils_topk import TopK
+from .utils_account import fetch_account_data
+from .utils_calendar import get_local_metrics, fill_days
 
 __all__ = [
     "CF_API_TOKEN",
+    "load_clients",
+    "find_client",
+    "CredentialPool",
+    "get_credentials",
+    "load_credentials",
+    "FairFetchScheduler",
+    "get_fetch_scheduler",
     "get_accounts", 
     "get_zones", 
     "get_requests", 
@@ -22,9 +43,34 @@ __all__ = [
     "get_encrypted_requests", 
     "get_fourxx_errors", 
     "get_fivexx_errors",
+    "get_security_events",
+    "get_dns_analytics",
     "dashboard_stat_graph", 
     "dashboard_pie_bar", 
     "dashboard_table_map", 
     "dashboard_stat_test",
-    "create_pdf_report" 
+    "dashboard_security",
+    "dashboard_dns",
+    "dashboard_zone_table",
+    "create_pdf_report",
+    "build_pdf_report",
+    "ChartCache",
+    "get_chart_cache",
+    "render_chart",
+    "ArtifactStore",
+    "generate_report",
+    "report_artifact",
+    "JobQueue",
+    "Prefetcher",
+    "MetricStore",
+    "ingest_daily",
+    "fetch_comparison",
+    "compare_windows",
+    "AnomalyDetector",
+    "derive_metrics",
+    "derive_rows",
+    "TopK",
+    "fetch_account_data",
+    "get_local_metrics",
+    "fill_days",
 ]
\ No newline at end of file
@@ -1,12 +1,52 @@
 """
-Get the Cloudflare token
+Get the Cloudflare token and the clients registry
 """
+import json
 import os
 import dotenv as env
 
 env.load_dotenv()
 
+# Default token, client accounts can have their own (see utils_credentials)
 CF_API_TOKEN = os.getenv("CF_API_TOKEN")
+CLIENTS_FILE = os.getenv(
+    "CF_CLIENTS_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "clients.json"),
+)
 
-if not CF_API_TOKEN:
-    raise ValueError("Missing or invalid API token.")
\ No newline at end of file
+
+def load_clients(path: str = CLIENTS_FILE) -> list:
+    """
+    Reads the clients registry.
+    Args:
+        path (str): JSON file with a list of clients, each one with:
+            - "name" (str): Client name, also used for the logo "logo_<name>.png".
+            - "zone_tag" (str): Cloudflare zone of the client.
+            - "plan" (int): Report window in days (7 or 30).
+            - "account_id" (str, optional): Cloudflare account of the zone.
+            - "zones" (list, optional): Zone tags (or {"name", "zone_tag"})
+              merged in one account report, see utils_account.
+            - "timezone" (str, optional): IANA timezone of the report days,
+              UTC by default, see utils_calendar.
+            - "token_env" (str, optional): Environment variable with the API
+              token of the client account, see utils_credentials.
+            - "schedule" (dict, optional): Automatic runs, see
+              utils_scheduler.client_schedule.
+    Returns:
+        list: The clients.
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_client(key: str, clients: list = None) -> dict:
+    """
+    Looks up a client by name or zone tag.
+    Args:
+        key (str): Client name or Cloudflare zone tag.
+        clients (list): Clients to search, defaults to load_clients().
+    Returns:
+        dict: The client, None if there is no match.
+    """
+    clients = load_clients() if clients is None else clients
+    return next((c for c in clients if key in (c["name"], c["zone_tag"])), None)
@@ -0,0 +1,260 @@
+"""
+V1 functions neccesary to build one report for all the zones of a client
+"""
+
+__version__ = "1.0.0"
+
+from typing import Optional
+
+import numpy as np
+
+from .config import load_clients
+from .utils_api import CATEGORICAL_METRICS, TIMESERIES_METRICS, fetch_cache
+from .utils_calendar import fill_days
+from .utils_cloudflare import execute_query, range_generator
+from .utils_compare import METRIC_FIELDS, metric_selection, parse_groups
+from .utils_credentials import get_credentials
+from .utils_derived import align_stats, derive_metrics
+from .utils_fetcher import INTERACTIVE, get_fetch_scheduler
+
+ACCOUNT_ZONE_BATCH = 10  # zones per query
+ACCOUNT_TABLE_ROWS = 25  # zones listed in the breakdown, the rest as "Other zones"
+
+# Metrics of an account report, see utils_report.REPORT_METRICS
+ACCOUNT_METRICS = [
+    "requests",
+    "cached_requests",
+    "bandwidth",
+    "cached_bandwidth",
+    "visits",
+    "requests_per_location",
+    "http_versions",
+    "ssl_traffic",
+    "content_type",
+]
+
+
+def client_zones(client: dict, clients: Optional[list] = None) -> dict:
+    """
+    Zones of a client with an optional "zones" entry in clients.json, either
+    zone tags or {"name", "zone_tag"} dicts. Zone names default to the
+    client of the zone in the registry, else the zone tag.
+    Returns:
+        dict: Name by zone tag, only the main zone when there is no "zones".
+    """
+    names = {c["zone_tag"]: c["name"] for c in (load_clients() if clients is None else clients)}
+    zones = {}
+    for zone in client.get("zones") or [client["zone_tag"]]:
+        if isinstance(zone, dict):
+            zones[zone["zone_tag"]] = zone.get("name", zone["zone_tag"])
+        else:
+            zones[zone] = names.get(zone, zone)
+    return zones
+
+
+def account_query(metrics: list) -> str:
+    """
+    GraphQL document requesting the metrics of several zones ($zoneTags).
+    """
+    return f"""
+        query GetAccountZones($zoneTags: [String!], $since: String!, $until: String!) {{
+            viewer {{
+                zones(filter: {{zoneTag_in: $zoneTags}}) {{
+                    zoneTag
+                    httpRequests1dGroups(limit: 1000, filter: {{date_geq: $since, date_leq: $until}}) {{
+                        {metric_selection(metrics)}
+                    }}
+                }}
+            }}
+        }}
+    """
+
+
+def zone_batches(zone_tags: list, size: int = ACCOUNT_ZONE_BATCH) -> list:
+    """
+    Splits zones in batches of one API token, for the zoneTag_in queries.
+    Returns:
+        list: Lists of at most size zone tags.
+    """
+    by_token = {}
+    for zone_tag in zone_tags:
+        by_token.setdefault(get_credentials().for_zone(zone_tag).name, []).append(zone_tag)
+    return [zones[i : i + size] for zones in by_token.values() for i in range(0, len(zones), size)]
+
+
+def get_zones_metrics(zone_tags: list, leq_date: str, periods: int, metrics: list) -> dict:
+    """
+    Retrieve the metrics of several zones with one query.
+    Args:
+        zone_tags (list): Zones, all served by the same API token.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        metrics (list): Keys of utils_compare.METRIC_FIELDS.
+    Returns:
+        dict: {zone_tag: {metric: stat dict}}, zones without data left out.
+    """
+    range_generated = range_generator(leq_date, periods)
+    variables = {
+        "zoneTags": zone_tags,
+        "since": range_generated["geq_date"][:10],
+        "until": range_generated["leq_date"][:10],
+    }
+    credential = get_credentials().for_zone(zone_tags[0])
+    response = execute_query(account_query(metrics), variables, credential)
+    try:
+        return {
+            zone["zoneTag"]: {
+                metric: parse_groups(metric, zone["httpRequests1dGroups"] or [])
+                for metric in metrics
+            }
+            for zone in response["data"]["viewer"]["zones"]
+        }
+    except (KeyError, IndexError, TypeError) as e:
+        raise Exception(f"Error processing response for account zones: {e}")
+
+
+def fetch_zones_metrics(
+    zone_tags: list,
+    leq_date: str,
+    periods: int,
+    metrics: list,
+    tenant: Optional[str] = None,
+    priority: str = INTERACTIVE,
+) -> dict:
+    """
+    Metrics of many zones, ACCOUNT_ZONE_BATCH zones of the same API token per
+    query, the queries run in parallel on the fair fetch scheduler.
+    Returns:
+        dict: See get_zones_metrics.
+    """
+    key = ("zones", tuple(zone_tags), tuple(metrics), leq_date, periods)
+    cached = fetch_cache.get(key)
+    if cached is not None:
+        return cached
+    scheduler = get_fetch_scheduler()
+    tenant = tenant or scheduler.tenant_for(zone_tags[0])
+    futures = [
+        scheduler.submit(tenant, get_zones_metrics, zones, leq_date, periods, metrics, priority=priority)
+        for zones in zone_batches(zone_tags)
+    ]
+    data = {}
+    for future in futures:
+        data.update(future.result())
+    fetch_cache.put(key, data)
+    return data
+
+
+def merge_zones(data: dict, metrics: list) -> dict:
+    """
+    Adds up the stats of several zones: time series aligned by date, the
+    categorical ones by category.
+    Args:
+        data (dict): {zone: {metric: stat dict}}.
+        metrics (list): Metrics to merge.
+    Returns:
+        dict: Stat dict by metric, categories sorted by value.
+    """
+    merged = {}
+    timeseries = [metric for metric in metrics if metric not in CATEGORICAL_METRICS]
+    if timeseries:
+        _, dates, values = align_stats(data, timeseries)
+        # Days no zone has stay out, like in a single zone stat
+        totals = np.nansum(values, axis=0)
+        present = ~np.isnan(values).all(axis=0)
+        for m, metric in enumerate(timeseries):
+            merged[metric] = {
+                "title": METRIC_FIELDS[metric][2],
+                "content": {
+                    day: totals[m, d].item() for d, day in enumerate(dates) if present[m, d]
+                },
+                "type": METRIC_FIELDS[metric][3],
+            }
+    for metric in metrics:
+        if metric not in CATEGORICAL_METRICS:
+            continue
+        contents = [stats[metric]["content"] for stats in data.values() if metric in stats]
+        categories = sorted({category for content in contents for category in content})
+        matrix = np.array(
+            [[content.get(category, 0) for category in categories] for content in contents],
+            dtype=float,
+        ).reshape(len(contents), len(categories))
+        totals = matrix.sum(axis=0)
+        order = np.argsort(-totals, kind="stable")
+        merged[metric] = {
+            "title": METRIC_FIELDS[metric][2],
+            "content": {categories[i]: totals[i].item() for i in order},
+            "type": METRIC_FIELDS[metric][3],
+        }
+    return merged
+
+
+def zone_breakdown(data: dict, names: dict, rows: int = ACCOUNT_TABLE_ROWS) -> dict:
+    """
+    Per zone totals of the window, busiest zones first.
+    Args:
+        data (dict): {zone: {metric: stat dict}} with requests, cached_requests,
+            bandwidth and visits.
+        names (dict): Name by zone tag.
+        rows (int): Zones listed, the rest added up as "Other zones".
+    Returns:
+        dict: Stat dict, content a list of rows (zone, requests, cache_hit_ratio,
+        bandwidth, visits), "type" "table".
+    """
+    columns = ["requests", "cached_requests", "bandwidth", "visits"]
+    zones, _, values = align_stats(data, columns)
+    totals = np.nansum(values, axis=2)
+    order = np.argsort(-totals[:, 0], kind="stable")
+    if len(order) > rows:
+        kept, rest = order[: rows - 1], order[rows - 1 :]
+        labels = [names.get(zones[i], zones[i]) for i in kept] + [f"Other zones ({len(rest)})"]
+        totals = np.vstack([totals[kept], totals[rest].sum(axis=0)])
+    else:
+        labels = [names.get(zones[i], zones[i]) for i in order]
+        totals = totals[order]
+    ratio = np.full(len(labels), np.nan)
+    np.divide(totals[:, 1], totals[:, 0], out=ratio, where=totals[:, 0] > 0)
+    content = [
+        {
+            "zone": label,
+            "requests": totals[i, 0].item(),
+            "cache_hit_ratio": None if np.isnan(ratio[i]) else ratio[i].item(),
+            "bandwidth": totals[i, 2].item(),
+            "visits": totals[i, 3].item(),
+        }
+        for i, label in enumerate(labels)
+    ]
+    return {"title": "Zones", "content": content, "type": "table"}
+
+
+def fetch_account_data(
+    client: dict, leq_date: str, periods: int, priority: str = INTERACTIVE
+) -> dict:
+    """
+    Report data of every zone of a client, merged like a single zone
+    (see utils_report.fetch_report_data) plus the "zone_breakdown" table.
+    Time series have every day of the window, missing ones as 0 (None in
+    the ratios). Security events are per zone and left empty.
+    Args:
+        client (dict): Client with "name" and "zones".
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        priority (str): INTERACTIVE or BATCH (see utils_fetcher).
+    Returns:
+        dict: Stat dicts by metric key.
+    """
+    names = client_zones(client)
+    data = fetch_zones_metrics(
+        list(names), leq_date, periods, ACCOUNT_METRICS, client["name"], priority
+    )
+    merged = merge_zones(data, ACCOUNT_METRICS)
+    # Like fetch_report_data: ratios from the days fetched (gaps as None),
+    # then every day of the window in the time series (missing as 0)
+    derived = derive_metrics({client["name"]: merged})[client["name"]]
+    for metric in ACCOUNT_METRICS:
+        if metric in TIMESERIES_METRICS:
+            merged[metric] = fill_days(merged[metric], leq_date, periods)
+    for metric, stat in derived.items():
+        merged[metric] = fill_days(stat, leq_date, periods, missing=None)
+    merged["security_events"] = {"title": "Security Events", "content": {}, "type": "numeric"}
+    merged["zone_breakdown"] = zone_breakdown(data, names)
+    return merged
@@ -0,0 +1,206 @@
+"""
+V1 functions neccesary to detect anomalies in the stored metrics of every zone
+"""
+
+__version__ = "1.0.0"
+
+import os
+import sqlite3
+import time
+from typing import Optional
+
+import numpy as np
+
+from .utils_store import METRICS_DB, MetricStore
+
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", 0.2))  # weight of the newest value
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", 3.0))  # deviations to alert
+ANOMALY_WARMUP = 7  # values seen before a signal can alert
+
+# Signal: (direction alerted, 1 up or -1 down, minimum deviation, minimum
+# deviation relative to the mean). The minimums keep flat series (0 errors
+# every day) and steady traffic from alerting on noise.
+SIGNALS = {
+    "fivexx_errors": (1, 10.0, 0.1),
+    "cache_ratio": (-1, 0.02, 0.0),
+    "requests": (1, 100.0, 0.1),
+}
+# Stored metrics the signals are computed from
+SIGNAL_METRICS = ["requests", "cached_requests", "fivexx_errors"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    zone_tag TEXT NOT NULL,
+    signal TEXT NOT NULL,
+    mean REAL NOT NULL,
+    var REAL NOT NULL,
+    count INTEGER NOT NULL,
+    last TEXT NOT NULL,
+    PRIMARY KEY (zone_tag, signal)
+);
+
+CREATE TABLE IF NOT EXISTS anomalies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client TEXT NOT NULL,
+    zone_tag TEXT NOT NULL,
+    signal TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL NOT NULL,
+    expected REAL NOT NULL,
+    score REAL NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (zone_tag, signal, date)
+);
+CREATE INDEX IF NOT EXISTS anomalies_client ON anomalies (client, created);
+"""
+
+
+def signal_values(rows: list) -> dict:
+    """
+    Signal values by bucket from stored rows (see MetricStore.daily_rows).
+    cache_ratio is cached_requests / requests, left out when requests is 0.
+    Returns:
+        dict: {bucket: {(client, zone_tag, signal): value}}, buckets sorted.
+    """
+    metrics = {}
+    for row in rows:
+        zone = metrics.setdefault(row["date"], {}).setdefault((row["client"], row["zone_tag"]), {})
+        zone[row["metric"]] = row["value"]
+    values = {}
+    for bucket in sorted(metrics):
+        observed = values[bucket] = {}
+        for (client, zone_tag), zone in metrics[bucket].items():
+            for signal in ("requests", "fivexx_errors"):
+                if signal in zone:
+                    observed[(client, zone_tag, signal)] = zone[signal]
+            if zone.get("requests") and "cached_requests" in zone:
+                observed[(client, zone_tag, "cache_ratio")] = zone["cached_requests"] / zone["requests"]
+    return values
+
+
+class AnomalyDetector:
+    """
+    Exponentially weighted mean and variance of every zone signal, kept in
+    SQLite (one row per zone and signal). Each new bucket (day or hour) is
+    scored against them and folded in, so history is never rescanned.
+    """
+
+    def __init__(
+        self,
+        db_path: str = METRICS_DB,
+        alpha: float = ANOMALY_ALPHA,
+        threshold: float = ANOMALY_THRESHOLD,
+        warmup: int = ANOMALY_WARMUP,
+    ):
+        self.db_path = db_path
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def observe(self, bucket: str, values: dict) -> list:
+        """
+        Scores one bucket of every zone at once and updates their state.
+        Buckets already seen by a zone signal are ignored.
+        Args:
+            bucket (str): "YYYY-MM-DD" or "YYYY-MM-DDTHH", sortable.
+            values (dict): {(client, zone_tag, signal): value}.
+        Returns:
+            list: Alerts (client, zone_tag, signal, date, value, expected, score).
+        """
+        if not values:
+            return []
+        keys = [key for key in values if key[2] in SIGNALS]
+        with self._connect() as db:
+            state = {
+                (row["zone_tag"], row["signal"]): row
+                for row in db.execute("SELECT * FROM anomaly_state")
+            }
+            keys = [
+                key for key in keys
+                if (key[1], key[2]) not in state or state[(key[1], key[2])]["last"] < bucket
+            ]
+            if not keys:
+                return []
+            rows = [state.get((zone_tag, signal)) for _, zone_tag, signal in keys]
+            x = np.array([values[key] for key in keys], dtype=float)
+            seen = np.array([row is not None for row in rows])
+            mean = np.array([row["mean"] if row else 0.0 for row in rows])
+            var = np.array([row["var"] if row else 0.0 for row in rows])
+            count = np.array([row["count"] if row else 0 for row in rows])
+            direction = np.array([SIGNALS[key[2]][0] for key in keys])
+            floor = np.array([SIGNALS[key[2]][1] for key in keys])
+            relative = np.array([SIGNALS[key[2]][2] for key in keys])
+
+            deviation = np.maximum(np.sqrt(var), np.maximum(floor, relative * np.abs(mean)))
+            score = direction * (x - mean) / deviation
+            alert = seen & (count >= self.warmup) & (score > self.threshold)
+
+            expected, diff = mean, x - mean
+            mean = np.where(seen, mean + self.alpha * diff, x)
+            var = np.where(seen, (1 - self.alpha) * (var + self.alpha * diff**2), 0.0)
+            db.executemany(
+                "INSERT OR REPLACE INTO anomaly_state (zone_tag, signal, mean, var, count, last) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key[1], key[2], float(mean[i]), float(var[i]), int(count[i]) + 1, bucket)
+                    for i, key in enumerate(keys)
+                ],
+            )
+            alerts = [
+                {
+                    "client": keys[i][0],
+                    "zone_tag": keys[i][1],
+                    "signal": keys[i][2],
+                    "date": bucket,
+                    "value": float(x[i]),
+                    "expected": float(expected[i]),
+                    "score": round(float(score[i]), 2),
+                }
+                for i in np.flatnonzero(alert)
+            ]
+            db.executemany(
+                "INSERT OR IGNORE INTO anomalies "
+                "(client, zone_tag, signal, date, value, expected, score, created) "
+                "VALUES (:client, :zone_tag, :signal, :date, :value, :expected, :score, :created)",
+                [{**alert, "created": time.time()} for alert in alerts],
+            )
+        return alerts
+
+    def scan(self, store: MetricStore, geq_date: str) -> list:
+        """
+        Observes the days stored since geq_date, oldest first, for every zone.
+        Args:
+            store (MetricStore): Daily snapshots.
+            geq_date (str): First day to look at "YYYY-MM-DD".
+        Returns:
+            list: Alerts raised, see observe.
+        """
+        alerts = []
+        for bucket, values in signal_values(store.daily_rows(SIGNAL_METRICS, geq_date)).items():
+            alerts.extend(self.observe(bucket, values))
+        return alerts
+
+    def recent(self, client: Optional[str] = None, limit: int = 10) -> list:
+        """
+        Returns:
+            list: Latest alerts, newest first.
+        """
+        query = "SELECT client, zone_tag, signal, date, value, expected, score FROM anomalies"
+        params = ()
+        if client:
+            query += " WHERE client = ?"
+            params = (client,)
+        with self._connect() as db:
+            rows = db.execute(
+                f"{query} ORDER BY date DESC, created DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,369 @@
+"""
+V1 functions neccesary to serve pre-aggregated metrics as JSON
+"""
+
+__version__ = "1.0.0"
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from .utils_cloudflare import (
+    get_bandwidth,
+    get_bandwidth_per_location,
+    get_cached_bandwidth,
+    get_cached_requests,
+    get_content_type,
+    get_dns_analytics,
+    get_encrypted_bandwidth,
+    get_encrypted_requests,
+    get_fivexx_errors,
+    get_fourxx_errors,
+    get_http_versions,
+    get_requests,
+    get_requests_per_location,
+    get_security_events,
+    get_ssl_traffic,
+    get_views,
+    get_visits,
+)
+from .utils_derived import DERIVED_METRICS, derive_metrics, derived_payload
+from .utils_downsample import downsample_indices
+from .utils_fetcher import INTERACTIVE, get_fetch_scheduler
+from .utils_svg import svg_pie_bar, svg_stat_graph
+
+FETCH_CACHE_TTL = int(os.getenv("FETCH_CACHE_TTL", 300))
+
+# Metrics keyed by date
+TIMESERIES_METRICS = {
+    "requests": get_requests,
+    "bandwidth": get_bandwidth,
+    "visits": get_visits,
+    "views": get_views,
+    "cached_requests": get_cached_requests,
+    "cached_bandwidth": get_cached_bandwidth,
+    "encrypted_requests": get_encrypted_requests,
+    "encrypted_bandwidth": get_encrypted_bandwidth,
+    "fourxx_errors": get_fourxx_errors,
+    "fivexx_errors": get_fivexx_errors,
+}
+
+# Metrics keyed by category (country, protocol, content type)
+CATEGORICAL_METRICS = {
+    "requests_per_location": get_requests_per_location,
+    "bandwidth_per_location": get_bandwidth_per_location,
+    "http_versions": get_http_versions,
+    "ssl_traffic": get_ssl_traffic,
+    "content_type": get_content_type,
+}
+
+# Metrics aggregated from raw events, content with several tables
+EVENT_METRICS = {
+    "security_events": get_security_events,
+    "dns_analytics": get_dns_analytics,
+}
+
+METRICS = {**TIMESERIES_METRICS, **CATEGORICAL_METRICS, **EVENT_METRICS}
+
+# SVG panels: renderer, metrics passed as stats, extra positional arguments
+PANELS = {
+    "requests": (
+        svg_stat_graph,
+        ("requests", "cached_requests"),
+        ("Uncached requests", "Requests"),
+    ),
+    "bandwidth": (
+        svg_stat_graph,
+        ("bandwidth", "cached_bandwidth"),
+        ("Uncached bandwidth", "MB"),
+    ),
+    "protocols": (svg_pie_bar, ("http_versions", "ssl_traffic", "content_type"), ()),
+}
+
+
+class TTLCache:
+    """
+    Thread safe in-memory cache with a time to live and a size bound (LRU).
+    """
+
+    def __init__(self, ttl: float = FETCH_CACHE_TTL, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key, factory: Callable):
+        """
+        Returns the cached value or stores and returns factory().
+        """
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+fetch_cache = TTLCache()
+response_cache = TTLCache()
+
+# Fetches queued or running by fetch cache key, with their priority, shared
+# by the callers asking for the same metric before it is cached
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _settle(key: tuple, future) -> None:
+    # Cached before leaving _inflight, so a caller always finds one of them
+    if not future.cancelled() and future.exception() is None:
+        fetch_cache.put(key, future.result())
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        if entry is not None and entry[0] is future:
+            del _inflight[key]
+
+
+def _cached_fetch(key: tuple, fetcher: Callable, *args) -> dict:
+    # A batch fetch overtaken by an interactive one finds its result cached
+    stat = fetch_cache.get(key)
+    return stat if stat is not None else fetcher(*args)
+
+
+def fetch_metrics(
+    metrics: list,
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    tenant: Optional[str] = None,
+    priority: str = INTERACTIVE,
+) -> dict:
+    """
+    Runs utils_cloudflare fetchers through the shared fetch cache, the cache
+    misses are queued together on the fair fetch scheduler. A metric already
+    being fetched (e.g. by a prefetch) is waited for instead of queued again,
+    except a BATCH fetch still queued when the caller is INTERACTIVE: it is
+    overtaken by an INTERACTIVE one and reads the cache when its turn comes.
+    Args:
+        metrics (list): Keys of the metrics in METRICS.
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        tenant (str): Client the fetches count for, defaults to the zone client.
+        priority (str): INTERACTIVE or BATCH (see utils_fetcher).
+    Returns:
+        dict: Stat dict (title, content, type) by metric.
+    Raises:
+        KeyError: If a metric is unknown.
+    """
+    scheduler = get_fetch_scheduler()
+    tenant = tenant or scheduler.tenant_for(zone_tag)
+    stats, pending, submitted = {}, {}, []
+    for metric in metrics:
+        fetcher = METRICS[metric]
+        key = (metric, zone_tag, leq_date, periods)
+        stats[metric] = fetch_cache.get(key)
+        if stats[metric] is None:
+            with _inflight_lock:
+                future, queued = _inflight.get(key, (None, None))
+                overtaken = (
+                    future is not None
+                    and priority == INTERACTIVE
+                    and queued != INTERACTIVE
+                    and not (future.running() or future.done())
+                )
+                if future is None or overtaken:
+                    future = scheduler.submit(
+                        tenant, _cached_fetch, key, fetcher, zone_tag, leq_date, periods,
+                        priority=priority,
+                    )
+                    _inflight[key] = (future, priority)
+                    submitted.append((key, future))
+            pending[metric] = future
+    for key, future in submitted:
+        future.add_done_callback(lambda done, key=key: _settle(key, done))
+    for metric, future in pending.items():
+        stats[metric] = future.result()
+    return stats
+
+
+def fetch_metric(
+    metric: str,
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    tenant: Optional[str] = None,
+    priority: str = INTERACTIVE,
+) -> dict:
+    """
+    Runs one of the utils_cloudflare fetchers, see fetch_metrics.
+    Returns:
+        dict: The stat dict returned by the fetcher (title, content, type).
+    """
+    return fetch_metrics([metric], zone_tag, leq_date, periods, tenant, priority)[metric]
+
+
+def timeseries_payload(stat: dict, max_points: int = 500) -> dict:
+    """
+    Compact, date sorted representation of a timeseries stat.
+    Args:
+        stat (dict): Stat dict with dates as content keys.
+        max_points (int): Maximum number of points sent to the browser.
+    Returns:
+        dict: title, type, total, labels and values.
+    """
+    labels = np.array(sorted(stat["content"]))
+    values = np.array([stat["content"][label] for label in labels])
+    keep = downsample_indices([values], max_points)
+    return {
+        "title": stat["title"],
+        "type": stat["type"],
+        "total": values.sum().item() if values.size else 0,
+        "labels": labels[keep].tolist(),
+        "values": values[keep].tolist(),
+    }
+
+
+def categorical_payload(stat: dict, top: int = 10) -> dict:
+    """
+    Top categories of a stat, the rest is added up as "Other".
+    Args:
+        stat (dict): Stat dict with categories as content keys.
+        top (int): Number of categories kept.
+    Returns:
+        dict: title, type, total, labels and values.
+    """
+    items = sorted(stat["content"].items(), key=lambda x: x[1], reverse=True)
+    labels = [label for label, _ in items[:top]]
+    values = [value for _, value in items[:top]]
+    rest = sum(value for _, value in items[top:])
+    if rest:
+        labels.append("Other")
+        values.append(rest)
+    return {
+        "title": stat["title"],
+        "type": stat["type"],
+        "total": sum(value for _, value in items),
+        "labels": labels,
+        "values": values,
+    }
+
+
+def encode_body(body: bytes) -> dict:
+    """
+    Keeps a response body with its gzip version and a strong ETag.
+    Returns:
+        dict: body, gzip and etag.
+    """
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=6),
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+    }
+
+
+def encode_payload(payload: dict) -> dict:
+    """
+    Serialises a payload once, see encode_body.
+    """
+    return encode_body(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def metric_response(
+    kind: str,
+    metric: str,
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    limit: Optional[int] = None,
+) -> dict:
+    """
+    Cached, encoded JSON response for a metric.
+    Args:
+        kind (str): "timeseries", "categorical" or "derived".
+        metric (str): Key of the metric in TIMESERIES_METRICS / CATEGORICAL_METRICS
+            / utils_derived.DERIVED_METRICS.
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        limit (int): Max points (timeseries) or categories (categorical).
+    Returns:
+        dict: body, gzip and etag, see encode_payload.
+    Raises:
+        KeyError: If the metric does not exist for the given kind.
+        ValueError: If limit is below 1.
+    """
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be a positive integer.")
+    if kind == "timeseries" and metric in TIMESERIES_METRICS:
+        to_payload, default_limit = timeseries_payload, 500
+    elif kind == "categorical" and metric in CATEGORICAL_METRICS:
+        to_payload, default_limit = categorical_payload, 10
+    elif kind != "derived" or metric not in DERIVED_METRICS:
+        raise KeyError(f"{kind}/{metric}")
+
+    def build() -> dict:
+        if kind == "derived":
+            # Computed from the cached timeseries of its inputs
+            _, numerator, denominator = DERIVED_METRICS[metric]
+            stats = fetch_metrics([*numerator, denominator], zone_tag, leq_date, periods)
+            stat = derive_metrics({zone_tag: stats}, [metric])[zone_tag][metric]
+            return encode_payload(derived_payload(stat))
+        stat = fetch_metric(metric, zone_tag, leq_date, periods)
+        return encode_payload(to_payload(stat, limit or default_limit))
+
+    return response_cache.get_or_create(
+        (kind, metric, zone_tag, leq_date, periods, limit), build
+    )
+
+
+def panel_response(panel: str, zone_tag: str, leq_date: str, periods: int) -> dict:
+    """
+    Cached SVG panel drawn without matplotlib.
+    Args:
+        panel (str): Key of the panel in PANELS.
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+    Returns:
+        dict: body, gzip and etag, see encode_body.
+    Raises:
+        KeyError: If the panel is unknown.
+    """
+    renderer, metrics, extra = PANELS[panel]
+
+    def build() -> dict:
+        stats = [fetch_metric(metric, zone_tag, leq_date, periods) for metric in metrics]
+        return encode_body(renderer(*stats, *extra).encode("utf-8"))
+
+    return response_cache.get_or_create(
+        ("panel", panel, zone_tag, leq_date, periods), build
+    )
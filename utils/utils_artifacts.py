@@ -0,0 +1,77 @@
+"""
+V1 functions neccesary to store generated reports (artifacts)
+"""
+
+__version__ = "1.0.0"
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(PROJECT_ROOT, "cache", "artifacts"))
+
+
+class ArtifactStore:
+    """
+    Files on disk with a JSON sidecar holding the ETag and creation time.
+    Keys are relative paths ("<client>/<name>.pdf").
+    """
+
+    def __init__(self, directory: str = ARTIFACT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.directory, key))
+        if not path.startswith(os.path.normpath(self.directory) + os.sep):
+            raise ValueError(f"Invalid artifact key: '{key}'.")
+        return path
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: data, etag and created (epoch seconds), None if missing.
+        """
+        path = self.path(key)
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(path, "rb") as f:
+                meta["data"] = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def exists(self, key: str) -> bool:
+        """
+        Whether the artifact is stored, without reading it.
+        """
+        path = self.path(key)
+        return os.path.exists(path) and os.path.exists(f"{path}.json")
+
+    def put(self, key: str, data: bytes) -> dict:
+        """
+        Writes the artifact atomically and returns it like get().
+        """
+        path = self.path(key)
+        meta = {"etag": hashlib.sha256(data).hexdigest()[:32], "created": time.time()}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            for target, content in ((path, data), (f"{path}.json", json.dumps(meta).encode())):
+                tmp_path = f"{target}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, target)
+        return dict(meta, data=data)
+
+    def delete(self, key: str) -> None:
+        path = self.path(key)
+        for target in (path, f"{path}.json"):
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,228 @@
+"""
+V1 functions neccesary to generate the reports of every client in one run
+
+Usage:
+    python -m utils.utils_batch --date 2025-02-23 [--clients atdac,flexware]
+"""
+
+__version__ = "1.0.0"
+
+import argparse
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from .config import load_clients
+from .utils_fetcher import BATCH
+from .utils_pdf import BASE_FOLDER, build_pdf_report
+from .utils_report import client_layout, client_report_data, render_report_charts
+
+_DONE = object()
+
+
+class Stage:
+    """
+    Pool of threads that takes (client, payload) items from inbox, applies
+    func and puts (client, result) into outbox. Bounded queues between the
+    stages block the producers when a later stage falls behind (backpressure).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        workers: int,
+        inbox: queue.Queue,
+        outbox: Optional[queue.Queue],
+    ):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.started = None
+        self.finished = None
+        self._alive = workers
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self, errors: list) -> None:
+        self.started = time.perf_counter()
+        for idx in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, args=(errors,), name=f"{self.name}-{idx}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self, errors: list) -> None:
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                # Let the sibling workers see the end of the stream too
+                self.inbox.put(_DONE)
+                break
+            client, payload = item
+            start = time.perf_counter()
+            try:
+                result = self.func(client, payload)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self.busy += time.perf_counter() - start
+                errors.append({"client": client["name"], "stage": self.name, "error": str(e)})
+                continue
+            with self._lock:
+                self.items += 1
+                self.busy += time.perf_counter() - start
+            if self.outbox is not None:
+                start = time.perf_counter()
+                self.outbox.put((client, result))
+                with self._lock:
+                    self.blocked += time.perf_counter() - start
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last:
+            self.finished = time.perf_counter()
+            if self.outbox is not None:
+                self.outbox.put(_DONE)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: items, errors, busy and blocked seconds, elapsed seconds and
+            throughput (items per second of stage wall time).
+        """
+        elapsed = (self.finished or time.perf_counter()) - (self.started or 0)
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "busy_s": round(self.busy, 3),
+            "blocked_s": round(self.blocked, 3),
+            "elapsed_s": round(elapsed, 3),
+            "throughput": round(self.items / elapsed, 3) if elapsed > 0 else 0.0,
+        }
+
+
+def run_batch(
+    leq_date: str,
+    clients: Optional[list] = None,
+    output_dir: str = os.path.join(BASE_FOLDER, "reports"),
+    fetch_workers: int = 4,
+    render_workers: int = 1,
+    pdf_workers: int = 1,
+    queue_size: int = 2,
+) -> dict:
+    """
+    Generates the report of every client with a three stage pipeline:
+    fetch (utils_cloudflare) -> charts (utils_image) -> pdf (utils_pdf).
+    Network waits, rendering and PDF writing of different clients overlap.
+    Args:
+        leq_date (str): End date of the reports (inclusive) "YYYY-MM-DD".
+        clients (list): Clients (name, zone_tag, plan), defaults to load_clients().
+        output_dir (str): Folder for the "<name>_<leq_date>.pdf" files.
+        fetch_workers (int): Concurrent clients being fetched.
+        render_workers (int): Chart rendering threads.
+        pdf_workers (int): PDF assembly threads.
+        queue_size (int): Capacity of the queues between stages.
+    Returns:
+        dict: "reports" (client name -> path), "errors" and per stage "stages" stats.
+    """
+    clients = load_clients() if clients is None else clients
+    os.makedirs(output_dir, exist_ok=True)
+    creation_date = datetime.strptime(leq_date, "%Y-%m-%d").strftime("%d-%m-%y")
+    reports = {}
+
+    def fetch(client: dict, _) -> dict:
+        return client_report_data(client, leq_date, client.get("plan", 7), BATCH)
+
+    def render(client: dict, data: dict) -> dict:
+        return render_report_charts(data)
+
+    def assemble(client: dict, charts: dict) -> str:
+        document = build_pdf_report(
+            client["name"], charts, client_layout(client), creation_date=creation_date
+        )
+        path = os.path.join(output_dir, f"{client['name']}_{leq_date}.pdf")
+        with open(path, "wb") as f:
+            f.write(document)
+        reports[client["name"]] = path
+        return path
+
+    to_fetch = queue.Queue(maxsize=queue_size)
+    to_render = queue.Queue(maxsize=queue_size)
+    to_assemble = queue.Queue(maxsize=queue_size)
+    stages = [
+        Stage("fetch", fetch, fetch_workers, to_fetch, to_render),
+        Stage("render", render, render_workers, to_render, to_assemble),
+        Stage("pdf", assemble, pdf_workers, to_assemble, None),
+    ]
+    errors = []
+    start = time.perf_counter()
+    for stage in stages:
+        stage.start(errors)
+    for client in clients:
+        to_fetch.put((client, None))
+    to_fetch.put(_DONE)
+    for stage in stages:
+        stage.join()
+    return {
+        "reports": reports,
+        "errors": errors,
+        "stages": [stage.stats() for stage in stages],
+        "elapsed_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def main() -> None:
+    yesterday = (datetime.now(timezone.utc).date() - timedelta(days=1)).isoformat()
+    parser = argparse.ArgumentParser(description="Generate the reports of every client.")
+    parser.add_argument("--date", default=yesterday, help="Last day of the reports (YYYY-MM-DD).")
+    parser.add_argument("--clients", help="Comma separated client names (default: all).")
+    parser.add_argument("--output", default=os.path.join(BASE_FOLDER, "reports"))
+    parser.add_argument("--fetch-workers", type=int, default=4)
+    parser.add_argument("--pdf-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=2)
+    args = parser.parse_args()
+
+    clients = load_clients()
+    if args.clients:
+        names = set(args.clients.split(","))
+        clients = [client for client in clients if client["name"] in names]
+    result = run_batch(
+        args.date,
+        clients,
+        output_dir=args.output,
+        fetch_workers=args.fetch_workers,
+        pdf_workers=args.pdf_workers,
+        queue_size=args.queue_size,
+    )
+    for name, path in result["reports"].items():
+        print(f"{name}: {path}")
+    for error in result["errors"]:
+        print(f"ERROR {error['client']} ({error['stage']}): {error['error']}")
+    print(f"{'stage':<8} {'items':>6} {'errors':>6} {'busy s':>8} {'blocked s':>9} {'items/s':>8}")
+    for stats in result["stages"]:
+        print(
+            f"{stats['stage']:<8} {stats['items']:>6} {stats['errors']:>6} "
+            f"{stats['busy_s']:>8} {stats['blocked_s']:>9} {stats['throughput']:>8}"
+        )
+    print(f"Total: {result['elapsed_s']} s")
+
+
+if __name__ == "__main__":
+    main()
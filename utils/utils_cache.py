@@ -0,0 +1,236 @@
+"""
+V1 functions neccesary to cache rendered charts
+"""
+
+__version__ = "1.0.0"
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import matplotlib.pyplot as plt
+
+from . import utils_image
+from .utils_image import (
+    dashboard_dns,
+    dashboard_pie_bar,
+    dashboard_ratio_graph,
+    dashboard_security,
+    dashboard_stat_graph,
+    dashboard_stat_test,
+    dashboard_table_map,
+    dashboard_zone_table,
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHART_CACHE_DIR = os.getenv(
+    "CHART_CACHE_DIR", os.path.join(PROJECT_ROOT, "cache", "charts")
+)
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", 256 * 1024**2))
+
+# Output settings for each consumer of the charts.
+RENDER_PROFILES = {
+    "pdf": {"dpi": 300, "fmt": "png"},
+    "web": {"dpi": 100, "fmt": "png"},
+    "svg": {"dpi": 72, "fmt": "svg"},
+}
+
+CHARTS = {
+    "stat_graph": dashboard_stat_graph,
+    "pie_bar": dashboard_pie_bar,
+    "table_map": dashboard_table_map,
+    "stat": dashboard_stat_test,
+    "ratio_graph": dashboard_ratio_graph,
+    "security": dashboard_security,
+    "dns": dashboard_dns,
+    "zone_table": dashboard_zone_table,
+}
+
+# pyplot keeps global state, only one figure can be drawn at a time.
+_RENDER_LOCK = threading.Lock()
+_default_cache = None
+
+
+def chart_key(chart_type: str, args: tuple, style: str, profile: str) -> str:
+    """
+    Builds the content address of a chart.
+    Args:
+        chart_type (str): Key of the chart in CHARTS.
+        args (tuple): Positional arguments passed to the dashboard function.
+        style (str): Matplotlib style used for the render.
+        profile (str): Key of the render profile in RENDER_PROFILES.
+    Returns:
+        str: SHA-256 hex digest of the canonical chart description.
+    """
+    description = {
+        "chart": chart_type,
+        "args": args,
+        "style": style,
+        "profile": RENDER_PROFILES[profile],
+        "version": utils_image.__version__,
+    }
+    encoded = json.dumps(
+        description, sort_keys=True, separators=(",", ":"), default=str
+    ).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ChartCache:
+    """
+    Disk cache of encoded charts with LRU eviction.
+    Entries are stored as "<key>.<fmt>" inside the cache directory, the access
+    order survives restarts through the file modification times.
+    """
+
+    def __init__(
+        self, directory: str = CHART_CACHE_DIR, max_bytes: int = CHART_CACHE_MAX_BYTES
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, key: str, fmt: str = "png") -> Optional[bytes]:
+        """
+        Returns the cached chart or None, updating the hit/miss counters.
+        """
+        name = f"{key}.{fmt}"
+        with self._lock:
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(name), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(name))
+            except OSError:
+                self._size -= self._entries.pop(name)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes, fmt: str = "png") -> None:
+        """
+        Stores a chart and evicts the least recently used ones over max_bytes.
+        """
+        name = f"{key}.{fmt}"
+        with self._lock:
+            tmp_path = self._path(f".{name}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(name))
+            self._size += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old_name))
+                except FileNotFoundError:
+                    pass
+
+    def clear(self) -> None:
+        """
+        Removes every entry and resets the statistics.
+        """
+        with self._lock:
+            for name in self._entries:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: hits, misses, hit_rate, evictions, entries and bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+def get_chart_cache() -> ChartCache:
+    """
+    Returns the process wide chart cache, created on first use.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ChartCache()
+    return _default_cache
+
+
+def render_chart(
+    chart_type: str,
+    *args,
+    style: str = "default",
+    profile: str = "pdf",
+    cache: Optional[ChartCache] = None,
+) -> bytes:
+    """
+    Renders one of the dashboard charts to encoded bytes, reusing the cached
+    image when the same data, chart, style and profile were rendered before.
+    Args:
+        chart_type (str): Key of the chart in CHARTS ("stat_graph", "pie_bar", ...).
+        *args: Positional arguments of the dashboard function (stat dicts, labels).
+        style (str): Matplotlib style applied while rendering.
+        profile (str): Key of the render profile in RENDER_PROFILES.
+        cache (ChartCache): Cache to use, defaults to get_chart_cache().
+    Returns:
+        bytes: The encoded image.
+    Raises:
+        ValueError: If the chart type or profile is unknown.
+    """
+    if chart_type not in CHARTS:
+        raise ValueError(f"Unknown chart type: '{chart_type}'.")
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: '{profile}'.")
+    cache = cache if cache is not None else get_chart_cache()
+    settings = RENDER_PROFILES[profile]
+    key = chart_key(chart_type, args, style, profile)
+    data = cache.get(key, settings["fmt"])
+    if data is not None:
+        return data
+    buffer = io.BytesIO()
+    with _RENDER_LOCK, plt.style.context(style):
+        CHARTS[chart_type](
+            *args, output=buffer, dpi=settings["dpi"], fmt=settings["fmt"]
+        )
+    data = buffer.getvalue()
+    cache.put(key, data, settings["fmt"])
+    return data
@@ -0,0 +1,209 @@
+"""
+V1 functions neccesary to bucket the hourly metrics into the local days of a client
+"""
+
+__version__ = "1.0.0"
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from .utils_api import CATEGORICAL_METRICS, fetch_cache
+from .utils_cloudflare import execute_query
+from .utils_compare import METRIC_FIELDS, metric_selection
+from .utils_fetcher import INTERACTIVE, get_fetch_scheduler
+from .utils_store import UNIQUE_METRICS
+
+HOURLY_LIMIT = 10000  # httpRequests1hGroups rows per query
+CALENDAR_PERIODS = ("day", "week")
+
+
+def client_timezone(client: dict) -> Optional[str]:
+    """
+    IANA timezone of a client ("timezone" in clients.json), None for UTC.
+    Raises:
+        ValueError: Unknown timezone.
+    """
+    name = client.get("timezone")
+    if not name or name == "UTC":
+        return None
+    try:
+        ZoneInfo(name)
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Unknown timezone: '{name}'.") from e
+    return name
+
+
+def local_days(leq_date: str, periods: int) -> list:
+    """
+    Dates of the window, oldest first.
+    """
+    if periods < 1:
+        raise ValueError("Periods must be a positive integer.")
+    last = date.fromisoformat(leq_date)
+    return [last - timedelta(days=i) for i in range(periods - 1, -1, -1)]
+
+
+def bucket_bounds(leq_date: str, periods: int, tz: str, period: str = "day") -> tuple:
+    """
+    Local days (or weeks, Monday to Sunday) of a window as UTC instants. A
+    local midnight is converted once per day, so DST days get their 23 or
+    25 hours.
+    Args:
+        leq_date (str): Last local day (inclusive) "YYYY-MM-DD".
+        periods (int): Number of local days.
+        tz (str): IANA timezone.
+        period (str): "day" or "week", the first and last weeks can be partial.
+    Returns:
+        tuple: Bucket labels (first local day of each bucket) and the UTC
+        start of every bucket plus the end of the last one, as datetime64[s].
+    """
+    if period not in CALENDAR_PERIODS:
+        raise ValueError(f"Unknown period: '{period}'.")
+    zone = ZoneInfo(tz)
+    days = local_days(leq_date, periods)
+    days.append(days[-1] + timedelta(days=1))
+    starts = [
+        day for i, day in enumerate(days)
+        if period == "day" or i == 0 or i == len(days) - 1 or day.weekday() == 0
+    ]
+    bounds = np.array(
+        [
+            datetime(day.year, day.month, day.day, tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+            for day in starts
+        ],
+        dtype="datetime64[s]",
+    )
+    return [day.isoformat() for day in starts[:-1]], bounds
+
+
+def rebucket(timestamps: np.ndarray, values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """
+    Adds up hourly values into buckets, every bucket present (0 when no hour
+    falls in it). An hour goes to the bucket it starts in.
+    Args:
+        timestamps (np.ndarray): UTC start of each hour, datetime64.
+        values (np.ndarray): (metrics x hours) values, NaN for missing.
+        bounds (np.ndarray): Bucket starts plus the end of the last, see bucket_bounds.
+    Returns:
+        np.ndarray: (metrics x buckets) sums.
+    """
+    index = np.searchsorted(bounds, timestamps, side="right") - 1
+    inside = (index >= 0) & (index < len(bounds) - 1)
+    totals = np.zeros((values.shape[0], len(bounds) - 1))
+    np.add.at(totals.T, index[inside], np.nan_to_num(values[:, inside]).T)
+    return totals
+
+
+def hourly_query(metrics: list) -> str:
+    """
+    GraphQL document requesting the hourly metrics of a zone between the
+    instants $since (inclusive) and $until (exclusive).
+    """
+    return f"""
+        query GetZoneHourly($zoneTag: String!, $since: Time!, $until: Time!) {{
+            viewer {{
+                zones(filter: {{zoneTag_in: [$zoneTag]}}) {{
+                    httpRequests1hGroups(limit: {HOURLY_LIMIT}, filter: {{datetime_geq: $since, datetime_lt: $until}}) {{
+                        {metric_selection(metrics, "datetime")}
+                    }}
+                }}
+            }}
+        }}
+    """
+
+
+def get_local_metrics(
+    zone_tag: str, leq_date: str, periods: int, tz: str, metrics: list, period: str = "day"
+) -> dict:
+    """
+    Retrieve hourly metrics and add them up into the local days (or weeks)
+    of a timezone.
+    Args:
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): Last local day (inclusive) "YYYY-MM-DD".
+        periods (int): Number of local days.
+        tz (str): IANA timezone.
+        metrics (list): Time series keys of utils_compare.METRIC_FIELDS,
+            unique counts (visits) cannot be added up from hours.
+        period (str): "day" or "week".
+    Returns:
+        dict: Stat dict by metric, content sorted and with every bucket.
+    Raises:
+        ValueError: Categorical or unique metric, or a window over HOURLY_LIMIT hours.
+    """
+    invalid = [metric for metric in metrics if metric in CATEGORICAL_METRICS or metric in UNIQUE_METRICS]
+    if invalid:
+        raise ValueError(f"Not available per local day: {', '.join(invalid)}")
+    labels, bounds = bucket_bounds(leq_date, periods, tz, period)
+    if (bounds[-1] - bounds[0]) / np.timedelta64(1, "h") > HOURLY_LIMIT:
+        raise ValueError(f"Local windows are limited to {HOURLY_LIMIT} hours.")
+    variables = {
+        "zoneTag": zone_tag,
+        "since": f"{bounds[0]}Z",
+        "until": f"{bounds[-1]}Z",
+    }
+    response = execute_query(hourly_query(metrics), variables)
+    try:
+        zones = response["data"]["viewer"]["zones"]
+        groups = (zones[0]["httpRequests1hGroups"] or []) if zones else []
+        timestamps = np.array(
+            [group["dimensions"]["datetime"].rstrip("Z") for group in groups], dtype="datetime64[s]"
+        )
+        values = np.array(
+            [[METRIC_FIELDS[metric][4](group) for group in groups] for metric in metrics], dtype=float
+        ).reshape(len(metrics), len(groups))
+    except (KeyError, IndexError, TypeError) as e:
+        raise Exception(f"Error processing response for {zone_tag}: {e}")
+    totals = rebucket(timestamps, values, bounds)
+    return {
+        metric: {
+            "title": METRIC_FIELDS[metric][2],
+            "content": dict(zip(labels, totals[m].tolist())),
+            "type": METRIC_FIELDS[metric][3],
+        }
+        for m, metric in enumerate(metrics)
+    }
+
+
+def fetch_local_metrics(
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    tz: str,
+    metrics: list,
+    tenant: Optional[str] = None,
+    priority: str = INTERACTIVE,
+) -> dict:
+    """
+    get_local_metrics (days) through the shared fetch cache and the fair
+    fetch scheduler, one query for all the metrics.
+    """
+    key = ("local", zone_tag, tz, tuple(metrics), leq_date, periods)
+    stats = fetch_cache.get(key)
+    if stats is None:
+        scheduler = get_fetch_scheduler()
+        stats = scheduler.call(
+            tenant or scheduler.tenant_for(zone_tag),
+            get_local_metrics, zone_tag, leq_date, periods, tz, metrics,
+            priority=priority,
+        )
+        fetch_cache.put(key, stats)
+    return stats
+
+
+def fill_days(stat: dict, leq_date: str, periods: int, missing: Optional[float] = 0) -> dict:
+    """
+    Daily stat with every day of the window, sorted, the missing ones as
+    missing (0, or None for ratios left as gaps), so the series of a chart
+    line up.
+    Returns:
+        dict: A new stat dict.
+    """
+    content = stat["content"]
+    days = [day.isoformat() for day in local_days(leq_date, periods)]
+    if missing is None:
+        return {**stat, "content": {day: content.get(day) for day in days}}
+    return {**stat, "content": {day: content.get(day) or missing for day in days}}
@@ -5,9 +5,57 @@ V5 functions neccesary to run the Cloudflare API
 __version__ = "5.0.0"
 
 
+import threading
 from datetime import datetime, timedelta
+from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from .utils_credentials import Credential, get_credentials
+from .utils_topk import TOPK_FACTOR, TopK
+
+HTTP_POOL_SIZE = 16  # keep-alive connections to the Cloudflare API
+EVENTS_PAGE_SIZE = 10000  # max page size of the adaptive datasets
+DNS_MIN_WINDOW = timedelta(hours=1)  # smallest window a full DNS page is split to
+# Firewall actions counted as mitigated
+MITIGATION_ACTIONS = {"block", "challenge", "jschallenge", "managed_challenge", "drop"}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class DatasetUnavailable(Exception):
+    """
+    Raised when the zone plan or the token has no access to a GraphQL dataset.
+    """
+
+
+def _access_errors(response: dict) -> list:
+    """
+    GraphQL errors of a response denying access to a dataset ("authz").
+    """
+    return [
+        error for error in response.get("errors") or []
+        if (error.get("extensions") or {}).get("code") == "authz"
+        or "does not have access" in error.get("message", "")
+    ]
+
+
+def get_session() -> requests.Session:
+    """
+    HTTP session shared by every query, reusing the TLS connections.
+    Returns:
+        requests.Session: The process session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
 
 
 def range_generator(leq_date: str, periods: int) -> dict:
@@ -39,21 +87,27 @@ def range_generator(leq_date: str, periods: int) -> dict:
         ) from e
 
 
-def execute_query(query: str, variables: dict) -> None:
+def execute_query(query: str, variables: dict, credential: Optional[Credential] = None) -> dict:
     """
     Execute GraphQL query.
     Args:
         query (str): GraphQL query string.
         variables (dict): Variables for the query.
+        credential (Credential): Token to use, defaults to the one of the
+            variables "zoneTag" in the credential pool. Waits for its rate budget.
+    Returns:
+        dict: The JSON response.
     """
+    credential = credential or get_credentials().for_zone(variables.get("zoneTag"))
+    credential.acquire()
     url = "https://api.cloudflare.com/client/v4/graphql"
     headers = {
-        "Authorization": f"Bearer {TOKEN}",
+        "Authorization": f"Bearer {credential.token}",
         "Content-Type": "application/json",
         "Accept": "application/json",
     }
     payload = {"query": query, "variables": variables}
-    response = requests.post(url, headers=headers, json=payload)
+    response = get_session().post(url, headers=headers, json=payload)
     if response.status_code == 200:
         return response.json()
     else:
@@ -72,7 +126,7 @@ def get_accounts(token: str) -> dict:
     """
     url = "https://api.cloudflare.com/client/v4/accounts"
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers)
     if response.status_code != 200:
         raise Exception(f"HTTP Error {response.status_code}: {response.text}")
     data = response.json()
@@ -94,7 +148,7 @@ def get_zones(token: str) -> dict:
     """
     url = "https://api.cloudflare.com/client/v4/zones"
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers)
     if response.status_code != 200:
         raise Exception(f"HTTP Error {response.status_code}: {response.text}")
     data = response.json()
@@ -801,6 +855,218 @@ def get_fivexx_errors(zone_tag: str, leq_date: str, periods: int) -> dict:
         raise Exception(f"Error processing response for 5xx errors: {e}")
 
 
+def get_security_events(zone_tag: str, leq_date: str, periods: int, top: int = 10) -> dict:
+    """
+    Firewall events of the range, aggregated into top tables while the pages
+    stream in. Each day is paged newest first with a datetime cursor, only
+    one page and the TopK counters are kept in memory.
+    Args:
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        top (int): Rows of every table.
+    Returns:
+        dict: Stat dict, content with "total", "mitigated" and the (item,
+        count) lists "actions", "countries", "ips", "rules", "hosts" and "paths".
+    Raises:
+        DatasetUnavailable: If the zone plan or the token has no firewall analytics.
+    """
+    range_generated = range_generator(leq_date, periods)
+    query = """
+        query GetSecurityEvents($zoneTag: String!, $since: Time!, $until: Time!, $limit: Int!) {
+            viewer {
+                zones(filter: {zoneTag_in: [$zoneTag]}) {
+                    firewallEventsAdaptive(
+                        filter: {datetime_geq: $since, datetime_leq: $until},
+                        limit: $limit,
+                        orderBy: [datetime_DESC]
+                    ) {
+                        action
+                        clientCountryName
+                        clientIP
+                        ruleId
+                        source
+                        clientRequestHTTPHost
+                        clientRequestPath
+                        datetime
+                    }
+                }
+            }
+        }
+    """
+    fields = {
+        "actions": lambda event: event["action"],
+        "countries": lambda event: event["clientCountryName"],
+        "ips": lambda event: event["clientIP"],
+        "rules": lambda event: f"{event['source']}:{event['ruleId']}" if event["ruleId"] else event["source"],
+        "hosts": lambda event: event["clientRequestHTTPHost"],
+        "paths": lambda event: event["clientRequestPath"],
+    }
+    tables = {name: TopK(top * TOPK_FACTOR) for name in fields}
+    mitigated = 0
+    day = datetime.strptime(range_generated["geq_date"][:10], "%Y-%m-%d")
+    for _ in range(periods):
+        since = day.strftime("%Y-%m-%dT00:00:00Z")
+        cursor = day.strftime("%Y-%m-%dT23:59:59Z")
+        day += timedelta(days=1)
+        while True:
+            variables = {
+                "zoneTag": zone_tag,
+                "since": since,
+                "until": cursor,
+                "limit": EVENTS_PAGE_SIZE,
+            }
+            response = execute_query(query, variables)
+            denied = _access_errors(response)
+            if denied:
+                raise DatasetUnavailable(f"No firewall analytics for {zone_tag}: {denied[0].get('message')}")
+            try:
+                zones = response["data"]["viewer"]["zones"]
+                if not zones:
+                    raise ValueError("No security event data available in the response.")
+                events = zones[0]["firewallEventsAdaptive"] or []
+            except (KeyError, IndexError, TypeError) as e:
+                raise Exception(f"Error processing response for security events: {e} {response.get('errors', '')}")
+            full = len(events) == EVENTS_PAGE_SIZE
+            last = events[-1]["datetime"] if events else None
+            if full:
+                # The events of the last second may continue on the next
+                # page, they are counted there. A page within one second is
+                # counted as is and the rest of that second skipped.
+                newer = [event for event in events if event["datetime"] != last]
+                if newer:
+                    events = newer
+                else:
+                    last = (datetime.strptime(last, "%Y-%m-%dT%H:%M:%SZ") - timedelta(seconds=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            for event in events:
+                mitigated += event["action"] in MITIGATION_ACTIONS
+                for name, field in fields.items():
+                    tables[name].add(field(event))
+            if not full:
+                break
+            cursor = last
+    content = {
+        "total": tables["actions"].total,
+        "mitigated": mitigated,
+        **{name: table.most_common(top) for name, table in tables.items()},
+    }
+    return {"title": "Security Events", "content": content, "type": "numeric"}
+
+
+def get_dns_analytics(zone_tag: str, leq_date: str, periods: int, top: int = 10) -> dict:
+    """
+    DNS queries of the range: exact counts per day and top tables of the
+    query names, record types, response codes and source IPs. The grouped
+    rows are requested one day at a time, a day (or half) whose page comes
+    back full is split in two, and every page is folded into TopK counters
+    instead of being kept.
+    Args:
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        top (int): Rows of every table.
+    Returns:
+        dict: Stat dict, content with "total", "daily" ({date: queries}) and
+        the (item, count) lists "names", "types", "codes" and "sources".
+    Raises:
+        DatasetUnavailable: If the zone plan or the token has no DNS analytics.
+    """
+    range_generated = range_generator(leq_date, periods)
+    daily_query = """
+        query GetDnsDaily($zoneTag: String!, $since: Date!, $until: Date!) {
+            viewer {
+                zones(filter: {zoneTag_in: [$zoneTag]}) {
+                    dnsAnalyticsAdaptiveGroups(
+                        filter: {date_geq: $since, date_leq: $until},
+                        limit: 1000
+                    ) {
+                        count
+                        dimensions {
+                            date
+                        }
+                    }
+                }
+            }
+        }
+    """
+    window_query = """
+        query GetDnsTop($zoneTag: String!, $since: Time!, $until: Time!, $limit: Int!) {
+            viewer {
+                zones(filter: {zoneTag_in: [$zoneTag]}) {
+                    dnsAnalyticsAdaptiveGroups(
+                        filter: {datetime_geq: $since, datetime_lt: $until},
+                        limit: $limit,
+                        orderBy: [count_DESC]
+                    ) {
+                        count
+                        dimensions {
+                            queryName
+                            queryType
+                            responseCode
+                            sourceIP
+                        }
+                    }
+                }
+            }
+        }
+    """
+    fields = {
+        "names": "queryName",
+        "types": "queryType",
+        "codes": "responseCode",
+        "sources": "sourceIP",
+    }
+
+    def groups(query: str, variables: dict) -> list:
+        response = execute_query(query, variables)
+        denied = _access_errors(response)
+        if denied:
+            raise DatasetUnavailable(f"No DNS analytics for {zone_tag}: {denied[0].get('message')}")
+        try:
+            zones = response["data"]["viewer"]["zones"]
+            if not zones:
+                raise ValueError("No DNS data available in the response.")
+            return zones[0]["dnsAnalyticsAdaptiveGroups"] or []
+        except (KeyError, IndexError, TypeError) as e:
+            raise Exception(f"Error processing response for DNS analytics: {e} {response.get('errors', '')}")
+
+    variables = {
+        "zoneTag": zone_tag,
+        "since": range_generated["geq_date"][:10],
+        "until": range_generated["leq_date"][:10],
+    }
+    daily = {
+        group["dimensions"]["date"]: group["count"]
+        for group in groups(daily_query, variables)
+    }
+
+    tables = {name: TopK(top * TOPK_FACTOR) for name in fields}
+    start = datetime.strptime(variables["since"], "%Y-%m-%d")
+    windows = [(start + timedelta(days=day), start + timedelta(days=day + 1)) for day in range(periods)]
+    while windows:
+        since, until = windows.pop()
+        rows = groups(window_query, {
+            "zoneTag": zone_tag,
+            "since": since.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "until": until.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "limit": EVENTS_PAGE_SIZE,
+        })
+        if len(rows) == EVENTS_PAGE_SIZE and until - since > DNS_MIN_WINDOW:
+            middle = since + (until - since) / 2
+            windows.extend([(since, middle), (middle, until)])
+            continue
+        # A full page of the smallest window keeps its largest groups only
+        for row in rows:
+            for name, field in fields.items():
+                tables[name].add(row["dimensions"][field], row["count"])
+    content = {
+        "total": sum(daily.values()),
+        "daily": daily,
+        **{name: table.most_common(top) for name, table in tables.items()},
+    }
+    return {"title": "DNS Queries", "content": content, "type": "numeric"}
+
+
 # def get_account_settings(token: str, account_id: str):
 #     """
 #     Get basic stats from the acocunt
@@ -0,0 +1,401 @@
+"""
+V1 functions neccesary to compare a report window with the previous one
+"""
+
+__version__ = "1.0.0"
+
+from datetime import date, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+
+from .utils_api import CATEGORICAL_METRICS, encode_payload, fetch_cache, response_cache
+from .utils_cloudflare import execute_query, range_generator
+from .utils_fetcher import INTERACTIVE, get_fetch_scheduler
+from .utils_store import MetricStore
+
+# Metrics of dashboard_stat_graph and the per country tables
+COMPARE_METRICS = [
+    "requests",
+    "cached_requests",
+    "bandwidth",
+    "cached_bandwidth",
+    "visits",
+    "requests_per_location",
+    "bandwidth_per_location",
+]
+
+
+def _value(block: str, field: str) -> Callable:
+    return lambda group: group[block][field]
+
+
+def _status_total(low: int, high: int) -> Callable:
+    return lambda group: sum(
+        status["requests"]
+        for status in group["sum"]["responseStatusMap"]
+        if low <= int(status["edgeResponseStatus"]) < high
+    )
+
+
+def _breakdown(field: str, key: str, value: str) -> Callable:
+    return lambda group: ((item[key], item[value]) for item in group["sum"][field])
+
+
+# httpRequests1dGroups selection of every metric (same data as its
+# utils_cloudflare fetcher): block, selected fields, title, type and the value
+# of one daily group, (category, value) pairs for the categorical metrics.
+METRIC_FIELDS = {
+    "requests": ("sum", "requests", "Requests", "numeric", _value("sum", "requests")),
+    "bandwidth": ("sum", "bytes", "Bandwidth", "byte", _value("sum", "bytes")),
+    "visits": ("uniq", "uniques", "Visits", "numeric", _value("uniq", "uniques")),
+    "views": ("sum", "pageViews", "Views", "numeric", _value("sum", "pageViews")),
+    "cached_requests": ("sum", "cachedRequests", "Cached Requests", "numeric", _value("sum", "cachedRequests")),
+    "cached_bandwidth": ("sum", "cachedBytes", "Cached Bandwidth", "byte", _value("sum", "cachedBytes")),
+    "encrypted_requests": ("sum", "encryptedRequests", "Encrypted Requests", "numeric", _value("sum", "encryptedRequests")),
+    "encrypted_bandwidth": ("sum", "encryptedBytes", "Encrypted Bandwidth", "byte", _value("sum", "encryptedBytes")),
+    "fourxx_errors": ("sum", "responseStatusMap { requests edgeResponseStatus }", "400 Errors", "numeric", _status_total(400, 500)),
+    "fivexx_errors": ("sum", "responseStatusMap { requests edgeResponseStatus }", "500 Errors", "numeric", _status_total(500, 600)),
+    "requests_per_location": ("sum", "countryMap { clientCountryName requests }", "Requests per country", "numeric", _breakdown("countryMap", "clientCountryName", "requests")),
+    "bandwidth_per_location": ("sum", "countryMap { clientCountryName bytes }", "Bandwidth per country", "byte", _breakdown("countryMap", "clientCountryName", "bytes")),
+    "http_versions": ("sum", "clientHTTPVersionMap { requests clientHTTPProtocol }", "HTTP Versions", "numeric", _breakdown("clientHTTPVersionMap", "clientHTTPProtocol", "requests")),
+    "ssl_traffic": ("sum", "clientSSLMap { requests clientSSLProtocol }", "SSL Versions", "numeric", _breakdown("clientSSLMap", "clientSSLProtocol", "requests")),
+    "content_type": ("sum", "contentTypeMap { requests edgeResponseContentTypeName }", "Content Type", "numeric", _breakdown("contentTypeMap", "edgeResponseContentTypeName", "requests")),
+}
+
+
+def previous_window(leq_date: str, periods: int) -> str:
+    """
+    End date of the window of the same length right before leq_date's.
+    """
+    return (date.fromisoformat(leq_date) - timedelta(days=periods)).isoformat()
+
+
+def metric_selection(metrics: list, dimension: str = "date") -> str:
+    """
+    httpRequests1dGroups selection of the metrics, each field requested once.
+    dimension "datetime" selects httpRequests1hGroups rows.
+    """
+    blocks = {"sum": [], "uniq": []}
+    for metric in metrics:
+        block, field = METRIC_FIELDS[metric][:2]
+        if field not in blocks[block]:
+            blocks[block].append(field)
+    return f"dimensions {{ {dimension} }} " + " ".join(
+        f"{block} {{ {' '.join(fields)} }}" for block, fields in blocks.items() if fields
+    )
+
+
+# Variables of the start and end dates of each window of comparison_query
+WINDOW_VARIABLES = {"current": ("since", "until"), "previous": ("prevSince", "prevUntil")}
+
+
+def comparison_query(metrics: list, previous_metrics: Optional[list] = None) -> str:
+    """
+    GraphQL document requesting the metrics for the current ($since, $until)
+    and previous ($prevSince, $prevUntil) windows under the aliases
+    "current" and "previous". previous_metrics (defaults to metrics) are
+    requested for the previous window, none leaves it out.
+    """
+    windows = {"current": metrics, "previous": metrics if previous_metrics is None else previous_metrics}
+    windows = {window: selected for window, selected in windows.items() if selected}
+    arguments = "".join(
+        f", ${since}: String!, ${until}: String!" for since, until in map(WINDOW_VARIABLES.get, windows)
+    )
+    blocks = "".join(
+        f"""
+                    {window}: httpRequests1dGroups(limit: 1000, filter: {{date_geq: ${WINDOW_VARIABLES[window][0]}, date_leq: ${WINDOW_VARIABLES[window][1]}}}) {{
+                        {metric_selection(selected)}
+                    }}"""
+        for window, selected in windows.items()
+    )
+    return f"""
+        query GetComparison($zoneTag: String!{arguments}) {{
+            viewer {{
+                zones(filter: {{zoneTag_in: [$zoneTag]}}) {{{blocks}
+                }}
+            }}
+        }}
+    """
+
+
+def parse_groups(metric: str, groups: list) -> dict:
+    """
+    Stat dict of a metric from httpRequests1dGroups rows, categorical
+    metrics added up over the days and not truncated.
+    """
+    _, _, title, stat_type, extract = METRIC_FIELDS[metric]
+    if metric in CATEGORICAL_METRICS:
+        content = {}
+        for group in groups:
+            for category, value in extract(group):
+                content[category] = content.get(category, 0) + value
+    else:
+        content = {group["dimensions"]["date"]: extract(group) for group in groups}
+    return {"title": title, "content": content, "type": stat_type}
+
+
+def get_comparison(
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    metrics: list,
+    previous_metrics: Optional[list] = None,
+) -> dict:
+    """
+    Retrieve the metrics of a window and of the previous one in one query.
+    Args:
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        metrics (list): Keys of METRIC_FIELDS.
+        previous_metrics (list): Metrics of the previous window, defaults to
+            metrics, an empty list only requests the current window.
+    Returns:
+        dict: "current" and "previous" (when requested), each a stat dict by metric.
+    """
+    windows = {"current": metrics, "previous": metrics if previous_metrics is None else previous_metrics}
+    windows = {window: selected for window, selected in windows.items() if selected}
+    ranges = {
+        "current": range_generator(leq_date, periods),
+        "previous": range_generator(previous_window(leq_date, periods), periods),
+    }
+    variables = {"zoneTag": zone_tag}
+    for window in windows:
+        since, until = WINDOW_VARIABLES[window]
+        variables[since] = ranges[window]["geq_date"][:10]
+        variables[until] = ranges[window]["leq_date"][:10]
+    response = execute_query(comparison_query(metrics, previous_metrics), variables)
+    try:
+        zones = response["data"]["viewer"]["zones"]
+        if not zones:
+            raise ValueError("No comparison data available in the response.")
+        return {
+            window: {metric: parse_groups(metric, zones[0][window] or []) for metric in selected}
+            for window, selected in windows.items()
+        }
+    except (KeyError, IndexError, TypeError) as e:
+        raise Exception(f"Error processing response: {e}")
+
+
+def _stored_window(
+    store: MetricStore, zone_tag: str, leq_date: str, periods: int, metrics: list
+) -> Optional[dict]:
+    """
+    Stat dicts of the window from the store, None unless every day of every
+    metric is stored. The days stored are counted on the rollups
+    (MetricStore.window) before any daily row is read. The store only holds
+    timeseries metrics.
+    """
+    window = range_generator(leq_date, periods)
+    geq, leq = window["geq_date"][:10], window["leq_date"][:10]
+    for metric in metrics:
+        stored = store.window(metric, geq, leq, zone_tags=[zone_tag]).get(zone_tag)
+        if stored is None or stored["days"] < periods:
+            return None
+    stats = {}
+    for metric in metrics:
+        content = store.daily_values(zone_tag, metric, geq, leq)
+        if len(content) < periods:
+            return None
+        title, stat_type = METRIC_FIELDS[metric][2:4]
+        stats[metric] = {"title": title, "content": content, "type": stat_type}
+    return stats
+
+
+def fetch_comparison(
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    metrics: Optional[list] = None,
+    store: Optional[MetricStore] = None,
+    priority: str = INTERACTIVE,
+) -> dict:
+    """
+    Metrics of a window and of the previous one with a single API query: the
+    timeseries of the previous window come from the store when it holds
+    every day of them, and only the categorical metrics of the previous
+    window are requested with the current one (the cached timeseries of the
+    current window are not requested again). Otherwise both windows are
+    requested in one aliased document.
+    Args:
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        metrics (list): Keys of METRIC_FIELDS, defaults to COMPARE_METRICS.
+        store (MetricStore): Daily snapshots, None always queries the API.
+        priority (str): INTERACTIVE or BATCH (see utils_fetcher).
+    Returns:
+        dict: "current" and "previous", each a stat dict by metric.
+    """
+    metrics = list(metrics or COMPARE_METRICS)
+    scheduler = get_fetch_scheduler()
+    tenant = scheduler.tenant_for(zone_tag)
+    timeseries = [metric for metric in metrics if metric not in CATEGORICAL_METRICS]
+    categorical = [metric for metric in metrics if metric in CATEGORICAL_METRICS]
+    previous_date = previous_window(leq_date, periods)
+    previous = store and timeseries and _stored_window(store, zone_tag, previous_date, periods, timeseries)
+    if not previous:
+        return scheduler.call(
+            tenant, get_comparison, zone_tag, leq_date, periods, metrics, priority=priority
+        )
+    # The categorical stats of the fetch cache are truncated, only the
+    # timeseries are taken from it
+    current = {}
+    for metric in timeseries:
+        stat = fetch_cache.get((metric, zone_tag, leq_date, periods))
+        if stat is not None:
+            current[metric] = stat
+    missing = [metric for metric in timeseries if metric not in current]
+    if missing or categorical:
+        query = scheduler.call(
+            tenant, get_comparison, zone_tag, leq_date, periods, missing + categorical, categorical,
+            priority=priority,
+        )
+        current.update(query["current"])
+        previous.update(query.get("previous", {}))
+    return {
+        "current": {metric: current[metric] for metric in metrics},
+        "previous": {metric: previous[metric] for metric in metrics},
+    }
+
+
+def _percent(delta: np.ndarray, base: np.ndarray) -> np.ndarray:
+    """
+    delta / base in %, NaN where the base is 0 or missing.
+    """
+    out = np.full(delta.shape, np.nan)
+    np.divide(delta * 100, base, out=out, where=np.isfinite(base) & (base != 0))
+    return out
+
+
+def _listed(values: np.ndarray) -> list:
+    """
+    JSON friendly list, NaN as None.
+    """
+    return [None if np.isnan(value) else round(float(value), 2) for value in values]
+
+
+def compare_timeseries(current: dict, previous: dict, metrics: list, leq_date: str, periods: int) -> dict:
+    """
+    Day by day and total deltas of timeseries metrics, all metrics in one
+    (metrics x days) array operation. Day d of the window is compared with
+    day d - periods of the previous window, a day missing from either side
+    is NaN.
+    Args:
+        current (dict): Stat dict by metric of the window.
+        previous (dict): Stat dict by metric of the previous window.
+        metrics (list): Timeseries metrics to compare.
+        leq_date (str): End date of the window (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the window.
+    Returns:
+        dict: Per metric: title, type, dates, total, previous_total, delta,
+        percent and the daily deltas and percents.
+    """
+    if not metrics:
+        return {}
+    last = date.fromisoformat(leq_date)
+    offsets = range(periods - 1, -1, -1)
+    dates = [(last - timedelta(days=offset)).isoformat() for offset in offsets]
+    previous_dates = [(last - timedelta(days=offset + periods)).isoformat() for offset in offsets]
+    matrices = []
+    for stats, days in ((current, dates), (previous, previous_dates)):
+        matrix = np.full((len(metrics), periods), np.nan)
+        for row, metric in enumerate(metrics):
+            content = stats[metric]["content"]
+            matrix[row] = [np.nan if content.get(day) is None else content[day] for day in days]
+        matrices.append(matrix)
+    now, before = matrices
+    daily_delta = now - before
+    daily_percent = _percent(daily_delta, before)
+    totals = np.nansum(now, axis=1)
+    previous_totals = np.nansum(before, axis=1)
+    delta = totals - previous_totals
+    percent = _percent(delta, np.where(np.isnan(before).all(axis=1), np.nan, previous_totals))
+
+    result = {}
+    for row, metric in enumerate(metrics):
+        result[metric] = {
+            "title": current[metric]["title"],
+            "type": current[metric]["type"],
+            "dates": dates,
+            "total": float(totals[row]),
+            "previous_total": float(previous_totals[row]),
+            "delta": float(delta[row]),
+            "percent": _listed(percent[row : row + 1])[0],
+            "daily_delta": _listed(daily_delta[row]),
+            "daily_percent": _listed(daily_percent[row]),
+        }
+    return result
+
+
+def compare_categorical(current: dict, previous: dict, top: int = 10) -> dict:
+    """
+    Deltas of a categorical stat (countries, protocols) for the top
+    categories of the window.
+    Args:
+        current (dict): Stat dict of the window.
+        previous (dict): Stat dict of the previous window.
+        top (int): Number of categories kept.
+    Returns:
+        dict: title, type, labels, current, previous, delta and percent.
+    """
+    labels = sorted(current["content"], key=current["content"].get, reverse=True)[:top]
+    now = np.array([current["content"][label] for label in labels], dtype=float)
+    before = np.array([previous["content"].get(label, 0) for label in labels], dtype=float)
+    delta = now - before
+    return {
+        "title": current["title"],
+        "type": current["type"],
+        "labels": labels,
+        "current": now.tolist(),
+        "previous": before.tolist(),
+        "delta": delta.tolist(),
+        "percent": _listed(_percent(delta, before)),
+    }
+
+
+def compare_windows(windows: dict, leq_date: str, periods: int, top: int = 10) -> dict:
+    """
+    Deltas and percent changes of every metric of fetch_comparison for the
+    window of periods days ending on leq_date.
+    Returns:
+        dict: Comparison by metric, see compare_timeseries and compare_categorical.
+    """
+    current, previous = windows["current"], windows["previous"]
+    timeseries = [metric for metric in current if metric not in CATEGORICAL_METRICS]
+    result = compare_timeseries(current, previous, timeseries, leq_date, periods)
+    for metric in current:
+        if metric in CATEGORICAL_METRICS:
+            result[metric] = compare_categorical(current[metric], previous[metric], top)
+    return result
+
+
+def compare_response(
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    metrics: Optional[list] = None,
+    store: Optional[MetricStore] = None,
+) -> dict:
+    """
+    Encoded JSON comparison of a zone, cached like utils_api.metric_response.
+    Raises:
+        KeyError: If a metric is unknown.
+    """
+    metrics = list(metrics or COMPARE_METRICS)
+    for metric in metrics:
+        METRIC_FIELDS[metric]
+
+    def build() -> dict:
+        windows = fetch_comparison(zone_tag, leq_date, periods, metrics, store)
+        payload = {
+            "leq_date": leq_date,
+            "previous_leq_date": previous_window(leq_date, periods),
+            "periods": periods,
+            "metrics": compare_windows(windows, leq_date, periods),
+        }
+        return encode_payload(payload)
+
+    key = ("compare", tuple(metrics), zone_tag, leq_date, periods)
+    return response_cache.get_or_create(key, build)
@@ -0,0 +1,201 @@
+"""
+V1 functions neccesary to route the API calls to the token of each account
+"""
+
+__version__ = "1.0.0"
+
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from .config import CF_API_TOKEN, load_clients
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREDENTIALS_FILE = os.getenv(
+    "CF_CREDENTIALS_FILE", os.path.join(PROJECT_ROOT, "credentials.json")
+)
+TOKEN_RATE_LIMIT = int(os.getenv("CF_RATE_LIMIT", 300))  # queries per window and token
+TOKEN_RATE_WINDOW = 300  # seconds, GraphQL API limit window
+TOKEN_BURST = 20  # queries a token can send at once after being idle
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` per second up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Takes tokens from the bucket, waiting for the refill if needed.
+        Returns:
+            bool: False if they were not available within timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class Credential:
+    """
+    An API token with its own rate budget.
+    """
+
+    def __init__(self, name: str, token: str, rate_limit: int = TOKEN_RATE_LIMIT):
+        self.name = name
+        self.token = token
+        self.bucket = TokenBucket(rate_limit / TOKEN_RATE_WINDOW, min(TOKEN_BURST, rate_limit))
+        self.requests = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Waits until the token may send one more query.
+        """
+        start = time.perf_counter()
+        self.bucket.acquire()
+        with self._lock:
+            self.requests += 1
+            self.waited += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "requests": self.requests,
+                "waited_s": round(self.waited, 3),
+                "available": round(self.bucket.available(), 1),
+            }
+
+
+class CredentialPool:
+    """
+    Registry of the API tokens and the zones and accounts each one serves.
+    """
+
+    def __init__(
+        self,
+        credentials: dict,
+        zones: Optional[dict] = None,
+        accounts: Optional[dict] = None,
+        zone_accounts: Optional[dict] = None,
+        default: Optional[str] = None,
+    ):
+        """
+        Args:
+            credentials (dict): Credential by name.
+            zones (dict): Credential name by zone tag.
+            accounts (dict): Credential name by account id.
+            zone_accounts (dict): Account id by zone tag.
+            default (str): Credential used for the zones and accounts not listed.
+        """
+        self.credentials = credentials
+        self.zones = zones or {}
+        self.accounts = accounts or {}
+        self.zone_accounts = zone_accounts or {}
+        self.default = default
+
+    def _get(self, name: Optional[str], what: str) -> Credential:
+        name = name or self.default
+        if name not in self.credentials:
+            raise ValueError(f"Missing or invalid API token for {what}.")
+        return self.credentials[name]
+
+    def for_zone(self, zone_tag: Optional[str]) -> Credential:
+        """
+        Credential of a zone: the one listing the zone, else the one of the
+        zone account, else the default.
+        """
+        name = self.zones.get(zone_tag) or self.accounts.get(self.zone_accounts.get(zone_tag))
+        return self._get(name, f"zone '{zone_tag}'")
+
+    def for_account(self, account_id: str) -> Credential:
+        return self._get(self.accounts.get(account_id), f"account '{account_id}'")
+
+    def stats(self) -> list:
+        """
+        Returns:
+            list: Queries sent, seconds waited for the budget and tokens left
+            of every credential.
+        """
+        return [credential.stats() for credential in self.credentials.values()]
+
+
+def load_credentials(path: str = CREDENTIALS_FILE, clients: Optional[list] = None) -> CredentialPool:
+    """
+    Builds the credential pool from:
+        - CF_API_TOKEN: the "default" credential.
+        - clients.json: a client with "token_env" uses the token in that
+          environment variable for its zone, "account_id" ties the zone to
+          its Cloudflare account.
+        - path (optional JSON, kept out of the repo):
+          {"<name>": {"token" or "token_env", "rate_limit", "zones", "accounts"}}
+    Args:
+        path (str): Credentials file.
+        clients (list): Clients registry, defaults to load_clients().
+    Returns:
+        CredentialPool: The pool, the default credential is "default".
+    """
+    credentials, zones, accounts, zone_accounts = {}, {}, {}, {}
+    if CF_API_TOKEN:
+        credentials["default"] = Credential("default", CF_API_TOKEN)
+    for client in load_clients() if clients is None else clients:
+        if client.get("account_id"):
+            zone_accounts[client["zone_tag"]] = client["account_id"]
+        token = os.getenv(client.get("token_env", ""), "")
+        if token:
+            credentials[client["name"]] = Credential(client["name"], token)
+            zones[client["zone_tag"]] = client["name"]
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for name, entry in json.load(f).items():
+                token = entry.get("token") or os.getenv(entry.get("token_env", ""), "")
+                if not token:
+                    raise ValueError(f"Missing or invalid API token for credential '{name}'.")
+                credentials[name] = Credential(
+                    name, token, entry.get("rate_limit", TOKEN_RATE_LIMIT)
+                )
+                zones.update({zone_tag: name for zone_tag in entry.get("zones", [])})
+                accounts.update({account_id: name for account_id in entry.get("accounts", [])})
+    return CredentialPool(credentials, zones, accounts, zone_accounts, "default")
+
+
+def get_credentials() -> CredentialPool:
+    """
+    Credential pool of the process, loaded on first use.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = load_credentials()
+    return _default_pool
@@ -0,0 +1,131 @@
+"""
+V1 functions neccesary to derive the cache and error ratios from the fetched metrics
+"""
+
+__version__ = "1.0.0"
+
+from typing import Optional
+
+import numpy as np
+
+# Ratio: title, metrics added up as numerator, denominator metric
+DERIVED_METRICS = {
+    "cache_hit_ratio": ("Cache hit ratio", ["cached_requests"], "requests"),
+    "byte_hit_ratio": ("Byte hit ratio", ["cached_bandwidth"], "bandwidth"),
+    "encrypted_share": ("Encrypted share", ["encrypted_requests"], "requests"),
+    "error_rate": ("Error rate", ["fourxx_errors", "fivexx_errors"], "requests"),
+}
+
+# Timeseries metrics the ratios are computed from
+DERIVED_INPUTS = sorted(
+    {metric for _, numerator, denominator in DERIVED_METRICS.values() for metric in [*numerator, denominator]}
+)
+
+
+def align_stats(data: dict, metrics: list) -> tuple:
+    """
+    Aligns the timeseries stats of several zones on a common date axis.
+    Args:
+        data (dict): {zone: {metric: stat dict}}, stats may be missing.
+        metrics (list): Metrics to align.
+    Returns:
+        tuple: Zones, dates and a (zones x metrics x dates) float array with
+        NaN for the missing metrics and days.
+    """
+    zones = list(data)
+    dates = sorted(
+        {day for stats in data.values() for metric in metrics for day in stats.get(metric, {}).get("content", {})}
+    )
+    position = {day: i for i, day in enumerate(dates)}
+    values = np.full((len(zones), len(metrics), len(dates)), np.nan)
+    for z, zone in enumerate(zones):
+        for m, metric in enumerate(metrics):
+            content = data[zone].get(metric, {}).get("content", {})
+            if content:
+                days = [position[day] for day in content]
+                values[z, m, days] = [np.nan if value is None else value for value in content.values()]
+    return zones, dates, values
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """
+    numerator / denominator, NaN where either is missing or the denominator is 0.
+    """
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=np.isfinite(numerator) & (denominator > 0))
+    return out
+
+
+def derive_metrics(data: dict, derived: Optional[list] = None) -> dict:
+    """
+    Daily and window ratios of every zone at once. A ratio is left out when
+    none of the zones has its metrics, a day is None when one of them is
+    missing or the denominator is 0, and the window ratio only counts the
+    days with every metric.
+    Args:
+        data (dict): {zone: {metric: stat dict}} with the DERIVED_INPUTS fetched.
+        derived (list): Keys of DERIVED_METRICS, defaults to all.
+    Returns:
+        dict: {zone: {ratio: stat dict}}, stat dicts with "type" "percent"
+        (0 to 1 values) and the window ratio as "total".
+    """
+    derived = [
+        name for name in derived or DERIVED_METRICS
+        if all(
+            any(metric in stats for stats in data.values())
+            for metric in [*DERIVED_METRICS[name][1], DERIVED_METRICS[name][2]]
+        )
+    ]
+    inputs = sorted({metric for name in derived for metric in [*DERIVED_METRICS[name][1], DERIVED_METRICS[name][2]]})
+    zones, dates, values = align_stats(data, inputs)
+    row = {metric: i for i, metric in enumerate(inputs)}
+    result = {zone: {} for zone in zones}
+    for name in derived:
+        title, numerator, denominator = DERIVED_METRICS[name]
+        # Adding NaN keeps a day missing if any numerator metric is
+        top = values[:, [row[metric] for metric in numerator], :].sum(axis=1)
+        bottom = values[:, row[denominator], :]
+        daily = _ratio(top, bottom)
+        complete = np.isfinite(daily)
+        total = _ratio(np.where(complete, top, 0).sum(axis=1), np.where(complete, bottom, 0).sum(axis=1))
+        for z, zone in enumerate(zones):
+            result[zone][name] = {
+                "title": title,
+                "content": {
+                    day: None if np.isnan(value) else float(value)
+                    for day, value in zip(dates, daily[z])
+                },
+                "type": "percent",
+                "total": None if np.isnan(total[z]) else float(total[z]),
+            }
+    return result
+
+
+def derive_rows(rows: list, derived: Optional[list] = None) -> dict:
+    """
+    Ratios of every zone from stored days (see MetricStore.daily_rows with
+    DERIVED_INPUTS), no API call.
+    Returns:
+        dict: See derive_metrics, keyed by zone tag.
+    """
+    data = {}
+    for row in rows:
+        stats = data.setdefault(row["zone_tag"], {})
+        stats.setdefault(row["metric"], {"content": {}})["content"][row["date"]] = row["value"]
+    return derive_metrics(data, derived)
+
+
+def derived_payload(stat: dict) -> dict:
+    """
+    Date sorted representation of a ratio, like utils_api.timeseries_payload.
+    Returns:
+        dict: title, type, total, labels and values (None for missing days).
+    """
+    labels = sorted(stat["content"])
+    return {
+        "title": stat["title"],
+        "type": stat["type"],
+        "total": stat["total"],
+        "labels": labels,
+        "values": [stat["content"][label] for label in labels],
+    }
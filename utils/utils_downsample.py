@@ -0,0 +1,123 @@
+"""
+V1 functions neccesary to downsample long timeseries before plotting
+"""
+
+__version__ = "1.0.0"
+
+import numpy as np
+
+
+def pixel_budget(width_inches: float, dpi: int) -> int:
+    """
+    Number of horizontal pixels available for a plot.
+    Args:
+        width_inches (float): Width of the figure in inches.
+        dpi (int): Resolution the figure will be saved with.
+    Returns:
+        int: Width of the output in pixels.
+    """
+    return max(int(width_inches * dpi), 2)
+
+
+def minmax_indices(values: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Min/max bucketing: splits the series into n_buckets contiguous buckets and
+    keeps the position of the minimum and maximum of each one, plus both ends.
+    Args:
+        values (np.ndarray): 1-D array with the series.
+        n_buckets (int): Number of buckets (about half the output points).
+    Returns:
+        np.ndarray: Sorted indices of the points to keep.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.size
+    if n_buckets < 1 or n <= 2 * n_buckets + 2:
+        return np.arange(n)
+    inner = values[1:-1]
+    starts = np.linspace(0, inner.size, n_buckets + 1).astype(np.int64)[:-1]
+    bucket_of = np.repeat(np.arange(n_buckets), np.diff(np.append(starts, inner.size)))
+    mins = np.minimum.reduceat(inner, starts)
+    maxs = np.maximum.reduceat(inner, starts)
+    # First occurrence of each bucket extreme
+    min_hits = np.flatnonzero(inner == mins[bucket_of])
+    max_hits = np.flatnonzero(inner == maxs[bucket_of])
+    _, first_min = np.unique(bucket_of[min_hits], return_index=True)
+    _, first_max = np.unique(bucket_of[max_hits], return_index=True)
+    keep = np.concatenate(
+        ([0], min_hits[first_min] + 1, max_hits[first_max] + 1, [n - 1])
+    )
+    return np.unique(keep)
+
+
+def lttb_indices(values: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets over evenly spaced samples. Long inputs are
+    first reduced with min/max bucketing (MinMaxLTTB) so the sequential bucket
+    walk only touches a few points per bucket.
+    Args:
+        values (np.ndarray): 1-D array with the series.
+        n_out (int): Number of points to keep (ends included).
+    Returns:
+        np.ndarray: Sorted indices of the points to keep.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.size
+    if n_out < 3 or n <= n_out:
+        return np.arange(n)
+    candidates = np.arange(n)
+    if n > 4 * n_out:
+        candidates = minmax_indices(values, 2 * n_out)
+    x = candidates.astype(float)
+    y = values[candidates]
+    m = candidates.size
+    if m <= n_out:
+        return candidates
+    edges = np.linspace(1, m - 1, n_out - 1).astype(np.int64)
+    # Average point of each bucket, used as the third vertex of the triangle
+    sums_x = np.add.reduceat(x[1 : m - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1 : m - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = m - 1
+    prev = 0
+    for bucket in range(n_out - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        area = np.abs(
+            (x[prev] - avg_x[bucket + 1]) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (avg_y[bucket + 1] - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        selected[bucket + 1] = prev
+    return candidates[selected]
+
+
+def downsample_indices(
+    series: list, max_points: int, method: str = "minmax"
+) -> np.ndarray:
+    """
+    Points to keep so that several series sharing the same x axis can be
+    plotted with at most about max_points vertices each.
+    Args:
+        series (list): Sequences of the same length (one per plotted line).
+        max_points (int): Output budget, usually the pixel width of the plot.
+        method (str): "minmax" (two points per pixel column) or "lttb".
+    Returns:
+        np.ndarray: Sorted union of the indices kept for every series.
+    Raises:
+        ValueError: If the method is unknown.
+    """
+    if method not in ("minmax", "lttb"):
+        raise ValueError(f"Unknown downsampling method: '{method}'.")
+    n = len(series[0]) if series else 0
+    if n <= max_points:
+        return np.arange(n)
+    keep = []
+    for values in series:
+        if method == "minmax":
+            keep.append(minmax_indices(values, max_points // 2))
+        else:
+            keep.append(lttb_indices(values, max_points))
+    return np.unique(np.concatenate(keep))
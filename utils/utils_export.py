@@ -0,0 +1,419 @@
+"""
+V1 functions neccesary to export the raw daily metrics of many zones
+
+Usage:
+    python -m utils.utils_export --zones <zone_tag>,<zone_tag> --date 2025-02-23 --periods 365 \
+        [--metrics requests,bandwidth] [--source api|store] [--format csv|ndjson|parquet] [--output file]
+"""
+
+__version__ = "1.0.0"
+
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+from collections import deque
+from datetime import date, timedelta
+from itertools import islice
+from typing import Iterator, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+from .config import find_client
+from .utils_account import account_query, client_zones, zone_batches
+from .utils_api import CATEGORICAL_METRICS, TIMESERIES_METRICS
+from .utils_cloudflare import execute_query, range_generator
+from .utils_compare import METRIC_FIELDS
+from .utils_credentials import get_credentials
+from .utils_fetcher import BATCH, get_fetch_scheduler
+from .utils_store import MetricStore
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS = ["zone_tag", "date", "metric", "category", "value"]
+EXPORT_CHUNK_DAYS = 31  # days per query
+EXPORT_BATCH_ROWS = 5000  # rows per written chunk and Parquet row group
+EXPORT_PREFETCH = 2  # queries in flight ahead of the writer
+EXPORT_SOURCES = ("api", "store")
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Last line of a CSV or NDJSON export failing mid-stream, a Parquet one is
+# left without its footer (unreadable)
+EXPORT_ERROR = "Export interrupted, the file is incomplete"
+EXPORT_ERROR_MARKERS = {
+    "csv": f"# {EXPORT_ERROR}\n".encode(),
+    "ndjson": (json.dumps({"error": EXPORT_ERROR}) + "\n").encode(),
+}
+
+
+def chunk_windows(leq_date: str, periods: int, days: int = EXPORT_CHUNK_DAYS) -> list:
+    """
+    Splits a window in windows of at most `days` days, oldest first.
+    Returns:
+        list: (leq_date, periods) of every chunk.
+    """
+    last = date.fromisoformat(leq_date)
+    first = last - timedelta(days=periods - 1)
+    chunks = []
+    while first <= last:
+        end = min(first + timedelta(days=days - 1), last)
+        chunks.append((end.isoformat(), (end - first).days + 1))
+        first = end + timedelta(days=1)
+    return chunks
+
+
+def group_rows(zone_tag: str, groups: list, metrics: list) -> list:
+    """
+    Export rows of a zone from httpRequests1dGroups rows, one per day and
+    metric, one per day, metric and category for the categorical metrics.
+    """
+    rows = []
+    for group in groups:
+        day = group["dimensions"]["date"]
+        for metric in metrics:
+            extract = METRIC_FIELDS[metric][4]
+            if metric in CATEGORICAL_METRICS:
+                rows.extend(
+                    {"zone_tag": zone_tag, "date": day, "metric": metric, "category": category, "value": value}
+                    for category, value in extract(group)
+                )
+            else:
+                rows.append(
+                    {"zone_tag": zone_tag, "date": day, "metric": metric, "category": "", "value": extract(group)}
+                )
+    return rows
+
+
+def get_export_rows(zone_tags: list, leq_date: str, periods: int, metrics: list) -> list:
+    """
+    Retrieve the export rows of several zones of the same API token with one query.
+    Args:
+        zone_tags (list): Zones, all served by the same API token.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        metrics (list): Keys of utils_compare.METRIC_FIELDS.
+    Returns:
+        list: Rows with EXPORT_FIELDS.
+    """
+    range_generated = range_generator(leq_date, periods)
+    variables = {
+        "zoneTags": zone_tags,
+        "since": range_generated["geq_date"][:10],
+        "until": range_generated["leq_date"][:10],
+    }
+    credential = get_credentials().for_zone(zone_tags[0])
+    response = execute_query(account_query(metrics), variables, credential)
+    try:
+        rows = []
+        for zone in response["data"]["viewer"]["zones"]:
+            rows.extend(group_rows(zone["zoneTag"], zone["httpRequests1dGroups"] or [], metrics))
+        return rows
+    except (KeyError, IndexError, TypeError) as e:
+        raise Exception(f"Error processing response for export: {e}")
+
+
+def api_rows(
+    zone_tags: list,
+    leq_date: str,
+    periods: int,
+    metrics: list,
+    tenant: Optional[str] = None,
+    priority: str = BATCH,
+) -> Iterator[dict]:
+    """
+    Streams the rows of many zones from the API: one query per chunk of
+    EXPORT_CHUNK_DAYS days and batch of zones, EXPORT_PREFETCH of them queued
+    on the fetch scheduler ahead of the consumer. The first query is waited
+    for here, so its errors (rate limit, upstream) are raised before the
+    first byte is streamed. Closing the iterator cancels the queries not
+    started yet.
+    """
+    scheduler = get_fetch_scheduler()
+    tenant = tenant or scheduler.tenant_for(zone_tags[0])
+    tasks = iter(
+        [
+            (batch, chunk_leq, chunk_periods)
+            for chunk_leq, chunk_periods in chunk_windows(leq_date, periods)
+            for batch in zone_batches(zone_tags)
+        ]
+    )
+    pending = deque()
+
+    def submit() -> None:
+        for batch, chunk_leq, chunk_periods in islice(tasks, EXPORT_PREFETCH - len(pending)):
+            pending.append(
+                scheduler.submit(
+                    tenant, get_export_rows, batch, chunk_leq, chunk_periods, metrics,
+                    priority=priority,
+                )
+            )
+
+    submit()
+    try:
+        first = pending.popleft().result()
+    except Exception:
+        for future in pending:
+            future.cancel()
+        raise
+    return _api_stream(first, pending, submit)
+
+
+def _api_stream(first: list, pending: deque, submit) -> Iterator[dict]:
+    try:
+        yield from first
+        while True:
+            submit()
+            if not pending:
+                break
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def store_rows(
+    store: MetricStore, zone_tags: Optional[list], leq_date: str, periods: int, metrics: list
+) -> Iterator[dict]:
+    """
+    Streams the rows stored for the zones (all of them when None), no API call.
+    """
+    range_generated = range_generator(leq_date, periods)
+    for row in store.iter_daily(
+        metrics, range_generated["geq_date"][:10], leq_date, zone_tags, EXPORT_BATCH_ROWS
+    ):
+        yield {
+            "zone_tag": row["zone_tag"],
+            "date": row["date"],
+            "metric": row["metric"],
+            "category": "",
+            "value": row["value"],
+        }
+
+
+def export_rows(
+    zone_tags: Optional[list],
+    leq_date: str,
+    periods: int,
+    metrics: Optional[list] = None,
+    source: str = "api",
+    store: Optional[MetricStore] = None,
+) -> Iterator[dict]:
+    """
+    Rows of an export, checked (and the first API query answered) before
+    returning so errors come before the first byte is streamed.
+    Args:
+        zone_tags (list): Zones to export, None for every zone stored (store only).
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        metrics (list): Keys of utils_compare.METRIC_FIELDS, defaults to the
+            time series ones. The store only holds time series.
+        source (str): "api" (Cloudflare) or "store" (stored daily history).
+        store (MetricStore): Daily snapshots, required for the store source.
+    Returns:
+        Iterator[dict]: Rows with EXPORT_FIELDS.
+    Raises:
+        KeyError: Unknown metric.
+        ValueError: Unknown source, no zones or a metric the source lacks.
+        Exception: If the first API query fails.
+    """
+    metrics = list(metrics or TIMESERIES_METRICS)
+    for metric in metrics:
+        METRIC_FIELDS[metric]
+    range_generator(leq_date, periods)
+    if periods < 1:
+        raise ValueError("Periods must be a positive integer.")
+    if source == "store":
+        stored = [metric for metric in metrics if metric not in TIMESERIES_METRICS]
+        if stored:
+            raise ValueError(f"Not stored, use the api source: {', '.join(stored)}")
+        return store_rows(store or MetricStore(), zone_tags, leq_date, periods, metrics)
+    if source != "api":
+        raise ValueError(f"Unknown source: '{source}'.")
+    if not zone_tags:
+        raise ValueError("No zones to export.")
+    return api_rows(zone_tags, leq_date, periods, metrics)
+
+
+def _batches(rows: Iterator[dict]) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, EXPORT_BATCH_ROWS))
+        if not batch:
+            return
+        yield batch
+
+
+def write_csv(rows: Iterator[dict]) -> Iterator[bytes]:
+    """
+    CSV with a header, EXPORT_BATCH_ROWS rows per chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for batch in _batches(rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def write_ndjson(rows: Iterator[dict]) -> Iterator[bytes]:
+    """
+    One JSON object per line, EXPORT_BATCH_ROWS rows per chunk.
+    """
+    for batch in _batches(rows):
+        yield "".join(json.dumps(row) + "\n" for row in batch).encode()
+
+
+class _Sink:
+    """
+    Write-only file collecting what the Parquet writer flushes, drained
+    after every row group.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def write_parquet(rows: Iterator[dict]) -> Iterator[bytes]:
+    """
+    Parquet file with a row group every EXPORT_BATCH_ROWS rows, each sent
+    once written. Needs pyarrow.
+    """
+    if pq is None:
+        raise ValueError("Parquet export needs pyarrow installed.")
+    schema = pa.schema(
+        [
+            ("zone_tag", pa.string()),
+            ("date", pa.date32()),
+            ("metric", pa.string()),
+            ("category", pa.string()),
+            ("value", pa.float64()),
+        ]
+    )
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in _batches(rows):
+            columns = {field: [row[field] for row in batch] for field in EXPORT_FIELDS}
+            columns["date"] = pa.array(columns["date"], pa.string()).cast(pa.date32())
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+EXPORT_WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "parquet": write_parquet}
+
+
+def stream_export(rows: Iterator[dict], fmt: str) -> Iterator[bytes]:
+    """
+    Encodes rows as they come, memory bounded by EXPORT_BATCH_ROWS. A
+    failure mid-stream is logged, ends a CSV or NDJSON file with its
+    EXPORT_ERROR_MARKERS line and is raised again, so the server aborts the
+    response instead of ending it cleanly.
+    Args:
+        rows (Iterator[dict]): See export_rows.
+        fmt (str): Key of EXPORT_FORMATS.
+    Returns:
+        Iterator[bytes]: Chunks of the file.
+    Raises:
+        ValueError: Unknown format, or Parquet without pyarrow.
+    """
+    if fmt not in EXPORT_WRITERS:
+        raise ValueError(f"Unknown format: '{fmt}'.")
+    if fmt == "parquet" and pq is None:
+        raise ValueError("Parquet export needs pyarrow installed.")
+    return _guarded(EXPORT_WRITERS[fmt](rows), fmt)
+
+
+def _guarded(chunks: Iterator[bytes], fmt: str) -> Iterator[bytes]:
+    try:
+        yield from chunks
+    except Exception:
+        logger.exception("%s export failed mid-stream", fmt)
+        if fmt in EXPORT_ERROR_MARKERS:
+            yield EXPORT_ERROR_MARKERS[fmt]
+        raise
+
+
+def export_zones(zones: Optional[str] = None, client: Optional[str] = None) -> Optional[list]:
+    """
+    Zones of an export from comma separated zone tags or a client name
+    (all its zones), None when neither is given.
+    Raises:
+        ValueError: Unknown client.
+    """
+    if client:
+        found = find_client(client)
+        if found is None:
+            raise ValueError(f"Unknown client: '{client}'.")
+        return list(client_zones(found))
+    return [zone for zone in (zones or "").split(",") if zone] or None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the daily metrics of some zones.")
+    parser.add_argument("--zones", help="Comma separated zone tags.")
+    parser.add_argument("--client", help="Client name, exports all its zones.")
+    parser.add_argument("--date", required=True, help="Last day (YYYY-MM-DD).")
+    parser.add_argument("--periods", type=int, default=7, help="Number of days.")
+    parser.add_argument("--metrics", help="Comma separated metrics (default: time series).")
+    parser.add_argument("--source", choices=EXPORT_SOURCES, default="api")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output", help="File to write (default: stdout).")
+    args = parser.parse_args()
+
+    metrics = [metric for metric in (args.metrics or "").split(",") if metric]
+    try:
+        rows = export_rows(
+            export_zones(args.zones, args.client), args.date, args.periods, metrics, args.source
+        )
+        chunks = stream_export(rows, args.format)
+    except KeyError as e:
+        parser.error(f"Unknown metric: {e.args[0]}")
+    except ValueError as e:
+        parser.error(str(e))
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+V1 functions neccesary to share the Cloudflare API fairly between clients
+"""
+
+__version__ = "1.0.0"
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .config import load_clients
+
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", 8))
+WAIT_SAMPLES = 1000  # latest waits kept per priority for the metrics
+
+# Priorities in the order they are served
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+class _Tenant:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.queue = deque()
+        self.finish = 0.0  # virtual finish time of its last served fetch
+        self.served = 0
+        self.waited = 0.0
+
+
+class FairFetchScheduler:
+    """
+    Runs fetches on a pool of `workers` threads with a queue per tenant.
+    Interactive fetches always go before batch ones, and within a priority
+    the tenants are served by start-time fair queuing: each one gets a share
+    of the fetches proportional to its weight, however many it queues.
+    """
+
+    def __init__(
+        self,
+        workers: int = FETCH_WORKERS,
+        weights: Optional[dict] = None,
+        tenants: Optional[dict] = None,
+    ):
+        """
+        Args:
+            workers (int): Fetches running at the same time.
+            weights (dict): Weight by tenant, 1 for the tenants not listed.
+            tenants (dict): Tenant by zone tag, see tenant_for.
+        """
+        self.workers = workers
+        self.weights = weights or {}
+        self.tenants = tenants or {}
+        self._queues = {priority: {} for priority in PRIORITIES}
+        self._clock = {priority: 0.0 for priority in PRIORITIES}
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+        self._running = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        self._closed = False
+
+    def tenant_for(self, zone_tag: str) -> str:
+        """
+        Tenant of a zone: its client, or the zone itself if unknown.
+        """
+        return self.tenants.get(zone_tag, zone_tag)
+
+    def submit(
+        self,
+        tenant: str,
+        func: Callable,
+        *args,
+        priority: str = INTERACTIVE,
+        cost: float = 1.0,
+    ) -> Future:
+        """
+        Queues func(*args) for a tenant.
+        Args:
+            tenant (str): Client the fetch is made for.
+            func (Callable): The fetcher.
+            priority (str): INTERACTIVE (pages, reporte.html) or BATCH.
+            cost (float): Share of the budget the fetch uses (queries).
+        Returns:
+            Future: Result of the fetch.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: '{priority}'.")
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The fetch scheduler is shut down.")
+            self._start_workers()
+            queues = self._queues[priority]
+            if tenant not in queues:
+                queues[tenant] = _Tenant(self.weights.get(tenant, 1))
+            queues[tenant].queue.append((future, func, args, cost, time.perf_counter()))
+            self._condition.notify()
+        return future
+
+    def call(self, tenant: str, func: Callable, *args, priority: str = INTERACTIVE):
+        """
+        Runs func(*args) through the queues and waits for its result.
+        """
+        return self.submit(tenant, func, *args, priority=priority).result()
+
+    def _start_workers(self) -> None:
+        # Started on first use, so a preloaded master forks without threads
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, name=f"fetch-{len(self._threads)}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _next(self) -> Optional[tuple]:
+        for priority in PRIORITIES:
+            clock = self._clock[priority]
+            waiting = [
+                (max(tenant.finish, clock), tenant.queue[0][4], name)
+                for name, tenant in self._queues[priority].items()
+                if tenant.queue
+            ]
+            if not waiting:
+                continue
+            start, _, name = min(waiting)
+            tenant = self._queues[priority][name]
+            item = tenant.queue.popleft()
+            tenant.finish = start + item[3] / tenant.weight
+            self._clock[priority] = start
+            wait = time.perf_counter() - item[4]
+            tenant.served += 1
+            tenant.waited += wait
+            self._waits[priority].append(wait)
+            return item
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                item = self._next()
+                while item is None:
+                    if self._closed:
+                        return
+                    self._condition.wait()
+                    item = self._next()
+                self._running += 1
+            future, func, args, _, _ = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            with self._condition:
+                self._running -= 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: "running" fetches, queue depth per priority and tenant,
+            wait times per priority (count, mean, p95 and max seconds over
+            the latest WAIT_SAMPLES) and fetches served per tenant.
+        """
+        with self._condition:
+            depth, waits, tenants = {}, {}, {}
+            for priority in PRIORITIES:
+                depth[priority] = {
+                    name: len(tenant.queue) for name, tenant in self._queues[priority].items()
+                }
+                samples = sorted(self._waits[priority])
+                waits[priority] = {
+                    "count": len(samples),
+                    "mean_s": round(sum(samples) / len(samples), 4) if samples else 0.0,
+                    "p95_s": round(samples[int(0.95 * (len(samples) - 1))], 4) if samples else 0.0,
+                    "max_s": round(samples[-1], 4) if samples else 0.0,
+                }
+                for name, tenant in self._queues[priority].items():
+                    entry = tenants.setdefault(name, {"served": 0, "waited_s": 0.0})
+                    entry["served"] += tenant.served
+                    entry["waited_s"] = round(entry["waited_s"] + tenant.waited, 4)
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": depth,
+                "wait": waits,
+                "tenants": tenants,
+            }
+
+    def shutdown(self) -> None:
+        """
+        Stops the workers once the queued fetches are done.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+def get_fetch_scheduler() -> FairFetchScheduler:
+    """
+    Fetch scheduler of the process, tenants and weights ("weight", default 1)
+    read from the clients registry.
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            clients = load_clients()
+            _default_scheduler = FairFetchScheduler(
+                weights={client["name"]: client.get("weight", 1) for client in clients},
+                tenants={client["zone_tag"]: client["name"] for client in clients},
+            )
+    return _default_scheduler
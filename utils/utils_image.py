@@ -2,30 +2,61 @@
 V4 functions neccesary to create graphs
 """
 
-__version__ = "4.1.0"
+__version__ = "4.5.0"
 
 import os
+from functools import lru_cache
+from typing import BinaryIO, Union
 
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.table import Table
+from matplotlib.ticker import MaxNLocator
 from matplotlib.transforms import Bbox
 
+from .utils_downsample import downsample_indices, pixel_budget
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHAPEFILE_PATH = os.path.join(
+    PROJECT_ROOT, "assets", "countries", "ne_110m_admin_0_countries.shp"
+)
+
+
+@lru_cache(maxsize=1)
+def load_world() -> gpd.GeoDataFrame:
+    """
+    Reads the countries shapefile once per process.
+    Returns:
+        GeoDataFrame: Country geometries with their ISO_A2 code.
+    Raises:
+        FileNotFoundError: If the shapefile is missing.
+        KeyError: If the shapefile has no ISO_A2 column.
+    """
+    if not os.path.exists(SHAPEFILE_PATH):
+        raise FileNotFoundError(f"Shapefile not found: {SHAPEFILE_PATH}")
+    world = gpd.read_file(SHAPEFILE_PATH)
+    if "ISO_A2" not in world.columns:
+        raise KeyError("Shapefile must contain an ISO_A2 column for country codes.")
+    return world
+
 
 def format_stat(value: float, stat_type: str) -> str:
     """
     Formats the statistic value based on its type.
     - "numeric" -> Format in K/M (e.g., "12.3K").
     - "byte" -> Convert bytes to MB/GB and format accordingly.
+    - "percent" -> Ratio from 0 to 1 as a percentage, "-" when unknown.
 
     Args:
         value (float): The total value to format.
-        stat_type (str): The type of metric ("numeric" or "byte").
+        stat_type (str): The type of metric ("numeric", "byte" or "percent").
 
     Returns:
         str: Formatted string representation.
     """
+    if stat_type == "percent":
+        return "-" if value is None else f"{value * 100:.1f}%"
     if stat_type == "numeric":
         return f"{value / 1000:.1f}K"
     elif stat_type == "byte":
@@ -33,8 +64,32 @@ def format_stat(value: float, stat_type: str) -> str:
     return str(value)
 
 
+def save_figure(
+    output: Union[str, BinaryIO] = "test.png", dpi: int = 300, fmt: str = "png"
+) -> None:
+    """
+    Saves the current figure and closes it.
+
+    Args:
+        output (str | BinaryIO): File path or writable buffer.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format understood by matplotlib ("png", "svg", ...).
+
+    Returns:
+        None: The figure is written to output.
+    """
+    plt.savefig(output, dpi=dpi, format=fmt, bbox_inches="tight")
+    plt.close()
+
+
 def dashboard_stat_graph(
-    first_stat: dict, second_stat: dict, third_stat_title: str, y_label_info: str
+    first_stat: dict,
+    second_stat: dict,
+    third_stat_title: str,
+    y_label_info: str,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
 ) -> None:
     """
     Creates a panel with stats and timeseries:
@@ -46,6 +101,9 @@ def dashboard_stat_graph(
         second_stat (dict): Contains title, metric dictionary, and type for the second stat.
         third_stat_title (str): Self explanatory.
         y_label_info (str): Label for the Y-axis of the line chart.
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
 
     Returns:
         None: Displays the generated plot.
@@ -91,9 +149,13 @@ def dashboard_stat_graph(
 
     # Line graph
     colors = ["#3CB5AE", "#A8DADC", "#D9D9D9"]
-    dates = list(first_stat["content"].keys())
-    values1 = list(first_stat["content"].values())
-    values2 = list(second_stat["content"].values())
+    dates = np.array(list(first_stat["content"].keys()))
+    values1 = np.array(list(first_stat["content"].values()))
+    values2 = np.array(list(second_stat["content"].values()))
+    keep = downsample_indices([values1, values2], pixel_budget(10, dpi))
+    downsampled = keep.size < dates.size
+    if downsampled:
+        dates, values1, values2 = dates[keep], values1[keep], values2[keep]
     axs[1].plot(
         dates,
         values1,
@@ -111,6 +173,8 @@ def dashboard_stat_graph(
         label=second_stat["title"],
     )
     axs[1].fill_between(dates, values2, color=colors[1])
+    if downsampled:
+        axs[1].xaxis.set_major_locator(MaxNLocator(nbins=6, integer=True))
 
     axs[1].legend(loc="upper left", frameon=False)
 
@@ -132,12 +196,94 @@ def dashboard_stat_graph(
     plt.tight_layout()
     # plt.show()
     # Save the plot
-    plt.savefig("test.png", dpi=300, bbox_inches="tight")
-    plt.close()
+    save_figure(output, dpi, fmt)
+
+
+def dashboard_ratio_graph(
+    first_stat: dict,
+    second_stat: dict,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
+) -> None:
+    """
+    Creates a panel with two ratios (see utils_derived):
+    - General Stats: Ratio of each stat over the whole period.
+    - Time Series: Daily ratios in %, missing days left as gaps.
+
+    Args:
+        first_stat (dict): Ratio stat dict with "total" (cache hit ratio).
+        second_stat (dict): Ratio stat dict with "total" (byte hit ratio).
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
+
+    Returns:
+        None: Displays the generated plot.
+    """
+    fig, axs = plt.subplots(
+        2, 1, gridspec_kw={"height_ratios": [1, 4]}, figsize=(10, 6)
+    )
+
+    # Stats
+    for idx, stat in enumerate([first_stat, second_stat]):
+        axs[0].text(
+            (idx + 0.5) / 2,
+            0.6,
+            stat["title"],
+            ha="center",
+            va="center",
+            fontsize=12,
+            fontweight="normal",
+        )
+        axs[0].text(
+            (idx + 0.5) / 2,
+            0.4,
+            format_stat(stat["total"], "percent"),
+            ha="center",
+            va="center",
+            fontsize=14,
+            fontweight="bold",
+        )
+    axs[0].axis("off")
+
+    # Line graph
+    colors = ["#3CB5AE", "#A8DADC", "#D9D9D9"]
+    dates = np.array(sorted(first_stat["content"]))
+    values = [
+        np.array([stat["content"].get(day) for day in dates], dtype=float) * 100
+        for stat in (first_stat, second_stat)
+    ]
+    keep = downsample_indices([np.nan_to_num(value) for value in values], pixel_budget(10, dpi))
+    downsampled = keep.size < dates.size
+    if downsampled:
+        dates, values = dates[keep], [value[keep] for value in values]
+    for stat, value, color in zip((first_stat, second_stat), values, colors):
+        axs[1].plot(dates, value, linestyle="-", marker=".", color=color, label=stat["title"])
+    if downsampled:
+        axs[1].xaxis.set_major_locator(MaxNLocator(nbins=6, integer=True))
+
+    axs[1].legend(loc="lower left", frameon=False)
+
+    # Standard Y-Axis Formatting
+    axs[1].spines["top"].set_visible(False)
+    axs[1].spines["right"].set_visible(False)
+    axs[1].spines["bottom"].set_color(colors[2])
+    axs[1].spines["left"].set_color(colors[2])
+    axs[1].set_ylim(0, 100)
+    axs[1].set_ylabel("%", fontsize=12)
+    plt.xticks()
+    plt.tight_layout()
+    save_figure(output, dpi, fmt)
 
 
 def dashboard_pie_bar(
-    http_versions: dict, ssl_versions: dict, content_types: dict
+    http_versions: dict,
+    ssl_versions: dict,
+    content_types: dict,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
 ) -> None:
     """
     Creates a panel with two pie charts and a horizontal bar chart:
@@ -149,6 +295,9 @@ def dashboard_pie_bar(
         http_versions (dict): Dictionary containing title, metric dictionary, and type.
         ssl_versions (dict): Dictionary containing title, metric dictionary, and type.
         content_types (dict): Dictionary containing title, metric dictionary, and type.
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
 
     Returns:
         None: Displays the generated plot.
@@ -215,11 +364,15 @@ def dashboard_pie_bar(
     plt.tight_layout()
     # plt.show()
     # Save the plot
-    plt.savefig("test.png", dpi=300, bbox_inches="tight")
-    plt.close()
+    save_figure(output, dpi, fmt)
 
 
-def dashboard_table_map(first_stat: dict) -> None:
+def dashboard_table_map(
+    first_stat: dict,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
+) -> None:
     """
     Creates a panel with a table displaying the top 10 countries by requests and a world map.
     The world map shades countries based on the number of requests.
@@ -227,6 +380,9 @@ def dashboard_table_map(first_stat: dict) -> None:
         first_stat (dict): Dictionary with:
             - "title" (str): Title of the stat.
             - "metrics" (dict): Keys are country codes and values are request counts.
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
     Returns:
         None: Displays the generated plot.
     """
@@ -273,18 +429,7 @@ def dashboard_table_map(first_stat: dict) -> None:
     axs[0].add_table(table)
 
     # Map
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    shapefile_path = os.path.join(
-        project_root, "assets", "countries", "ne_110m_admin_0_countries.shp"
-    )
-    if not os.path.exists(shapefile_path):
-        raise FileNotFoundError(f"Shapefile not found: {shapefile_path}")
-    world = gpd.read_file(shapefile_path)
-    if not os.path.exists(shapefile_path):
-        raise FileNotFoundError(f"Shapefile not found: {shapefile_path}")
-    world = gpd.read_file(shapefile_path)
-    if "ISO_A2" not in world.columns:
-        raise KeyError("Shapefile must contain an ISO_A2 column for country codes.")
+    world = load_world().copy()
     world["requests"] = world["ISO_A2"].map(request_data).fillna(0)
     axs[1].set_aspect(5)
     world.plot(column="requests", cmap=colors[1], ax=axs[1])
@@ -297,12 +442,223 @@ def dashboard_table_map(first_stat: dict) -> None:
     axs[1].set_yticks([])
     # plt.show()
     # Save the plot
-    plt.savefig("test.png", dpi=300, bbox_inches="tight")
-    plt.close()
+    save_figure(output, dpi, fmt)
 
 
 # SOLO TEST
-def dashboard_stat_test(stat: dict, y_label_info: str) -> None:
+def dashboard_security(
+    stat: dict,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
+    top: int = 5,
+) -> None:
+    """
+    Creates a panel with the security events of the period:
+    - General Stats: Events, mitigated events, top country and top rule.
+    - Bar Charts: Top countries, IP addresses, rules and paths.
+
+    Args:
+        stat (dict): Output of utils_cloudflare.get_security_events.
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
+        top (int): Bars of every chart.
+
+    Returns:
+        None: Displays the generated plot.
+    """
+    content = stat["content"]
+    fig = plt.figure(figsize=(12, 8))
+    grid = fig.add_gridspec(3, 2, height_ratios=[1, 3, 3])
+    colors = ["#3CB5AE", "#A8DADC", "#D9D9D9"]
+
+    # Stats
+    header = fig.add_subplot(grid[0, :])
+    first = lambda table: content.get(table)[0][0] if content.get(table) else "-"
+    stats = [
+        ("Events", format_stat(content.get("total", 0), "numeric")),
+        ("Mitigated", format_stat(content.get("mitigated", 0), "numeric")),
+        ("Top country", first("countries")),
+        ("Top rule", first("rules")),
+    ]
+    for idx, (title, value) in enumerate(stats):
+        header.text((idx + 0.5) / 4, 0.6, title, ha="center", va="center", fontsize=12)
+        header.text(
+            (idx + 0.5) / 4, 0.3, value, ha="center", va="center", fontsize=14, fontweight="bold"
+        )
+    header.axis("off")
+
+    # Top tables
+    charts = [("countries", "Countries"), ("ips", "IP addresses"), ("rules", "Rules"), ("paths", "Paths")]
+    for idx, (table, title) in enumerate(charts):
+        ax = fig.add_subplot(grid[1 + idx // 2, idx % 2])
+        rows = content.get(table, [])[:top][::-1]
+        ax.set_title(title, fontsize=12, loc="left")
+        for spine in ("top", "right"):
+            ax.spines[spine].set_visible(False)
+        for spine in ("bottom", "left"):
+            ax.spines[spine].set_color(colors[2])
+        if not rows:
+            ax.text(0.5, 0.5, "No events", ha="center", va="center", color="gray")
+            ax.set_xticks([])
+            ax.set_yticks([])
+            continue
+        labels = [label if len(label) <= 30 else f"{label[:27]}..." for label, _ in rows]
+        ax.barh(labels, [count for _, count in rows], color=colors[0])
+        ax.tick_params(axis="y", labelsize=9)
+
+    plt.tight_layout()
+    save_figure(output, dpi, fmt)
+
+
+def dashboard_dns(
+    stat: dict,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
+    top: int = 5,
+) -> None:
+    """
+    Creates a panel with the DNS queries of the period:
+    - General Stats: Queries, top query name and share of NXDOMAIN answers.
+    - Time Series: Queries per day.
+    - Bar Charts: Top query names, record types, response codes and source IPs.
+
+    Args:
+        stat (dict): Output of utils_cloudflare.get_dns_analytics.
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
+        top (int): Bars of every chart.
+
+    Returns:
+        None: Displays the generated plot.
+    """
+    content = stat["content"]
+    fig = plt.figure(figsize=(12, 10))
+    grid = fig.add_gridspec(4, 2, height_ratios=[1, 2.5, 3, 3])
+    colors = ["#3CB5AE", "#A8DADC", "#D9D9D9"]
+
+    # Stats
+    total = content.get("total", 0)
+    codes = dict(content.get("codes", []))
+    names = content.get("names", [])
+    stats = [
+        ("Queries", format_stat(total, "numeric")),
+        ("Top name", names[0][0] if names else "-"),
+        ("NXDOMAIN", format_stat(codes.get("NXDOMAIN", 0) / total if total else None, "percent")),
+    ]
+    header = fig.add_subplot(grid[0, :])
+    for idx, (title, value) in enumerate(stats):
+        header.text((idx + 0.5) / 3, 0.6, title, ha="center", va="center", fontsize=12)
+        header.text(
+            (idx + 0.5) / 3, 0.3, value, ha="center", va="center", fontsize=14, fontweight="bold"
+        )
+    header.axis("off")
+
+    def clean(ax) -> None:
+        for spine in ("top", "right"):
+            ax.spines[spine].set_visible(False)
+        for spine in ("bottom", "left"):
+            ax.spines[spine].set_color(colors[2])
+
+    # Line graph
+    line = fig.add_subplot(grid[1, :])
+    dates = np.array(sorted(content.get("daily", {})))
+    values = np.array([content["daily"][day] for day in dates])
+    keep = downsample_indices([values], pixel_budget(12, dpi))
+    if keep.size < dates.size:
+        dates, values = dates[keep], values[keep]
+        line.xaxis.set_major_locator(MaxNLocator(nbins=6, integer=True))
+    line.plot(dates, values, linestyle="-", color=colors[0], label=stat["title"])
+    line.fill_between(dates, values, color=colors[1])
+    line.legend(loc="upper left", frameon=False)
+    clean(line)
+
+    # Top tables
+    charts = [("names", "Query names"), ("types", "Record types"), ("codes", "Response codes"), ("sources", "Source IPs")]
+    for idx, (table, title) in enumerate(charts):
+        ax = fig.add_subplot(grid[2 + idx // 2, idx % 2])
+        rows = content.get(table, [])[:top][::-1]
+        ax.set_title(title, fontsize=12, loc="left")
+        clean(ax)
+        if not rows:
+            ax.text(0.5, 0.5, "No queries", ha="center", va="center", color="gray")
+            ax.set_xticks([])
+            ax.set_yticks([])
+            continue
+        labels = [label if len(label) <= 30 else f"{label[:27]}..." for label, _ in rows]
+        ax.barh(labels, [count for _, count in rows], color=colors[0])
+        ax.tick_params(axis="y", labelsize=9)
+
+    plt.tight_layout()
+    save_figure(output, dpi, fmt)
+
+
+def dashboard_zone_table(
+    stat: dict,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
+) -> None:
+    """
+    Creates a table with the totals of every zone of an account.
+
+    Args:
+        stat (dict): Output of utils_account.zone_breakdown.
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
+
+    Returns:
+        None: Displays the generated plot.
+    """
+    rows = stat["content"]
+    fig, ax = plt.subplots(figsize=(12, 0.45 * (len(rows) + 1) + 0.5))
+    ax.axis("off")
+    cells = [
+        [
+            row["zone"],
+            format_stat(row["requests"], "numeric"),
+            format_stat(row["cache_hit_ratio"], "percent"),
+            format_stat(row["bandwidth"], "byte"),
+            format_stat(row["visits"], "numeric"),
+        ]
+        for row in rows
+    ]
+    table = ax.table(
+        cellText=cells or [["-"] * 5],
+        colLabels=["Zone", "Requests", "Cache hit ratio", "Bandwidth", "Visits"],
+        colWidths=[0.36, 0.16, 0.16, 0.16, 0.16],
+        cellLoc="right",
+        loc="upper center",
+    )
+    table.auto_set_font_size(False)
+    table.set_fontsize(11)
+    table.scale(1, 1.6)
+    for (row, col), cell in table.get_celld().items():
+        cell.set_edgecolor("#D9D9D9")
+        if col == 0:
+            cell.set_text_props(ha="left")
+            cell._loc = "left"
+        if row == 0:
+            cell.set_facecolor("#3CB5AE")
+            cell.set_text_props(color="white", fontweight="bold")
+        elif row % 2 == 0:
+            cell.set_facecolor("#F2F2F2")
+
+    plt.tight_layout()
+    save_figure(output, dpi, fmt)
+
+
+def dashboard_stat_test(
+    stat: dict,
+    y_label_info: str,
+    output: Union[str, BinaryIO] = "test.png",
+    dpi: int = 300,
+    fmt: str = "png",
+) -> None:
     """
     Creates a panel with stats and a timeseries:
     - General Stats: Displays total, max, and min for the period.
@@ -311,6 +667,9 @@ def dashboard_stat_test(stat: dict, y_label_info: str) -> None:
     Args:
         stat (dict): Contains title, metric dictionary, and type.
         y_label_info (str): Label for the Y-axis of the line chart.
+        output (str | BinaryIO): File path or buffer for the rendered image.
+        dpi (int): Resolution of the raster output.
+        fmt (str): Image format ("png", "svg", ...).
 
     Returns:
         None: Displays the generated plot.
@@ -358,13 +717,19 @@ def dashboard_stat_test(stat: dict, y_label_info: str) -> None:
 
     # Line graph
     colors = ["#3CB5AE", "#A8DADC", "#D9D9D9"]
-    dates = list(stat["content"].keys())
-    values = list(stat["content"].values())
+    dates = np.array(list(stat["content"].keys()))
+    values = np.array(list(stat["content"].values()))
+    keep = downsample_indices([values], pixel_budget(10, dpi))
+    downsampled = keep.size < dates.size
+    if downsampled:
+        dates, values = dates[keep], values[keep]
 
     axs[1].plot(
         dates, values, linestyle="-", color=colors[0], zorder=3, label=stat["title"]
     )
     axs[1].fill_between(dates, values, color=colors[0])
+    if downsampled:
+        axs[1].xaxis.set_major_locator(MaxNLocator(nbins=6, integer=True))
 
     axs[1].legend(loc="upper left", frameon=False)
 
@@ -386,5 +751,4 @@ def dashboard_stat_test(stat: dict, y_label_info: str) -> None:
 
     plt.xticks()
     plt.tight_layout()
-    plt.savefig("test.png", dpi=300, bbox_inches="tight")
-    plt.close()
+    save_figure(output, dpi, fmt)
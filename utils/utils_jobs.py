@@ -0,0 +1,182 @@
+"""
+V1 functions neccesary to generate reports in the background
+"""
+
+__version__ = "1.0.0"
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .utils_artifacts import ArtifactStore
+from .utils_report import report_artifact
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(PROJECT_ROOT, "cache", "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 32))
+JOB_STALE_AFTER = 3600  # seconds without updates before a job counts as dead
+# Error shown for a failed job, the exception itself is only logged
+JOB_ERROR = "No se pudo generar el reporte, intenta más tarde"
+
+# Share of the job done when each report step starts
+JOB_STEPS = {"queued": 0.0, "fetch": 0.1, "render": 0.5, "pdf": 0.8, "done": 1.0}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    client TEXT NOT NULL,
+    leq_date TEXT NOT NULL,
+    periods INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    step TEXT NOT NULL,
+    progress REAL NOT NULL,
+    error TEXT,
+    etag TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class QueueFull(Exception):
+    """
+    Raised when JOB_MAX_PENDING jobs are already queued or running.
+    """
+
+
+class JobQueue:
+    """
+    Report jobs run by a bounded pool of threads, with the status kept in
+    SQLite so any worker process can answer the polling requests.
+    Identical (client, leq_date, periods) jobs in flight share one job id,
+    also across processes using the same database. on_done is called with
+    (client, leq_date, periods) after every generated report. Without a
+    store the reports are generated but not kept (see report_artifact).
+    """
+
+    def __init__(
+        self,
+        store: Optional[ArtifactStore] = None,
+        db_path: str = JOBS_DB,
+        workers: int = JOB_WORKERS,
+        max_pending: int = JOB_MAX_PENDING,
+        on_done: Optional[Callable[[dict, str, int], None]] = None,
+    ):
+        self.store = store
+        self.on_done = on_done
+        self.db_path = db_path
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_key ON jobs (client, leq_date, periods, status)"
+            )
+            # Jobs of a process that died before finishing them
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted', updated = ? "
+                "WHERE status IN ('queued', 'running') AND updated < ?",
+                (time.time(), time.time() - JOB_STALE_AFTER),
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def submit(self, client: dict, leq_date: str, periods: int, refresh: bool = False) -> str:
+        """
+        Queues the report of a client, or joins the identical job in flight.
+        Args:
+            client (dict): Client with "name" and "zone_tag".
+            leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+            periods (int): Number of days in the range.
+            refresh (bool): Regenerate the report if it is already stored.
+        Returns:
+            str: The job id.
+        """
+        key = (client["name"], leq_date, periods)
+        with self._lock:
+            if key in self._inflight:
+                return self._inflight[key]
+            if len(self._inflight) >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} report jobs already pending.")
+            now = time.time()
+            with self._connect() as db:
+                row = db.execute(
+                    "SELECT id FROM jobs WHERE client = ? AND leq_date = ? AND periods = ? "
+                    "AND status IN ('queued', 'running') AND updated > ?",
+                    (*key, now - JOB_STALE_AFTER),
+                ).fetchone()
+                if row is not None:
+                    return row["id"]
+                job_id = uuid.uuid4().hex
+                db.execute(
+                    "INSERT INTO jobs (id, client, leq_date, periods, status, step, "
+                    "progress, created, updated) VALUES (?, ?, ?, ?, 'queued', 'queued', 0, ?, ?)",
+                    (job_id, client["name"], leq_date, periods, now, now),
+                )
+            self._inflight[key] = job_id
+        self._executor.submit(self._run, job_id, key, client, refresh)
+        return job_id
+
+    def _run(self, job_id: str, key: tuple, client: dict, refresh: bool) -> None:
+        _, leq_date, periods = key
+
+        def progress(step: str) -> None:
+            self._update(job_id, status="running", step=step, progress=JOB_STEPS[step])
+
+        try:
+            artifact = report_artifact(
+                client, leq_date, periods, self.store, refresh=refresh, progress=progress
+            )
+        except Exception:
+            logger.exception("Report job %s of %s failed", job_id, client["name"])
+            self._update(job_id, status="failed", error=JOB_ERROR)
+            return
+        else:
+            self._update(job_id, status="done", step="done", progress=1.0, etag=artifact["etag"])
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        if self.on_done is not None:
+            # The report is stored whatever happens to the bookkeeping
+            try:
+                self.on_done(client, leq_date, periods)
+            except Exception:
+                logger.exception("on_done failed for job %s", job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: The job row (id, client, leq_date, periods, status, step,
+            progress, error, etag, created, updated), None if unknown.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
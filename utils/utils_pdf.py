@@ -1,81 +1,361 @@
 """
-V4 functions neccesary to run the pdf creation
+V5 functions neccesary to run the pdf creation
 """
 
-__version__ = "4.0.0"
+__version__ = "5.0.0"
 
+import hashlib
+import io
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
+from typing import Optional
 
+import numpy as np
 from fpdf.fpdf import FPDF
+from PIL import Image
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_FOLDER = os.path.join(PROJECT_ROOT, "assets")
+PARENT_LOGO = os.path.join(BASE_FOLDER, "logo_sinhap.png")
 
-def create_pdf_report(client_name: str) -> None:
+# Image optimisation
+PDF_IMAGE_DPI = int(os.getenv("PDF_IMAGE_DPI", 200))
+FLAT_COLORS = 256  # palette size for flat colour images
+FLAT_COVERAGE = 0.95  # share of pixels the palette colours must cover
+JPEG_QUALITY = 85
+IMAGE_INFO_CACHE_SIZE = 64  # encoded charts kept between reports
+
+# Section texts
+HTTP_TRAFFIC_TEXT = "Facilita la identificación de patrones de tráfico, la eficiencia del caché y la distribución de visitantes, ayudando a optimizar el rendimiento y la capacidad de respuesta de la infraestructura."
+PROTOCOLS_TEXT = "Muestra los protocolos usados por el clienre, asegurando compatibilidad y eficiencia en la entrega de contenido, asi como información sobre el tipo de contenido más demandado, optimizando el uso de caché."
+ZONES_TEXT = "Desglose del tráfico de cada zona de la cuenta, ordenado por número de requests, con la eficiencia del caché, el ancho de banda y las visitas de cada una."
+SECURITY_TEXT = "Muestra las amenazas detectadas en la red, país de origen y tipo de ataque más. Asi como la actividad de bots/crawlers, ayudando a reforzar la seguridad y minimizar riesgos de tráfico malicioso."
+
+# Default report: every section with its text and the chart slots (mm).
+REPORT_LAYOUT = {
+    "logos": {
+        "parent": {"x": 10, "y": 10, "w": 50},
+        "client": {"x": 160, "y": 10, "w": 30},
+    },
+    "sections": [
+        {
+            "key": "http_traffic",
+            "title": "Http Traffic",
+            "text": HTTP_TRAFFIC_TEXT,
+            "slots": [
+                {"chart": "requests", "x": 10, "y": 60, "w": 95},
+                {"chart": "bandwidth", "x": 105, "y": 60, "w": 95},
+                {"chart": "visits", "x": 10, "y": 120, "w": 95},
+                {"chart": "efficiency", "x": 105, "y": 120, "w": 95},
+                {"chart": "map", "x": 30, "y": 185, "w": 150},
+            ],
+        },
+        {
+            "key": "protocols",
+            "title": "Protocol & Content delivery",
+            "text": PROTOCOLS_TEXT,
+            "new_page": True,
+            "slots": [{"chart": "versions", "x": 20, "y": 40, "w": 180}],
+            "space_after": 60,
+        },
+        {
+            "key": "security",
+            "title": "Security Events",
+            "text": SECURITY_TEXT,
+            "slots": [{"chart": "security", "x": 15, "y": 130, "w": 180}],
+        },
+    ],
+}
+
+# Section appended for the clients with several zones (see utils_account).
+ZONES_SECTION = {
+    "key": "zones",
+    "title": "Zones",
+    "text": ZONES_TEXT,
+    "new_page": True,
+    "slots": [{"chart": "zones", "x": 15, "y": 40, "w": 180}],
+}
+
+# Per client layouts, clients not listed use REPORT_LAYOUT.
+CLIENT_LAYOUTS = {}
+
+# Chart files used by create_pdf_report when no charts are given.
+CHART_FILES = {
+    "requests": "report_requests.png",
+    "bandwidth": "report_bandwidth.png",
+    "visits": "report_visits.png",
+    "map": "report_map.png",
+    "versions": "report_versions.png",
+}
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """
+    RGB (or grayscale) copy of the image with any transparency put on white.
+    """
+    if image.mode in ("RGBA", "LA", "P", "PA") or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, "white")
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    if image.mode not in ("RGB", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def _is_flat(image: Image.Image) -> bool:
+    """
+    True when FLAT_COLORS colours cover FLAT_COVERAGE of the pixels (charts,
+    logos), False for photographs and gradients.
+    """
+    pixels = np.asarray(image.convert("RGB"), dtype=np.uint32).reshape(-1, 3)
+    packed = (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+    counts = np.sort(np.unique(packed, return_counts=True)[1])[::-1]
+    return counts[:FLAT_COLORS].sum() >= FLAT_COVERAGE * packed.size
+
+
+def _png_info(png: bytes) -> dict:
+    """
+    FPDF image info from a non interlaced PNG without alpha, keeping the
+    compressed IDAT stream and its predictors as is.
+    """
+    pos, idat, pal = 8, [], b""
+    while pos < len(png):
+        length = int.from_bytes(png[pos : pos + 4], "big")
+        chunk_type = png[pos + 4 : pos + 8]
+        chunk = png[pos + 8 : pos + 8 + length]
+        pos += length + 12
+        if chunk_type == b"IHDR":
+            width = int.from_bytes(chunk[0:4], "big")
+            height = int.from_bytes(chunk[4:8], "big")
+            bpc, color_type = chunk[8], chunk[9]
+        elif chunk_type == b"PLTE":
+            pal = chunk
+        elif chunk_type == b"IDAT":
+            idat.append(chunk)
+        elif chunk_type == b"IEND":
+            break
+    colors = 3 if color_type == 2 else 1
+    return {
+        "w": width,
+        "h": height,
+        "cs": {0: "DeviceGray", 2: "DeviceRGB", 3: "Indexed"}[color_type],
+        "bpc": bpc,
+        "f": "FlateDecode",
+        "dp": f"/Predictor 15 /Colors {colors} /BitsPerComponent {bpc} /Columns {width}",
+        "data": b"".join(idat),
+        "pal": pal,
+        "trns": "",
+    }
+
+
+def _jpeg_info(image: Image.Image) -> dict:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return {
+        "w": image.width,
+        "h": image.height,
+        "cs": "DeviceGray" if image.mode == "L" else "DeviceRGB",
+        "bpc": 8,
+        "f": "DCTDecode",
+        "data": buffer.getvalue(),
+        "pal": "",
+        "trns": "",
+    }
+
+
+def _encode_png(image: Image.Image) -> dict:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return _png_info(buffer.getvalue())
+
+
+def image_info(
+    data: bytes, width_mm: Optional[float] = None, dpi: Optional[int] = PDF_IMAGE_DPI
+) -> dict:
+    """
+    Decodes an image into the structure FPDF embeds, in its smallest encoding:
+    - Resampled to dpi for the width it takes in the page (never upscaled).
+    - Flat colour images (charts, logos): palette PNG with FLAT_COLORS colours.
+    - Other images: the smallest of JPEG and RGB PNG.
+    Transparent images are flattened on white.
+    Args:
+        data (bytes): Encoded PNG or JPEG.
+        width_mm (float): Width of the image in the page, None keeps the size.
+        dpi (int): Target resolution, None keeps the size.
+    Returns:
+        dict: FPDF image info (w, h, cs, bpc, f, dp, data, pal, trns).
+    """
+    image = _flatten(Image.open(io.BytesIO(data)))
+    if width_mm and dpi:
+        target = max(1, round(width_mm / 25.4 * dpi))
+        if image.width > target:
+            height = max(1, round(image.height * target / image.width))
+            image = image.resize(
+                (target, height), Image.Resampling.LANCZOS, reducing_gap=3.0
+            )
+    if _is_flat(image):
+        palette = image.convert("RGB").quantize(
+            colors=FLAT_COLORS,
+            method=Image.Quantize.MEDIANCUT,
+            dither=Image.Dither.NONE,
+        )
+        return _encode_png(palette)
+    candidates = [_encode_png(image), _jpeg_info(image)]
+    return min(candidates, key=lambda info: len(info["data"]))
+
+
+_image_infos = OrderedDict()
+_image_infos_lock = threading.Lock()
+
+
+def cached_image_info(key: str, data: bytes, width_mm: float, dpi: Optional[int]) -> dict:
+    """
+    image_info of a chart, kept for the last IMAGE_INFO_CACHE_SIZE charts so
+    the unchanged sections of a regenerated report are not encoded again.
+    Args:
+        key (str): Content address of the chart and its width.
+    """
+    key = f"{key}:{dpi}"
+    with _image_infos_lock:
+        if key in _image_infos:
+            _image_infos.move_to_end(key)
+            return _image_infos[key]
+    info = image_info(data, width_mm, dpi)
+    with _image_infos_lock:
+        _image_infos[key] = info
+        while len(_image_infos) > IMAGE_INFO_CACHE_SIZE:
+            _image_infos.popitem(last=False)
+    return info
+
+
+@lru_cache(maxsize=None)
+def load_image(path: str, width_mm: Optional[float] = None) -> Optional[dict]:
+    """
+    Decodes an image file once per process (logos), None if it does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return image_info(f.read(), width_mm)
+
+
+def place_image(pdf: FPDF, key: str, info: dict, x: float, y: float, w: float) -> None:
+    """
+    Draws an already decoded image, embedding it only the first time the key
+    is used in the document.
+    """
+    if key not in pdf.images:
+        # FPDF drops the pixel data after writing, the shared info is kept intact
+        pdf.images[key] = dict(info, i=len(pdf.images) + 1)
+    pdf.image(key, x=x, y=y, w=w)
+
+
+def get_layout(client_name: str, account: bool = False) -> dict:
+    """
+    Layout of the client report, REPORT_LAYOUT by default. Account reports
+    (several zones) end with ZONES_SECTION.
+    """
+    layout = CLIENT_LAYOUTS.get(client_name, REPORT_LAYOUT)
+    if account:
+        layout = dict(layout, sections=[*layout["sections"], ZONES_SECTION])
+    return layout
+
+
+def build_pdf_report(
+    client_name: str,
+    charts: dict,
+    layout: Optional[dict] = None,
+    creation_date: Optional[str] = None,
+    image_dpi: Optional[int] = PDF_IMAGE_DPI,
+) -> bytes:
     """
-    Creates a PDF report with sections and manually placed images.
+    Builds the PDF report in memory from a declarative layout.
 
         Args:
-            client_name (str): Name of the client.
+            client_name (str): Name of the client, also used for "logo_<client_name>.png".
+            charts (dict): Encoded images by chart key (slot "chart" in the layout).
+            layout (dict): Sections and slots, defaults to get_layout(client_name).
+            creation_date (str): Date printed in the title, defaults to today.
+            image_dpi (int): Resolution charts are resampled to, None keeps them as is.
 
-    PDF will be saved as "<client_name>_<creation_date>.pdf".
+    Returns:
+        bytes: The PDF document. Slots without a chart are left empty.
+
+    Every image is embedded once (by content and size) in its smallest
+    encoding, see image_info.
     """
-    BASE_FOLDER = "../assets"
-    PARENT_LOGO = os.path.join(BASE_FOLDER, "logo_sinhap.png")
-    client_logo = os.path.join(BASE_FOLDER, f"logo_{client_name}.png")
+    layout = layout or get_layout(client_name)
+    creation_date = creation_date or datetime.today().strftime("%d-%m-%y")
     pdf = FPDF()
+    pdf.set_compression(True)
     pdf.add_page()
-    creation_date = datetime.today().strftime("%d-%m-%y")
 
     # Title
     pdf.set_font("Arial", size=16, style="B")
     pdf.cell(0, 10, txt=f"Reporte de red: {client_name}", ln=True, align="C")
     pdf.cell(0, 10, txt=f"{creation_date}", ln=True, align="C")
-    pdf.image(PARENT_LOGO, x=10, y=10, w=50)
-    pdf.image(client_logo, x=160, y=10, w=30)
+    logos = {
+        "parent": PARENT_LOGO,
+        "client": os.path.join(BASE_FOLDER, f"logo_{client_name}.png"),
+    }
+    for name, position in layout.get("logos", {}).items():
+        info = load_image(logos[name], position["w"])
+        if info is not None:
+            key = f"{logos[name]}:{position['w']}"
+            place_image(pdf, key, info, position["x"], position["y"], position["w"])
     pdf.ln(10)
 
-    # Section: HTTP Traffic
-    pdf.set_font("Arial", size=12, style="B")
-    pdf.cell(0, 10, txt="Http Traffic", ln=True, align="l")
-    pdf.set_font("Arial", size=12, style="I")
-    pdf.multi_cell(
-        0,
-        5,
-        txt="Facilita la identificación de patrones de tráfico, la eficiencia del caché y la distribución de visitantes, ayudando a optimizar el rendimiento y la capacidad de respuesta de la infraestructura.",
-        align="L",
-    )
-    pdf.image(os.path.join(BASE_FOLDER, "report_requests.png"), x=10, y=60, w=95)
-    pdf.image(os.path.join(BASE_FOLDER, "report_bandwidth.png"), x=105, y=60, w=95)
-    pdf.image(os.path.join(BASE_FOLDER, "report_visits.png"), x=10, y=120, w=95)
-    pdf.image(os.path.join(BASE_FOLDER, "report_map.png"), x=30, y=185, w=150)
-
-    # Section: Protocol & Content delivery
-    pdf.add_page()
-    pdf.set_font("Arial", size=12, style="B")
-    pdf.cell(0, 10, txt="Protocol & Content delivery", ln=True, align="l")
-    pdf.set_font("Arial", size=12, style="I")
-    pdf.multi_cell(
-        0,
-        5,
-        txt="Muestra los protocolos usados por el clienre, asegurando compatibilidad y eficiencia en la entrega de contenido, asi como información sobre el tipo de contenido más demandado, optimizando el uso de caché.",
-        align="L",
-    )
-    pdf.image(os.path.join(BASE_FOLDER, "report_versions.png"), x=20, y=40, w=180)
-    pdf.ln(60)
-
-    # Section: Security Events
-    pdf.set_font("Arial", size=12, style="B")
-    pdf.cell(0, 10, txt="Security Events", ln=True, align="l")
-    pdf.set_font("Arial", size=12, style="I")
-    pdf.multi_cell(
-        0,
-        5,
-        txt="Muestra las amenazas detectadas en la red, país de origen y tipo de ataque más. Asi como la actividad de bots/crawlers, ayudando a reforzar la seguridad y minimizar riesgos de tráfico malicioso.",
-        align="L",
-    )
+    # Sections
+    for section in layout["sections"]:
+        if section.get("new_page"):
+            pdf.add_page()
+        pdf.set_font("Arial", size=12, style="B")
+        pdf.cell(0, 10, txt=section["title"], ln=True, align="l")
+        pdf.set_font("Arial", size=12, style="I")
+        pdf.multi_cell(0, 5, txt=section["text"], align="L")
+        for slot in section["slots"]:
+            data = charts.get(slot["chart"])
+            if data is None:
+                continue
+            key = f"{hashlib.sha1(data).hexdigest()}:{slot['w']}"
+            info = pdf.images.get(key) or cached_image_info(key, data, slot["w"], image_dpi)
+            place_image(pdf, key, info, slot["x"], slot["y"], slot["w"])
+        if section.get("space_after"):
+            pdf.ln(section["space_after"])
+
+    return pdf.output(dest="S").encode("latin1")
+
+
+def create_pdf_report(client_name: str, charts: Optional[dict] = None) -> str:
+    """
+    Creates a PDF report with sections and the charts placed by the layout.
+
+        Args:
+            client_name (str): Name of the client.
+            charts (dict): Encoded images by chart key, defaults to the
+                "report_*.png" files in the assets folder.
+
+    PDF will be saved as "<client_name>_<creation_date>.pdf".
+
+    Returns:
+        str: Path of the saved PDF.
+    """
+    if charts is None:
+        charts = {}
+        for chart, file_name in CHART_FILES.items():
+            with open(os.path.join(BASE_FOLDER, file_name), "rb") as f:
+                charts[chart] = f.read()
+    creation_date = datetime.today().strftime("%d-%m-%y")
+    document = build_pdf_report(client_name, charts, creation_date=creation_date)
 
     # Save the PDF
     folder = os.path.join(BASE_FOLDER, "reports")
     os.makedirs(folder, exist_ok=True)
     file_name = os.path.join(folder, f"{client_name}_{creation_date}.pdf")
-    pdf.output(file_name)
\ No newline at end of file
+    with open(file_name, "wb") as f:
+        f.write(document)
+    return file_name
@@ -0,0 +1,157 @@
+"""
+V1 functions neccesary to warm the caches of a report before it is requested
+"""
+
+__version__ = "1.0.0"
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .utils_artifacts import ArtifactStore
+from .utils_cache import ChartCache
+from .utils_fetcher import BATCH
+from .utils_jobs import JOBS_DB
+from .utils_report import client_report_data, render_report_charts, report_charts, report_key
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 2))
+PREFETCH_SLOT_TTL = 900  # seconds a page selection is remembered
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prefetch (
+    slot TEXT PRIMARY KEY,
+    selection TEXT NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class Prefetcher:
+    """
+    Fetches the data and renders the charts of a report selection in the
+    background, so the report job finds the fetch and chart caches warm.
+    Each page has a slot holding its latest selection, kept in SQLite so
+    every process sees it: a task whose selection is no longer the one of
+    its slot is dropped if still queued and stops before its next step
+    (the fetch, then every chart) if running. A report already in the
+    artifact store is not prefetched. The fetches run at BATCH priority, a
+    report asked for while they are still queued fetches at INTERACTIVE
+    priority instead of waiting for them (see utils_api.fetch_metrics).
+    """
+
+    def __init__(
+        self,
+        db_path: str = JOBS_DB,
+        workers: int = PREFETCH_WORKERS,
+        cache: Optional[ChartCache] = None,
+        artifacts: Optional[ArtifactStore] = None,
+    ):
+        self.db_path = db_path
+        self.cache = cache
+        self.artifacts = artifacts
+        self.started = 0
+        self.cancelled = 0
+        self.stored = 0
+        self.done = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._futures = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def start(self, slot: str, client: dict, leq_date: str, periods: int) -> str:
+        """
+        Makes (client, leq_date, periods) the selection of a slot and warms
+        its caches, the previous selection of the slot is cancelled.
+        Args:
+            slot (str): Page the selection comes from.
+            client (dict): Client with "name" and "zone_tag".
+            leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+            periods (int): Number of days in the range.
+        Returns:
+            str: "started", or "unchanged" when it already is the selection.
+        """
+        selection = json.dumps([client["name"], leq_date, periods])
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT selection FROM prefetch WHERE slot = ?", (slot,)).fetchone()
+            if row is not None and row[0] == selection:
+                return "unchanged"
+            db.execute(
+                "INSERT OR REPLACE INTO prefetch (slot, selection, updated) VALUES (?, ?, ?)",
+                (slot, selection, now),
+            )
+            db.execute("DELETE FROM prefetch WHERE updated < ?", (now - PREFETCH_SLOT_TTL,))
+        with self._lock:
+            previous = self._futures.get(slot)
+            if previous is not None and previous.cancel():
+                self.cancelled += 1
+            self.started += 1
+            future = self._executor.submit(self._run, slot, selection, client, leq_date, periods)
+            self._futures[slot] = future
+        future.add_done_callback(lambda done: self._forget(slot, done))
+        return "started"
+
+    def _forget(self, slot: str, future) -> None:
+        with self._lock:
+            if self._futures.get(slot) is future:
+                del self._futures[slot]
+
+    def is_current(self, slot: str, selection: str) -> bool:
+        """
+        Whether selection is still the one of the slot.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT selection FROM prefetch WHERE slot = ?", (slot,)).fetchone()
+        return row is not None and row[0] == selection
+
+    def _run(self, slot: str, selection: str, client: dict, leq_date: str, periods: int) -> str:
+        try:
+            if not self.is_current(slot, selection):
+                return self._count("cancelled")
+            if self.artifacts is not None and self.artifacts.exists(report_key(client, leq_date, periods)):
+                return self._count("stored")
+            data = client_report_data(client, leq_date, periods, BATCH)
+            for chart in report_charts(data):
+                if not self.is_current(slot, selection):
+                    return self._count("cancelled")
+                render_report_charts(data, self.cache, [chart])
+        except Exception:
+            # The report job retries and reports the error to the user
+            logger.exception("Prefetch of %s failed", client["name"])
+            return self._count("failed")
+        return self._count("done")
+
+    def _count(self, outcome: str) -> str:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        return outcome
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Prefetches started, cancelled, stored (report already in the
+            artifact store), done, failed and running in this process.
+        """
+        with self._lock:
+            return {
+                "started": self.started,
+                "cancelled": self.cancelled,
+                "stored": self.stored,
+                "done": self.done,
+                "failed": self.failed,
+                "running": len(self._futures),
+            }
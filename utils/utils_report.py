@@ -0,0 +1,312 @@
+"""
+V1 functions neccesary to generate a full report (fetch, charts, pdf)
+"""
+
+__version__ = "1.0.0"
+
+import hashlib
+import json
+import logging
+import time
+from typing import Callable, Optional
+
+from . import utils_image
+from .utils_account import fetch_account_data
+from .utils_api import TIMESERIES_METRICS, fetch_metrics
+from .utils_artifacts import ArtifactStore
+from .utils_cache import ChartCache, render_chart
+from .utils_calendar import client_timezone, fetch_local_metrics, fill_days
+from .utils_cloudflare import DatasetUnavailable
+from .utils_derived import derive_metrics
+from .utils_fetcher import INTERACTIVE
+from .utils_pdf import build_pdf_report, get_layout
+from .utils_store import UNIQUE_METRICS
+
+logger = logging.getLogger(__name__)
+
+# Metrics fetched for a report
+REPORT_METRICS = [
+    "requests",
+    "cached_requests",
+    "bandwidth",
+    "cached_bandwidth",
+    "visits",
+    "requests_per_location",
+    "http_versions",
+    "ssl_traffic",
+    "content_type",
+]
+
+# Report charts: renderer (see utils_cache.CHARTS), metrics passed in order
+# and the extra arguments.
+CHART_SPECS = {
+    "requests": ("stat_graph", ["requests", "cached_requests"], ["Uncached requests", "Requests"]),
+    "bandwidth": ("stat_graph", ["bandwidth", "cached_bandwidth"], ["Uncached bandwidth", "MB"]),
+    "visits": ("stat", ["visits"], ["Visits"]),
+    "efficiency": ("ratio_graph", ["cache_hit_ratio", "byte_hit_ratio"], []),
+    "map": ("table_map", ["requests_per_location"], []),
+    "versions": ("pie_bar", ["http_versions", "ssl_traffic", "content_type"], []),
+    "security": ("security", ["security_events"], []),
+    "zones": ("zone_table", ["zone_breakdown"], []),
+}
+
+
+def fetch_report_data(
+    zone_tag: str,
+    leq_date: str,
+    periods: int,
+    tenant: Optional[str] = None,
+    priority: str = INTERACTIVE,
+    tz: Optional[str] = None,
+) -> dict:
+    """
+    Fetches every metric of a report through the shared fetch cache, plus
+    the ratios derived from them (see utils_derived) and the security events.
+    Time series have every day of the window, missing ones as 0 (None in
+    the ratios).
+    Args:
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        tenant (str): Client the fetches count for, defaults to the zone client.
+        priority (str): INTERACTIVE or BATCH (see utils_fetcher).
+        tz (str): IANA timezone, the time series (but visits) are then added
+            up from hourly data into its local days (see utils_calendar).
+    Returns:
+        dict: Stat dicts by metric key (see REPORT_METRICS) and ratio.
+    """
+    local = [
+        metric for metric in REPORT_METRICS
+        if tz and metric in TIMESERIES_METRICS and metric not in UNIQUE_METRICS
+    ]
+    data = fetch_metrics(
+        [metric for metric in REPORT_METRICS if metric not in local],
+        zone_tag, leq_date, periods, tenant, priority,
+    )
+    if local:
+        data.update(fetch_local_metrics(zone_tag, leq_date, periods, tz, local, tenant, priority))
+    # Ratios from the days fetched, a day missing a metric is a gap not a 0%
+    derived = {
+        metric: fill_days(stat, leq_date, periods, missing=None)
+        for metric, stat in derive_metrics({zone_tag: data})[zone_tag].items()
+    }
+    for metric in REPORT_METRICS:
+        if metric in TIMESERIES_METRICS:
+            data[metric] = fill_days(data[metric], leq_date, periods)
+    try:
+        data.update(fetch_metrics(["security_events"], zone_tag, leq_date, periods, tenant, priority))
+    except DatasetUnavailable as e:
+        # Firewall analytics depend on the zone plan, the section is left empty
+        logger.info("Security section left empty: %s", e)
+        data["security_events"] = {"title": "Security Events", "content": {}, "type": "numeric"}
+    return {**data, **derived}
+
+
+def client_report_data(
+    client: dict, leq_date: str, periods: int, priority: str = INTERACTIVE
+) -> dict:
+    """
+    Report data of a client: its zone, in its local days when it has a
+    "timezone", or all of them merged when it has "zones" (see
+    utils_account.fetch_account_data, UTC days).
+    """
+    if client.get("zones"):
+        return fetch_account_data(client, leq_date, periods, priority)
+    return fetch_report_data(
+        client["zone_tag"], leq_date, periods, client["name"], priority, client_timezone(client)
+    )
+
+
+def client_layout(client: dict) -> dict:
+    """
+    PDF layout of a client, with the zones section for account reports.
+    """
+    return get_layout(client["name"], account=bool(client.get("zones")))
+
+
+def report_charts(data: dict) -> list:
+    """
+    Keys of CHART_SPECS with all their metrics in data.
+    """
+    return [
+        chart for chart, (_, metrics, _) in CHART_SPECS.items()
+        if all(metric in data for metric in metrics)
+    ]
+
+
+def render_report_charts(
+    data: dict, cache: Optional[ChartCache] = None, charts: Optional[list] = None
+) -> dict:
+    """
+    Renders the report charts, keyed like the slots of the PDF layout.
+    Args:
+        data (dict): Output of fetch_report_data.
+        cache (ChartCache): Chart cache, defaults to the process one.
+        charts (list): Keys of CHART_SPECS to render, defaults to all those
+            with their metrics in data.
+    Returns:
+        dict: Encoded PNG images by chart key.
+    """
+    rendered = {}
+    for chart in report_charts(data) if charts is None else charts:
+        renderer, metrics, extra = CHART_SPECS[chart]
+        args = [data[metric] for metric in metrics] + list(extra)
+        rendered[chart] = render_chart(renderer, *args, cache=cache)
+    return rendered
+
+
+def section_fingerprint(section: dict, data: dict) -> str:
+    """
+    Dependency fingerprint of a layout section: the charts it places and the
+    data of the metrics those charts use.
+    Args:
+        section (dict): Section of the PDF layout.
+        data (dict): Output of fetch_report_data.
+    Returns:
+        str: SHA-256 hex digest, changes only when the section output would.
+    """
+    charts = [slot["chart"] for slot in section["slots"]]
+    inputs = {
+        "charts": {chart: CHART_SPECS[chart] for chart in charts},
+        "data": {
+            metric: data[metric]
+            for chart in charts
+            for metric in CHART_SPECS[chart][1]
+        },
+        "version": utils_image.__version__,
+    }
+    encoded = json.dumps(
+        inputs, sort_keys=True, separators=(",", ":"), default=str
+    ).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def render_report_sections(
+    client_name: str,
+    data: dict,
+    base: str,
+    store: ArtifactStore,
+    cache: Optional[ChartCache] = None,
+    layout: Optional[dict] = None,
+) -> tuple:
+    """
+    Renders only the sections whose fingerprint changed since the last
+    generation of the report, the charts of the other sections are read back
+    from the store.
+    Args:
+        client_name (str): Name of the client, selects the layout.
+        data (dict): Output of fetch_report_data.
+        base (str): Artifact key prefix of the report, "<base>/<chart>.png"
+            holds the charts and "<base>/sections.json" the fingerprints.
+        store (ArtifactStore): Store of the section manifest and charts.
+        cache (ChartCache): Chart cache, defaults to the process one.
+        layout (dict): PDF layout, defaults to get_layout(client_name).
+    Returns:
+        tuple: Charts by chart key and the names of the regenerated sections.
+    """
+    manifest_key = f"{base}/sections.json"
+    stored = store.get(manifest_key)
+    previous = json.loads(stored["data"]) if stored else {}
+    manifest, charts, regenerated = {}, {}, []
+    for section in (layout or get_layout(client_name))["sections"]:
+        fingerprint = section_fingerprint(section, data)
+        names = [slot["chart"] for slot in section["slots"]]
+        reused = {}
+        if previous.get(section["key"]) == fingerprint:
+            for chart in names:
+                artifact = store.get(f"{base}/{chart}.png")
+                if artifact is None:
+                    break
+                reused[chart] = artifact["data"]
+        if len(reused) == len(names):
+            charts.update(reused)
+        else:
+            rendered = render_report_charts(data, cache, names)
+            for chart, image in rendered.items():
+                store.put(f"{base}/{chart}.png", image)
+            charts.update(rendered)
+            regenerated.append(section["key"])
+        manifest[section["key"]] = fingerprint
+    if manifest != previous:
+        store.put(manifest_key, json.dumps(manifest, sort_keys=True).encode("utf-8"))
+    return charts, regenerated
+
+
+def generate_report(
+    client_name: str, zone_tag: str, leq_date: str, periods: int
+) -> bytes:
+    """
+    Fetches, renders and builds the PDF report of a client.
+    Args:
+        client_name (str): Name of the client.
+        zone_tag (str): Unique identifier for the Cloudflare zone.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+    Returns:
+        bytes: The PDF document.
+    """
+    data = fetch_report_data(zone_tag, leq_date, periods)
+    return build_pdf_report(client_name, render_report_charts(data))
+
+
+def report_key(client: dict, leq_date: str, periods: int) -> str:
+    """
+    ArtifactStore key of the PDF report of a client.
+    """
+    return f"{client['name']}/{leq_date}_{periods}.pdf"
+
+
+def report_artifact(
+    client: dict,
+    leq_date: str,
+    periods: int,
+    store: Optional[ArtifactStore] = None,
+    refresh: bool = False,
+    progress: Optional[Callable[[str], None]] = None,
+    priority: str = INTERACTIVE,
+) -> dict:
+    """
+    Report of a client from the artifact store, generated (and written
+    through to the store) when it is not there yet.
+    Args:
+        client (dict): Client with "name" and "zone_tag", or "zones" for an
+            account report.
+        leq_date (str): End date of the range (inclusive) "YYYY-MM-DD".
+        periods (int): Number of days in the range.
+        store (ArtifactStore): Store used for lookups and write-through, None
+            always generates the report.
+        refresh (bool): Regenerate a stored report, only the sections whose
+            data changed are rendered again (see render_report_sections).
+        progress (Callable): Called with the step being run ("fetch",
+            "render", "pdf").
+        priority (str): Priority of the fetches (see utils_fetcher).
+    Returns:
+        dict: data (PDF bytes), etag and created (epoch seconds).
+    """
+    progress = progress or (lambda step: None)
+    if store is None:
+        progress("fetch")
+        data = client_report_data(client, leq_date, periods, priority)
+        progress("render")
+        charts = render_report_charts(data)
+        progress("pdf")
+        document = build_pdf_report(client["name"], charts, client_layout(client))
+        return {
+            "data": document,
+            "etag": hashlib.sha256(document).hexdigest()[:32],
+            "created": time.time(),
+        }
+    key = report_key(client, leq_date, periods)
+    base = key.removesuffix(".pdf")
+    artifact = store.get(key)
+    if artifact is not None and not refresh:
+        return artifact
+    progress("fetch")
+    data = client_report_data(client, leq_date, periods, priority)
+    progress("render")
+    layout = client_layout(client)
+    charts, regenerated = render_report_sections(client["name"], data, base, store, layout=layout)
+    if artifact is not None and not regenerated:
+        return artifact
+    progress("pdf")
+    return store.put(key, build_pdf_report(client["name"], charts, layout))
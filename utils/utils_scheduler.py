@@ -0,0 +1,279 @@
+"""
+V1 functions neccesary to run the daily snapshots and automatic reports
+
+Usage:
+    python -m utils.utils_scheduler [--once]
+"""
+
+__version__ = "1.0.0"
+
+import argparse
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from .config import load_clients
+from .utils_anomaly import AnomalyDetector
+from .utils_artifacts import ArtifactStore
+from .utils_fetcher import BATCH
+from .utils_report import report_artifact
+from .utils_store import MetricStore, ingest_daily
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEDULER_DB = os.getenv(
+    "SCHEDULER_DB", os.path.join(PROJECT_ROOT, "cache", "scheduler.sqlite3")
+)
+SCHEDULER_HOUR = int(os.getenv("SCHEDULER_HOUR", 2))  # UTC hour the day is closed
+SCHEDULER_INTERVAL = int(os.getenv("SCHEDULER_INTERVAL", 300))  # seconds between ticks
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", 2))
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", 60))  # max seconds before a run
+CATCHUP_DAYS = 7  # the free plan only keeps the last 7 days
+LEASE_TTL = 1800  # seconds a run is locked for its owner
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    task TEXT NOT NULL,
+    client TEXT NOT NULL,
+    date TEXT NOT NULL,
+    finished REAL NOT NULL,
+    PRIMARY KEY (task, client, date)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def client_schedule(client: dict) -> dict:
+    """
+    Schedule of a client, from its optional "schedule" entry in clients.json:
+        - "hour" (int): UTC hour after which the previous day is collected.
+        - "reports" (bool): Generate reports automatically.
+        - "report_every" (int): Days between reports, defaults to the plan.
+    Returns:
+        dict: hour, reports, report_every and window (plan days).
+    """
+    schedule = client.get("schedule", {})
+    window = client.get("plan", 7)
+    return {
+        "hour": schedule.get("hour", SCHEDULER_HOUR),
+        "reports": schedule.get("reports", True),
+        "report_every": schedule.get("report_every", window),
+        "window": window,
+    }
+
+
+class Scheduler:
+    """
+    Runs the daily ingestion of every client into the metric store and their
+    periodic reports. Missed days are caught up on the next tick, and a lease
+    per run in SQLite keeps several app processes from running it twice.
+    """
+
+    def __init__(
+        self,
+        store: Optional[MetricStore] = None,
+        artifacts: Optional[ArtifactStore] = None,
+        detector: Optional[AnomalyDetector] = None,
+        clients: Callable[[], list] = load_clients,
+        db_path: str = SCHEDULER_DB,
+        workers: int = SCHEDULER_WORKERS,
+        jitter: float = SCHEDULER_JITTER,
+        interval: float = SCHEDULER_INTERVAL,
+    ):
+        self.store = store or MetricStore()
+        self.artifacts = artifacts or ArtifactStore()
+        self.detector = detector or AnomalyDetector(self.store.db_path)
+        self.clients = clients
+        self.db_path = db_path
+        self.jitter = jitter
+        self.interval = interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scheduler")
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _last_run(self, task: str, client: str) -> Optional[date]:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT MAX(date) FROM runs WHERE task = ? AND client = ?", (task, client)
+            ).fetchone()
+        return date.fromisoformat(row[0]) if row[0] else None
+
+    def _acquire(self, name: str) -> bool:
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, "
+                "expires = excluded.expires WHERE leases.expires < ?",
+                (name, self.owner, now + LEASE_TTL, now),
+            )
+            return cursor.rowcount == 1
+
+    def _release(self, name: str) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+    def due_runs(self, now: Optional[datetime] = None) -> list:
+        """
+        Runs due at now, one per client and task with the missed days folded in.
+        Returns:
+            list: (task, client, leq_date, periods) with task "ingest" or "report".
+        """
+        now = now or datetime.now(timezone.utc)
+        runs = []
+        for client in self.clients():
+            schedule = client_schedule(client)
+            # Last day closed for the client
+            due = now.date() - timedelta(days=1 if now.hour >= schedule["hour"] else 2)
+            last = self._last_run("ingest", client["name"])
+            if last is None or last < due:
+                missed = (due - last).days if last else schedule["window"]
+                runs.append(("ingest", client, due, min(missed, CATCHUP_DAYS)))
+            if not schedule["reports"]:
+                continue
+            last = self._last_run("report", client["name"])
+            if last is None or (due - last).days >= schedule["report_every"]:
+                # Only the latest missed report, older windows are superseded
+                runs.append(("report", client, due, schedule["window"]))
+        return runs
+
+    def _run(self, task: str, client: dict, leq_date: date, periods: int) -> Optional[str]:
+        name = f"{task}:{client['name']}:{leq_date.isoformat()}"
+        if not self._acquire(name):
+            return None
+        try:
+            # Another process may have finished it between due_runs and the lease
+            last = self._last_run(task, client["name"])
+            if last is not None and last >= leq_date:
+                return None
+            if self._stop.wait(random.uniform(0, self.jitter)):
+                return None
+            if task == "ingest":
+                ingest_daily(self.store, client, leq_date.isoformat(), periods)
+            else:
+                report_artifact(
+                    client, leq_date.isoformat(), periods, self.artifacts, priority=BATCH
+                )
+                self.store.record_report(client["name"], leq_date.isoformat(), periods, mode="auto")
+            with self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO runs (task, client, date, finished) VALUES (?, ?, ?, ?)",
+                    (task, client["name"], leq_date.isoformat(), time.time()),
+                )
+            return name
+        finally:
+            self._release(name)
+
+    def tick(self, now: Optional[datetime] = None) -> dict:
+        """
+        Runs everything due, at most `workers` runs at a time. The ingestion
+        of a client runs before its report, and the days ingested are then
+        checked for anomalies across every client at once.
+        Returns:
+            dict: "done" (run names), "skipped" (leased or already done by
+            another process), "errors" (run name -> message) and "alerts"
+            (see AnomalyDetector).
+        """
+        by_client = {}
+        for run in self.due_runs(now):
+            by_client.setdefault(run[1]["name"], []).append(run)
+        result = {"done": [], "skipped": [], "errors": {}, "alerts": []}
+
+        def run_client(runs: list) -> None:
+            for task, client, leq_date, periods in runs:
+                name = f"{task}:{client['name']}:{leq_date.isoformat()}"
+                try:
+                    if self._run(task, client, leq_date, periods) is None:
+                        result["skipped"].append(name)
+                    else:
+                        result["done"].append(name)
+                except Exception as e:
+                    result["errors"][name] = str(e)
+                    break
+
+        futures = [self._executor.submit(run_client, runs) for runs in by_client.values()]
+        for future in futures:
+            future.result()
+        if any(name.startswith("ingest:") for name in result["done"]):
+            since = (now or datetime.now(timezone.utc)).date() - timedelta(days=CATCHUP_DAYS + 1)
+            try:
+                result["alerts"] = self.detector.scan(self.store, since.isoformat())
+            except Exception as e:
+                result["errors"]["anomalies"] = str(e)
+        return result
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """
+        Ticks every `interval` seconds in a daemon thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the daily snapshots and reports.")
+    parser.add_argument("--once", action="store_true", help="Run what is due and exit.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    scheduler = Scheduler()
+    if not args.once:
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop()
+        return
+    result = scheduler.tick()
+    for name in result["done"]:
+        logger.info("done %s", name)
+    for name in result["skipped"]:
+        logger.info("skipped %s (done or running elsewhere)", name)
+    for alert in result["alerts"]:
+        logger.warning(
+            "ALERT %s %s %s: %g (expected %g)",
+            alert["client"], alert["signal"], alert["date"], alert["value"], alert["expected"],
+        )
+    for name, error in result["errors"].items():
+        logger.error("%s: %s", name, error)
+
+
+if __name__ == "__main__":
+    main()
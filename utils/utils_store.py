@@ -0,0 +1,441 @@
+"""
+V1 functions neccesary to persist the daily snapshots and their aggregates
+"""
+
+__version__ = "1.0.0"
+
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+from typing import Iterator, Optional
+
+from .utils_api import TIMESERIES_METRICS, fetch_metrics
+from .utils_fetcher import BATCH
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS_DB = os.getenv("METRICS_DB", os.path.join(PROJECT_ROOT, "cache", "metrics.sqlite3"))
+
+# Client key of the totals across every client
+ALL_CLIENTS = "*"
+
+# Daily unique counts: the uniques of a window are between its busiest day
+# and the sum of its days (visitors coming back on several days)
+UNIQUE_METRICS = {"visits"}
+
+# Every write to daily keeps totals up to date, so reading an aggregate is
+# a primary key lookup whatever the number of clients and days stored. The
+# weekly (bucket = Monday) and monthly (bucket = 1st) rollups are kept the
+# same way, and outlive the days deleted by prune.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily (
+    client TEXT NOT NULL,
+    zone_tag TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (zone_tag, metric, date)
+);
+CREATE INDEX IF NOT EXISTS daily_client ON daily (client, metric, date);
+
+CREATE TABLE IF NOT EXISTS totals (
+    client TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (client, metric)
+);
+
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client TEXT NOT NULL,
+    leq_date TEXT NOT NULL,
+    periods INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_client ON reports (client, created);
+
+CREATE TRIGGER IF NOT EXISTS daily_insert AFTER INSERT ON daily BEGIN
+    INSERT INTO totals (client, metric, value) VALUES (NEW.client, NEW.metric, NEW.value)
+        ON CONFLICT (client, metric) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO totals (client, metric, value) VALUES ('*', NEW.metric, NEW.value)
+        ON CONFLICT (client, metric) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_update AFTER UPDATE OF value ON daily BEGIN
+    UPDATE totals SET value = value + NEW.value - OLD.value
+        WHERE client IN (NEW.client, '*') AND metric = NEW.metric;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_delete AFTER DELETE ON daily BEGIN
+    UPDATE totals SET value = value - OLD.value
+        WHERE client IN (OLD.client, '*') AND metric = OLD.metric;
+END;
+
+CREATE TABLE IF NOT EXISTS rollups (
+    client TEXT NOT NULL,
+    zone_tag TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    total REAL NOT NULL,
+    peak REAL NOT NULL,
+    days INTEGER NOT NULL,
+    PRIMARY KEY (zone_tag, metric, period, bucket)
+);
+CREATE INDEX IF NOT EXISTS rollups_client ON rollups (client, metric, period, bucket);
+
+CREATE TRIGGER IF NOT EXISTS rollups_insert AFTER INSERT ON daily BEGIN
+    INSERT INTO rollups (client, zone_tag, metric, period, bucket, total, peak, days)
+        VALUES (NEW.client, NEW.zone_tag, NEW.metric, 'week', date(NEW.date, '-6 days', 'weekday 1'), NEW.value, NEW.value, 1)
+        ON CONFLICT (zone_tag, metric, period, bucket) DO UPDATE SET
+            total = total + excluded.total, peak = MAX(peak, excluded.peak), days = days + 1;
+    INSERT INTO rollups (client, zone_tag, metric, period, bucket, total, peak, days)
+        VALUES (NEW.client, NEW.zone_tag, NEW.metric, 'month', date(NEW.date, 'start of month'), NEW.value, NEW.value, 1)
+        ON CONFLICT (zone_tag, metric, period, bucket) DO UPDATE SET
+            total = total + excluded.total, peak = MAX(peak, excluded.peak), days = days + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollups_update AFTER UPDATE OF value ON daily BEGIN
+    UPDATE rollups SET
+        total = total + NEW.value - OLD.value,
+        peak = CASE WHEN NEW.value >= peak THEN NEW.value WHEN OLD.value < peak THEN peak ELSE (
+            SELECT MAX(value) FROM daily WHERE zone_tag = NEW.zone_tag AND metric = NEW.metric
+                AND date BETWEEN rollups.bucket AND date(rollups.bucket, CASE rollups.period
+                    WHEN 'week' THEN '+6 days' ELSE '+1 month' END, CASE rollups.period
+                    WHEN 'week' THEN '+0 days' ELSE '-1 day' END)
+        ) END
+        WHERE zone_tag = NEW.zone_tag AND metric = NEW.metric AND (
+            (period = 'week' AND bucket = date(NEW.date, '-6 days', 'weekday 1'))
+            OR (period = 'month' AND bucket = date(NEW.date, 'start of month')));
+END;
+
+CREATE TRIGGER IF NOT EXISTS reports_insert AFTER INSERT ON reports BEGIN
+    INSERT INTO totals (client, metric, value) VALUES (NEW.client, 'reports', 1)
+        ON CONFLICT (client, metric) DO UPDATE SET value = value + 1;
+    INSERT INTO totals (client, metric, value) VALUES ('*', 'reports', 1)
+        ON CONFLICT (client, metric) DO UPDATE SET value = value + 1;
+END;
+"""
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def rollup_plan(geq_date: str, leq_date: str) -> dict:
+    """
+    Splits a window into the fewest whole months and weeks (Monday to Sunday)
+    plus the days on its edges.
+    Args:
+        geq_date (str): Start date of the window (inclusive) "YYYY-MM-DD".
+        leq_date (str): End date of the window (inclusive) "YYYY-MM-DD".
+    Returns:
+        dict: "month", "week" (bucket start dates) and "day" lists.
+    """
+    day, last = date.fromisoformat(geq_date), date.fromisoformat(leq_date)
+    plan = {"month": [], "week": [], "day": []}
+    while day <= last:
+        month_end = _next_month(day) - timedelta(days=1)
+        if day.day == 1 and month_end <= last:
+            plan["month"].append(day.isoformat())
+            day = month_end + timedelta(days=1)
+            continue
+        week_end = day + timedelta(days=6)
+        # A week must not take the first days of a month usable as a whole
+        splits_month = (
+            week_end >= _next_month(day)
+            and _next_month(_next_month(day)) - timedelta(days=1) <= last
+        )
+        if day.weekday() == 0 and week_end <= last and not splits_month:
+            plan["week"].append(day.isoformat())
+            day = week_end + timedelta(days=1)
+        else:
+            plan["day"].append(day.isoformat())
+            day += timedelta(days=1)
+    return plan
+
+
+class MetricStore:
+    """
+    SQLite store of the daily value of every time series metric per zone,
+    with totals per client (and across all clients) and weekly and monthly
+    rollups per zone materialised by triggers.
+    """
+
+    def __init__(self, db_path: str = METRICS_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            stale = db.execute(
+                "SELECT EXISTS (SELECT 1 FROM daily) AND NOT EXISTS (SELECT 1 FROM rollups)"
+            ).fetchone()[0]
+        if stale:
+            self.rebuild_rollups()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def upsert_daily(self, client: str, zone_tag: str, metric: str, stat: dict) -> int:
+        """
+        Stores the daily values of a metric, replacing the days already stored.
+        Args:
+            client (str): Name of the client owning the zone.
+            zone_tag (str): Unique identifier for the Cloudflare zone.
+            metric (str): Key of the metric (see utils_api.TIMESERIES_METRICS).
+            stat (dict): Stat dict with "content" as {"YYYY-MM-DD": value}.
+        Returns:
+            int: Number of days written.
+        """
+        rows = [
+            (client, zone_tag, metric, date, value or 0)
+            for date, value in stat["content"].items()
+        ]
+        with self._connect() as db:
+            db.executemany(
+                "INSERT INTO daily (client, zone_tag, metric, date, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (zone_tag, metric, date) DO UPDATE SET value = excluded.value "
+                "WHERE value != excluded.value",
+                rows,
+            )
+        return len(rows)
+
+    def daily_values(self, zone_tag: str, metric: str, geq_date: str, leq_date: str) -> dict:
+        """
+        Stored daily values of a zone metric between two dates (inclusive).
+        Returns:
+            dict: {"YYYY-MM-DD": value}, only the days stored.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT date, value FROM daily WHERE zone_tag = ? AND metric = ? "
+                "AND date BETWEEN ? AND ? ORDER BY date",
+                (zone_tag, metric, geq_date, leq_date),
+            ).fetchall()
+        return {row["date"]: row["value"] for row in rows}
+
+    def daily_rows(self, metrics: list, geq_date: str, leq_date: str = "9999-12-31") -> list:
+        """
+        Stored days of some metrics for every zone, oldest first.
+        Returns:
+            list: Rows with client, zone_tag, metric, date and value.
+        """
+        marks = ",".join("?" * len(metrics))
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT client, zone_tag, metric, date, value FROM daily "
+                f"WHERE metric IN ({marks}) AND date BETWEEN ? AND ? ORDER BY date",
+                (*metrics, geq_date, leq_date),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_daily(
+        self,
+        metrics: list,
+        geq_date: str,
+        leq_date: str,
+        zone_tags: Optional[list] = None,
+        size: int = 5000,
+    ) -> Iterator[dict]:
+        """
+        Streams the stored days of some metrics, size rows read at a time, in
+        primary key order (zone, metric, date) so SQLite does not sort.
+        Args:
+            metrics (list): Keys of the metrics (see utils_api.TIMESERIES_METRICS).
+            geq_date (str): Start date (inclusive) "YYYY-MM-DD".
+            leq_date (str): End date (inclusive) "YYYY-MM-DD".
+            zone_tags (list): Only these zones, defaults to all.
+            size (int): Rows fetched per read.
+        Returns:
+            Iterator[dict]: Rows with client, zone_tag, metric, date and value.
+        """
+        where = f"metric IN ({','.join('?' * len(metrics))}) AND date BETWEEN ? AND ?"
+        params = [*metrics, geq_date, leq_date]
+        if zone_tags is not None:
+            where += f" AND zone_tag IN ({','.join('?' * len(zone_tags))})"
+            params.extend(zone_tags)
+        db = self._connect()
+        try:
+            cursor = db.execute(
+                "SELECT client, zone_tag, metric, date, value FROM daily "
+                f"WHERE {where} ORDER BY zone_tag, metric, date",
+                params,
+            )
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            db.close()
+
+    def rebuild_rollups(self) -> int:
+        """
+        Recomputes the weekly and monthly rollups from the days stored, for
+        stores created before them. Pruned days are lost from the rollups.
+        Returns:
+            int: Number of rollup rows written.
+        """
+        buckets = {
+            "week": "date(date, '-6 days', 'weekday 1')",
+            "month": "date(date, 'start of month')",
+        }
+        written = 0
+        with self._connect() as db:
+            db.execute("DELETE FROM rollups")
+            for period, bucket in buckets.items():
+                written += db.execute(
+                    "INSERT INTO rollups (client, zone_tag, metric, period, bucket, total, peak, days) "
+                    f"SELECT MAX(client), zone_tag, metric, ?, {bucket}, SUM(value), MAX(value), COUNT(*) "
+                    f"FROM daily GROUP BY zone_tag, metric, {bucket}",
+                    (period,),
+                ).rowcount
+        return written
+
+    def window(
+        self,
+        metric: str,
+        geq_date: str,
+        leq_date: str,
+        client: Optional[str] = None,
+        zone_tags: Optional[list] = None,
+    ) -> dict:
+        """
+        Aggregates of a metric over a window per zone, read from the monthly
+        and weekly rollups it covers whole plus the daily rows on its edges
+        (see rollup_plan), so a year costs about 12 rows per zone.
+        Args:
+            metric (str): Key of the metric (see utils_api.TIMESERIES_METRICS).
+            geq_date (str): Start date of the window (inclusive) "YYYY-MM-DD".
+            leq_date (str): End date of the window (inclusive) "YYYY-MM-DD".
+            client (str): Only the zones of this client.
+            zone_tags (list): Only these zones.
+        Returns:
+            dict: By zone tag, "sum", "max" (busiest day) and "days" stored,
+            with "uniques_low" and "uniques_high" for UNIQUE_METRICS.
+        """
+        where, params = "", []
+        if client:
+            where += " AND client = ?"
+            params.append(client)
+        if zone_tags is not None:
+            where += f" AND zone_tag IN ({','.join('?' * len(zone_tags))})"
+            params.extend(zone_tags)
+        selects, args = [], []
+        for period, buckets in rollup_plan(geq_date, leq_date).items():
+            if not buckets:
+                continue
+            marks = ",".join("?" * len(buckets))
+            if period == "day":
+                selects.append(
+                    "SELECT zone_tag, value AS total, value AS peak, 1 AS days FROM daily "
+                    f"WHERE metric = ? AND date IN ({marks}){where}"
+                )
+                args.extend([metric, *buckets, *params])
+            else:
+                selects.append(
+                    "SELECT zone_tag, total, peak, days FROM rollups "
+                    f"WHERE metric = ? AND period = ? AND bucket IN ({marks}){where}"
+                )
+                args.extend([metric, period, *buckets, *params])
+        if not selects:
+            return {}
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT zone_tag, SUM(total) AS sum, MAX(peak) AS max, SUM(days) AS days "
+                f"FROM ({' UNION ALL '.join(selects)}) GROUP BY zone_tag",
+                args,
+            ).fetchall()
+        result = {}
+        for row in rows:
+            result[row["zone_tag"]] = {"sum": row["sum"], "max": row["max"], "days": row["days"]}
+            if metric in UNIQUE_METRICS:
+                result[row["zone_tag"]].update(uniques_low=row["max"], uniques_high=row["sum"])
+        return result
+
+    def prune(self, before_date: str) -> int:
+        """
+        Deletes the days older than before_date ("YYYY-MM-DD"), the totals are
+        updated accordingly and the rollups keep them.
+        Returns:
+            int: Number of rows deleted.
+        """
+        with self._connect() as db:
+            return db.execute("DELETE FROM daily WHERE date < ?", (before_date,)).rowcount
+
+    def record_report(self, client: str, leq_date: str, periods: int, mode: str = "manual") -> None:
+        """
+        Logs a generated report ("manual" or "auto").
+        """
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO reports (client, leq_date, periods, mode, created) VALUES (?, ?, ?, ?, ?)",
+                (client, leq_date, periods, mode, time.time()),
+            )
+
+    def totals(self, client: Optional[str] = None) -> dict:
+        """
+        Materialised totals of a client, or of every client when None.
+        Returns:
+            dict: Value by metric ("requests", "bandwidth", ..., "reports").
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT metric, value FROM totals WHERE client = ?",
+                (client or ALL_CLIENTS,),
+            ).fetchall()
+        return {row["metric"]: row["value"] for row in rows}
+
+    def recent_reports(self, client: Optional[str] = None, limit: int = 10) -> list:
+        """
+        Returns:
+            list: Latest reports (client, leq_date, periods, mode, created),
+            newest first.
+        """
+        query = "SELECT client, leq_date, periods, mode, created FROM reports"
+        params = ()
+        if client:
+            query += " WHERE client = ?"
+            params = (client,)
+        with self._connect() as db:
+            rows = db.execute(f"{query} ORDER BY created DESC LIMIT ?", (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+
+def ingest_daily(
+    store: MetricStore,
+    client: dict,
+    leq_date: str,
+    periods: int = 1,
+    metrics: Optional[list] = None,
+    priority: str = BATCH,
+) -> int:
+    """
+    Fetches the daily values of a client and writes them to the store.
+    Args:
+        store (MetricStore): Destination store.
+        client (dict): Client with "name" and "zone_tag".
+        leq_date (str): Last day to ingest "YYYY-MM-DD".
+        periods (int): Number of days to ingest, more than 1 backfills.
+        metrics (list): Keys of TIMESERIES_METRICS, defaults to all.
+        priority (str): Priority of the fetches (see utils_fetcher).
+    Returns:
+        int: Number of days written.
+    """
+    stats = fetch_metrics(
+        list(metrics or TIMESERIES_METRICS),
+        client["zone_tag"],
+        leq_date,
+        periods,
+        client["name"],
+        priority,
+    )
+    written = 0
+    for metric, stat in stats.items():
+        written += store.upsert_daily(client["name"], client["zone_tag"], metric, stat)
+    return written
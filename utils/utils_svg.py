@@ -0,0 +1,219 @@
+"""
+V1 functions neccesary to draw simple dashboard panels as SVG without matplotlib
+"""
+
+__version__ = "1.0.0"
+
+import math
+from html import escape
+
+import numpy as np
+
+from .utils_downsample import downsample_indices
+from .utils_image import format_stat
+
+COLORS = ["#3CB5AE", "#A8DADC", "#5271FF", "#D9D9D9"]
+FONT = 'font-family="DejaVu Sans, Arial, sans-serif"'
+
+
+def _text(x: float, y: float, value: str, size: int = 12, **attrs) -> str:
+    extra = "".join(f' {key.replace("_", "-")}="{val}"' for key, val in attrs.items())
+    return (
+        f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}"{extra}>'
+        f"{escape(str(value))}</text>"
+    )
+
+
+def _svg(width: int, height: int, body: list) -> str:
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" {FONT}>'
+        f'<rect width="{width}" height="{height}" fill="white"/>'
+        + "".join(body)
+        + "</svg>"
+    )
+
+
+def nice_ticks(max_value: float, count: int = 5) -> np.ndarray:
+    """
+    Evenly spaced round tick values from 0 to at least max_value.
+    """
+    if max_value <= 0:
+        return np.array([0.0, 1.0])
+    raw_step = max_value / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+    return np.arange(0, max_value + step, step)
+
+
+def _tick_label(value: float, stat_type: str) -> str:
+    if stat_type == "byte":
+        return f"{int(value / 1_048_576)} MB"
+    return f"{int(value):,}"
+
+
+def svg_stat_graph(
+    first_stat: dict,
+    second_stat: dict,
+    third_stat_title: str,
+    y_label_info: str,
+    width: int = 1000,
+    height: int = 600,
+) -> str:
+    """
+    SVG version of dashboard_stat_graph: three stats on top and the two
+    timeseries as filled areas below.
+    Args:
+        first_stat (dict): Contains title, metric dictionary, and type for the first stat.
+        second_stat (dict): Contains title, metric dictionary, and type for the second stat.
+        third_stat_title (str): Title of the difference between both stats.
+        y_label_info (str): Label for the Y-axis of the line chart.
+        width (int): Width of the panel in pixels.
+        height (int): Height of the panel in pixels.
+    Returns:
+        str: The SVG document.
+    """
+    total_first = sum(first_stat["content"].values())
+    total_second = sum(second_stat["content"].values())
+    stats = [
+        (first_stat["title"], format_stat(total_first, first_stat["type"])),
+        (second_stat["title"], format_stat(total_second, second_stat["type"])),
+        (third_stat_title, format_stat(total_first - total_second, first_stat["type"])),
+    ]
+    body = []
+    header = height / 5
+    for idx, (title, value) in enumerate(stats):
+        x = width * (idx + 0.5) / 3
+        body.append(_text(x, header * 0.45, title, 14, text_anchor="middle"))
+        body.append(
+            _text(x, header * 0.8, value, 18, text_anchor="middle", font_weight="bold")
+        )
+
+    # Plot area
+    left, right, top, bottom = 90, width - 20, header + 20, height - 40
+    dates = np.array(sorted(first_stat["content"]))
+    values1 = np.array([first_stat["content"][d] for d in dates], dtype=float)
+    values2 = np.array([second_stat["content"].get(d, 0) for d in dates], dtype=float)
+    if not dates.size:
+        return _svg(width, height, body)
+    keep = downsample_indices([values1, values2], right - left)
+    dates, values1, values2 = dates[keep], values1[keep], values2[keep]
+    ticks = nice_ticks(max(values1.max(initial=0), values2.max(initial=0)))
+    y_max = ticks[-1]
+    n = max(dates.size - 1, 1)
+    xs = left + (right - left) * np.arange(dates.size) / n
+
+    def ys(values: np.ndarray) -> np.ndarray:
+        return bottom - (bottom - top) * values / y_max
+
+    for tick in ticks:
+        y = ys(np.array(tick))
+        body.append(
+            f'<line x1="{left}" y1="{y:.1f}" x2="{right}" y2="{y:.1f}" '
+            f'stroke="{COLORS[3]}" stroke-width="0.5"/>'
+        )
+        body.append(
+            _text(left - 8, y + 4, _tick_label(tick, first_stat["type"]), 11, text_anchor="end")
+        )
+    for values, color in ((values1, COLORS[0]), (values2, COLORS[1])):
+        points = " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(xs, ys(values)))
+        body.append(
+            f'<polygon points="{left:.1f},{bottom:.1f} {points} {xs[-1]:.1f},{bottom:.1f}" '
+            f'fill="{color}" stroke="{color}"/>'
+        )
+    label_every = max(1, math.ceil(dates.size / 8))
+    for idx in range(0, dates.size, label_every):
+        body.append(_text(xs[idx], bottom + 18, dates[idx], 11, text_anchor="middle"))
+    body.append(
+        f'<line x1="{left}" y1="{bottom}" x2="{right}" y2="{bottom}" stroke="{COLORS[3]}"/>'
+    )
+    body.append(
+        _text(
+            20, (top + bottom) / 2, y_label_info, 13, text_anchor="middle",
+            transform=f"rotate(-90 20 {(top + bottom) / 2:.1f})",
+        )
+    )
+    for idx, (stat, color) in enumerate(((first_stat, COLORS[0]), (second_stat, COLORS[1]))):
+        y = top + 10 + idx * 18
+        body.append(f'<rect x="{left + 10}" y="{y - 9}" width="18" height="3" fill="{color}"/>')
+        body.append(_text(left + 34, y - 3, stat["title"], 12))
+    return _svg(width, height, body)
+
+
+def _pie(cx: float, cy: float, radius: float, stat: dict) -> list:
+    top = sorted(stat["content"].items(), key=lambda x: x[1], reverse=True)[:3]
+    total = sum(value for _, value in top) or 1
+    body = [_text(cx, cy - radius - 20, stat["title"], 14, text_anchor="middle")]
+    angle = math.radians(140)
+    for idx, (label, value) in enumerate(top):
+        sweep = 2 * math.pi * value / total
+        end = angle + sweep
+        color = COLORS[idx % 3]
+        if sweep >= 2 * math.pi - 1e-9:
+            body.append(f'<circle cx="{cx}" cy="{cy}" r="{radius}" fill="{color}"/>')
+        else:
+            x1, y1 = cx + radius * math.cos(angle), cy - radius * math.sin(angle)
+            x2, y2 = cx + radius * math.cos(end), cy - radius * math.sin(end)
+            large = 1 if sweep > math.pi else 0
+            body.append(
+                f'<path d="M{cx:.1f},{cy:.1f} L{x1:.1f},{y1:.1f} '
+                f'A{radius},{radius} 0 {large} 0 {x2:.1f},{y2:.1f} Z" fill="{color}"/>'
+            )
+        middle = angle + sweep / 2
+        cos, sin = math.cos(middle), math.sin(middle)
+        body.append(
+            _text(cx + 0.6 * radius * cos, cy - 0.6 * radius * sin + 4,
+                  f"{int(100 * value / total)}%", 11, text_anchor="middle")
+        )
+        body.append(
+            _text(cx + 1.15 * radius * cos, cy - 1.15 * radius * sin + 4, label, 12,
+                  text_anchor="start" if cos >= 0 else "end")
+        )
+        angle = end
+    return body
+
+
+def svg_pie_bar(
+    http_versions: dict,
+    ssl_versions: dict,
+    content_types: dict,
+    width: int = 1200,
+    height: int = 350,
+) -> str:
+    """
+    SVG version of dashboard_pie_bar: two top-3 pie charts and a horizontal
+    bar chart of the content types.
+    Args:
+        http_versions (dict): Dictionary containing title, metric dictionary, and type.
+        ssl_versions (dict): Dictionary containing title, metric dictionary, and type.
+        content_types (dict): Dictionary containing title, metric dictionary, and type.
+        width (int): Width of the panel in pixels.
+        height (int): Height of the panel in pixels.
+    Returns:
+        str: The SVG document.
+    """
+    column = width / 2.7
+    radius = min(column, height) * 0.3
+    body = _pie(column * 0.5, height / 2 + 15, radius, http_versions)
+    body += _pie(column * 1.5, height / 2 + 15, radius, ssl_versions)
+
+    # Bar chart
+    left = column * 2
+    items = sorted(content_types["content"].items(), key=lambda x: x[1], reverse=True)
+    body.append(_text(left + column * 0.35, 25, content_types["title"], 14, text_anchor="middle"))
+    if items:
+        max_value = items[0][1] or 1
+        row = (height - 50) / len(items)
+        bar_width = column * 0.45
+        for idx, (label, value) in enumerate(items):
+            y = 40 + idx * row
+            length = bar_width * value / max_value
+            body.append(
+                f'<rect x="{left:.1f}" y="{y:.1f}" width="{length:.1f}" '
+                f'height="{row * 0.8:.1f}" fill="{COLORS[0]}"/>'
+            )
+            body.append(
+                _text(left + length + bar_width * 0.02, y + row * 0.4 + 4,
+                      f"{label}: {value:,}", 11)
+            )
+    return _svg(width, height, body)
@@ -0,0 +1,64 @@
+"""
+V1 functions neccesary to keep the top items of a stream in bounded memory
+"""
+
+__version__ = "1.0.0"
+
+import heapq
+from itertools import count as counter
+
+TOPK_FACTOR = 10  # items tracked per item reported
+
+
+class TopK:
+    """
+    Space-Saving counter: tracks at most `capacity` items, a new item
+    replaces the least counted one and inherits its count as error. Any item
+    with more than total / capacity occurrences is kept, and the counts of
+    the reported items are over by at most their error.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        self._heap = []  # (count, seq, key), stale entries skipped on eviction
+        # Breaks ties before the keys, which may not be comparable (None, str)
+        self._seq = counter()
+
+    def add(self, key, count: int = 1) -> None:
+        self.total += count
+        if key in self._counts:
+            self._counts[key] += count
+        elif len(self._counts) < self.capacity:
+            self._counts[key] = count
+            self._errors[key] = 0
+        else:
+            while True:
+                smallest, _, evicted = heapq.heappop(self._heap)
+                if self._counts.get(evicted) == smallest:
+                    break
+            del self._counts[evicted], self._errors[evicted]
+            self._counts[key] = smallest + count
+            self._errors[key] = smallest
+        heapq.heappush(self._heap, (self._counts[key], next(self._seq), key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(value, next(self._seq), item) for item, value in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def most_common(self, n: int) -> list:
+        """
+        Returns:
+            list: (item, count) of the n most counted items, most counted first.
+        """
+        return heapq.nlargest(n, self._counts.items(), key=lambda item: item[1])
+
+    def error(self, key) -> int:
+        """
+        Maximum overcount of a tracked item.
+        """
+        return self._errors.get(key, 0)
+
+    def __len__(self) -> int:
+        return len(self._counts)